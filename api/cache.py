@@ -0,0 +1,233 @@
+# api/cache.py
+import os
+import json
+import time
+import pickle
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# Cache settings, overridable through environment variables like the database settings
+CACHE_MAXSIZE = int(os.getenv("API_CACHE_MAXSIZE", "256")) # Max entries kept per process (and in the shared store)
+CACHE_VERSION_CHECK_SECONDS = float(os.getenv("API_CACHE_VERSION_CHECK_SECONDS", "5")) # How often to re-read the data version
+CACHE_SHARED_PATH = os.getenv("API_CACHE_SHARED_PATH") # Optional SQLite file shared by all uvicorn workers
+
+
+class LRUCache:
+    """Thread-safe, size-bounded mapping that evicts the least recently used entry first."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        with self._lock:
+            if key not in self._entries:
+                return False, None
+            self._entries.move_to_end(key)
+            return True, self._entries[key]
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCacheStore:
+    """
+    Local stand-in for a shared cache server (e.g. Redis): a SQLite file that every
+    uvicorn worker on the host reads and writes, so a result computed by one worker
+    is served from cache by the others. Entries are tagged with the data version they
+    were computed for and evicted least-recently-used beyond maxsize.
+    """
+
+    def __init__(self, path: str, maxsize: int):
+        self.path = path
+        self.maxsize = maxsize
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    key TEXT PRIMARY KEY,
+                    data_version TEXT,
+                    value BLOB NOT NULL,
+                    last_access REAL NOT NULL
+                );
+            """)
+
+    def _connect(self):
+        # A short-lived connection per operation keeps this safe to use from FastAPI's threadpool
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key: str, data_version: Optional[str]) -> Tuple[bool, Any]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value FROM response_cache WHERE key = ? AND data_version IS ?;",
+                (key, data_version)
+            ).fetchone()
+            if row is None:
+                return False, None
+            conn.execute("UPDATE response_cache SET last_access = ? WHERE key = ?;", (time.time(), key))
+        return True, pickle.loads(row[0])
+
+    def set(self, key: str, data_version: Optional[str], value: Any):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, data_version, value, last_access) VALUES (?, ?, ?, ?);",
+                (key, data_version, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), time.time())
+            )
+            # Drop results from older pipeline runs, then trim to the size bound
+            conn.execute("DELETE FROM response_cache WHERE data_version IS NOT ?;", (data_version,))
+            conn.execute(
+                """
+                DELETE FROM response_cache WHERE key NOT IN (
+                    SELECT key FROM response_cache ORDER BY last_access DESC LIMIT ?
+                );
+                """,
+                (self.maxsize,)
+            )
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM response_cache;")
+
+
+class ResponseCache:
+    """
+    Result cache for the analytical endpoints.
+    Entries are keyed by endpoint name and parameters and are only valid for the data
+    version that was current when they were computed. The data version is the marker
+    written by orchestration/scripts/run_dbt_transformations.py at the end of every dbt
+    run, so a rebuild of the marts invalidates everything cached before it.
+    """
+
+    def __init__(self, maxsize: int = CACHE_MAXSIZE,
+                 version_check_seconds: float = CACHE_VERSION_CHECK_SECONDS,
+                 shared_store: Optional[SQLiteCacheStore] = None):
+        self.local = LRUCache(maxsize)
+        self.shared_store = shared_store
+        self.version_check_seconds = version_check_seconds
+        self.data_version = None
+        self._last_version_check = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(endpoint: str, params: Dict[str, Any]) -> str:
+        return f"{endpoint}:{json.dumps(params, sort_keys=True, default=str)}"
+
+    def version_check_due(self) -> bool:
+        return (self._last_version_check is None
+                or time.monotonic() - self._last_version_check >= self.version_check_seconds)
+
+    def set_data_version(self, data_version: Optional[str]):
+        """Records the current data version, dropping every local entry if it changed."""
+        with self._lock:
+            self._last_version_check = time.monotonic()
+            if data_version != self.data_version:
+                self.data_version = data_version
+                self.local.clear()
+
+    def sync_version(self, fetch_version: Callable[[], Optional[str]]):
+        """Re-reads the data version through fetch_version, at most once per version_check_seconds."""
+        if self.version_check_due():
+            self.set_data_version(fetch_version())
+
+    def _record(self, found: bool, shared: bool = False):
+        with self._lock:
+            if found:
+                self.hits += 1
+                self.shared_hits += int(shared)
+            else:
+                self.misses += 1
+
+    def get(self, endpoint: str, params: Dict[str, Any]) -> Tuple[bool, Any]:
+        key = self.make_key(endpoint, params)
+        found, value = self.local.get(key)
+        if found:
+            self._record(True)
+            return True, value
+
+        if self.shared_store is not None:
+            found, value = self.shared_store.get(key, self.data_version)
+            if found:
+                self.local.set(key, value)
+                self._record(True, shared=True)
+                return True, value
+
+        self._record(False)
+        return False, None
+
+    def set(self, endpoint: str, params: Dict[str, Any], value: Any):
+        key = self.make_key(endpoint, params)
+        self.local.set(key, value)
+        if self.shared_store is not None:
+            self.shared_store.set(key, self.data_version, value)
+
+    def get_or_set(self, endpoint: str, params: Dict[str, Any], compute: Callable[[], Any]) -> Any:
+        found, value = self.get(endpoint, params)
+        if not found:
+            value = compute()
+            self.set(endpoint, params, value)
+        return value
+
+    async def get_or_set_async(self, endpoint: str, params: Dict[str, Any],
+                               compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Async counterpart of get_or_set; shared store I/O runs off the event loop."""
+        key = self.make_key(endpoint, params)
+        found, value = self.local.get(key)
+        if found:
+            self._record(True)
+            return value
+
+        if self.shared_store is not None:
+            found, value = await asyncio.to_thread(self.shared_store.get, key, self.data_version)
+            if found:
+                self.local.set(key, value)
+                self._record(True, shared=True)
+                return value
+
+        self._record(False)
+        value = await compute()
+        self.local.set(key, value)
+        if self.shared_store is not None:
+            await asyncio.to_thread(self.shared_store.set, key, self.data_version, value)
+        return value
+
+    def clear(self):
+        self.local.clear()
+        if self.shared_store is not None:
+            self.shared_store.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "size": len(self.local),
+            "maxsize": self.local.maxsize,
+            "shared": self.shared_store is not None,
+            "data_version": self.data_version,
+        }
+
+
+# Process-wide cache used by api/main.py
+response_cache = ResponseCache(
+    shared_store=SQLiteCacheStore(CACHE_SHARED_PATH, CACHE_MAXSIZE) if CACHE_SHARED_PATH else None
+)
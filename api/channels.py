@@ -0,0 +1,38 @@
+# api/channels.py
+import asyncio
+from typing import Dict, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import crud
+
+
+class ChannelDirectory:
+    """
+    Process-local channel_name -> channel_sk map.
+    dim_channels only changes when dbt runs, so the map is loaded once and reloaded
+    only when the pipeline data version changes, instead of querying dim_channels
+    on every request that filters by channel.
+    """
+
+    def __init__(self):
+        self._channels: Dict[str, str] = {}
+        self._data_version = None
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    async def resolve_async(self, db: AsyncSession, channel_name: str, data_version: Optional[str]) -> Optional[str]:
+        """Returns the channel_sk for channel_name, or None if the channel doesn't exist."""
+        if not self._loaded or data_version != self._data_version:
+            async with self._lock:
+                if not self._loaded or data_version != self._data_version:
+                    self._channels = await crud.get_channel_map_async(db)
+                    self._data_version = data_version
+                    self._loaded = True
+        return self._channels.get(channel_name)
+
+    def __len__(self):
+        return len(self._channels)
+
+
+channel_directory = ChannelDirectory()
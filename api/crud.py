@@ -1,85 +1,420 @@
 # api/crud.py
-from sqlalchemy.orm import Session
-from sqlalchemy import func, cast, String, Date as SqlDate, or_, desc
+import json
+import base64
+from decimal import Decimal
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy import select, text, func, cast, String, Numeric, Date as SqlDate, or_, desc, tuple_, null
 from . import models, schemas
-from datetime import date, datetime
-from typing import List, Optional
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+# Text search configuration used for message_tsv in fct_messages.
+# 'simple' (no stemming) because messages mix English and Amharic.
+TEXT_SEARCH_CONFIG = "simple"
+SEARCH_MODES = ("fulltext", "substring")
+
+# Columns returned for messages and detections. Selecting these explicitly (rather than whole
+# entities) lets the same statements feed JSON, columnar (Arrow/Parquet) and export responses,
+# and keeps read-only queries out of the ORM: rows come back as plain tuples, with no entity
+# hydration or identity map bookkeeping. message_tsv is left out: it's an index helper, not data.
+MESSAGE_COLUMNS = [
+    models.FctMessage.message_id,
+    models.FctMessage.channel_fk,
+    models.FctMessage.raw_id,
+    models.FctMessage.message_date_fk,
+    models.FctMessage.message_scraped_date_fk,
+    models.FctMessage.message_timestamp,
+    models.FctMessage.message_length,
+    models.FctMessage.has_image,
+    models.FctMessage.views_count,
+    models.FctMessage.message_text,
+]
+
+DETECTION_COLUMNS = [
+    models.FctImageDetection.detection_id,
+    models.FctImageDetection.message_id,
+    models.FctImageDetection.channel_fk,
+    models.FctImageDetection.detected_object_class,
+    models.FctImageDetection.confidence_score,
+    models.FctImageDetection.detection_timestamp,
+]
+
+# Every query is built once as a SELECT statement below (*_stmt) and executed through an
+# AsyncSession (get_*_async); the benchmarks plan the same statements.
+
+def _row_dicts(rows) -> List[dict]:
+    """Plain {column: value} dicts for result rows, ready for api.formats.json_response."""
+    return [dict(row._mapping) for row in rows]
 
 # --- Helper to get channel_sk from channel_name ---
-def get_channel_sk_by_name(db: Session, channel_name: str) -> Optional[str]:
-    channel = db.query(models.DimChannel).filter(models.DimChannel.channel_name == channel_name).first()
-    return channel.channel_sk if channel else None
+def _channel_sk_stmt(channel_name: str):
+    return select(models.DimChannel.channel_sk).where(models.DimChannel.channel_name == channel_name).limit(1)
+
+async def get_channel_sk_by_name_async(db: AsyncSession, channel_name: str) -> Optional[str]:
+    return (await db.execute(_channel_sk_stmt(channel_name))).scalar()
+
+async def get_channel_map_async(db: AsyncSession) -> Dict[str, str]:
+    """Returns {channel_name: channel_sk} for every channel (dim_channels is small)."""
+    rows = await db.execute(select(models.DimChannel.channel_name, models.DimChannel.channel_sk))
+    return {row.channel_name: row.channel_sk for row in rows}
+
+# --- Data version marker written at the end of every dbt run (see run_dbt_transformations.py) ---
+_DATA_VERSION_SQL = text("SELECT data_version FROM public.pipeline_data_version WHERE id = 1")
+
+async def get_data_version_async(db: AsyncSession) -> Optional[str]:
+    """Returns the current pipeline data version, or None if no dbt run has recorded one yet."""
+    try:
+        return (await db.execute(_DATA_VERSION_SQL)).scalar()
+    except ProgrammingError:
+        await db.rollback() # Marker table doesn't exist yet
+        return None
+
+def _date_range_filters(column, start_date: Optional[date], end_date: Optional[date]) -> list:
+    """Inclusive [start_date, end_date] filter on a timestamp column."""
+    filters = []
+    if start_date:
+        filters.append(column >= start_date)
+    if end_date:
+        filters.append(column < end_date + timedelta(days=1))
+    return filters
 
 # --- Analytical Endpoints Query Functions ---
 
-def get_top_products(db: Session, limit: int = 10) -> List[schemas.TopProduct]:
+def top_products_stmt(limit: int):
+    occurrence_count = func.count(models.FctProductMention.message_id).label("occurrence_count")
+    return select(
+        models.FctProductMention.product_keyword,
+        occurrence_count
+    ).group_by(
+        models.FctProductMention.product_keyword
+    ).order_by(
+        desc(occurrence_count),
+        models.FctProductMention.product_keyword
+    ).limit(limit)
+
+def _to_top_products(rows) -> List[schemas.TopProduct]:
+    return [schemas.TopProduct(product_keyword=row.product_keyword,
+                               occurrence_count=row.occurrence_count) for row in rows]
+
+async def get_top_products_async(db: AsyncSession, limit: int = 10) -> List[schemas.TopProduct]:
     """
     Returns the most frequently mentioned product keywords.
-    NOTE: This requires defining what constitutes a 'product' keyword.
-    For simplicity, we'll search for a predefined list of common medical terms/products.
-    In a real scenario, this might involve more sophisticated text analysis or a dedicated
-    product dimension table populated by dbt.
-    """
-    # Define a list of common product/medical keywords you want to track
-    # You would typically get this from a configuration or a separate source
-    product_keywords = [
-        "paracetamol", "amoxicillin", "ibuprofen", "antibiotics", "malaria",
-        "fever", "cough", "cold", "pain", "vaccine", "covid", "cholera",
-        "diabetes", "hypertension", "hiv", "tuberculosis", "mask", "sanitizer"
-    ]
-
-    # Use a subquery or CTE to count occurrences of each keyword
-    # This is a simplified approach; full-text search would be more robust for large scale
-    results = []
-    for keyword in product_keywords:
-        count = db.query(models.FctMessage) \
-            .filter(models.FctMessage.message_text.ilike(f"%{keyword}%")) \
-            .count()
-        if count > 0:
-            results.append({"product_keyword": keyword, "occurrence_count": count})
-
-    # Sort by count and take the top N
-    sorted_results = sorted(results, key=lambda x: x["occurrence_count"], reverse=True)
-    return [schemas.TopProduct(**item) for item in sorted_results[:limit]]
-
-
-def get_channel_activity(db: Session, channel_name: str) -> List[schemas.ChannelActivity]:
-    """
-    Returns the posting activity for a specific channel by date.
-    """
-    channel_sk = get_channel_sk_by_name(db, channel_name)
-    if not channel_sk:
-        return [] # Channel not found
-
-    activity = db.query(
-        models.DimDate.full_date.label("activity_date"),
-        func.count(models.FctMessage.message_id).label("message_count"),
-        func.sum(models.FctMessage.views_count).label("total_views")
-    ).join(
-        models.FctMessage,
-        models.DimDate.date_key == models.FctMessage.message_date_fk
-    ).filter(
-        models.FctMessage.channel_fk == channel_sk
-    ).group_by(
-        models.DimDate.full_date
+    Mentions are matched against the product dictionary (utils/product_dictionary.json) once per
+    message by src/extract_product_mentions.py and materialized by dbt into fct_product_mentions,
+    so this is a GROUP BY over the mention table instead of one text scan per keyword.
+    """
+    return _to_top_products((await db.execute(top_products_stmt(limit))).all())
+
+
+def channel_activity_stmt(channel_sk: str):
+    # Pre-aggregated per channel and day by the agg_channel_daily dbt model,
+    # so this is a range read on its (channel_fk, activity_date) index
+    daily = models.AggChannelDaily
+    return select(
+        daily.activity_date,
+        daily.message_count,
+        daily.total_views,
+        daily.image_post_count,
+        daily.detection_count,
+    ).where(
+        daily.channel_fk == channel_sk
     ).order_by(
-        models.DimDate.full_date
-    ).all()
+        daily.activity_date
+    )
 
+def _to_channel_activity(rows) -> List[schemas.ChannelActivity]:
     return [schemas.ChannelActivity(activity_date=row.activity_date,
                                     message_count=row.message_count,
-                                    total_views=row.total_views) for row in activity]
+                                    total_views=row.total_views,
+                                    image_post_count=row.image_post_count,
+                                    detection_count=row.detection_count) for row in rows]
+
+async def get_channel_activity_async(db: AsyncSession, channel_sk: str) -> List[schemas.ChannelActivity]:
+    """
+    Returns the posting activity of a channel by date; takes the already resolved channel_sk
+    (see api/channels.py).
+    """
+    return _to_channel_activity((await db.execute(channel_activity_stmt(channel_sk))).all())
+
+
+def detections_stmt(channel_sk: str, message_id: str):
+    # Telegram message ids are only unique within a channel
+    detection = models.FctImageDetection
+    return select(*DETECTION_COLUMNS).where(
+        detection.channel_fk == channel_sk,
+        detection.message_id == message_id
+    ).order_by(detection.detection_timestamp, detection.box_index)
+
+async def get_detections_for_message_async(db: AsyncSession, channel_sk: str, message_id: str) -> List[dict]:
+    """
+    Returns the YOLO detections recorded for a channel's message, as plain dicts
+    shaped like schemas.ImageDetection.
+    """
+    return _row_dicts((await db.execute(detections_stmt(channel_sk, message_id))).all())
+
+
+def detections_batch_stmt(channel_sk: str,
+                          message_ids: Optional[List[str]] = None,
+                          start_date: Optional[date] = None,
+                          end_date: Optional[date] = None,
+                          limit: Optional[int] = None):
+    """
+    A channel's detections, selected by message_ids and/or detection date range, ordered by message.
+    The channel is required because Telegram message ids are only unique within a channel.
+    limit caps the number of messages, not detections, so a message's detections are never cut off.
+    """
+    detection = models.FctImageDetection
+    message_key = (detection.channel_fk, detection.message_id)
+    filters = _date_range_filters(detection.detection_timestamp, start_date, end_date)
+    filters.append(detection.channel_fk == channel_sk)
+    if message_ids is not None:
+        # One indexed lookup for all IDs (Postgres plans the IN list as message_id = ANY(...))
+        filters.append(detection.message_id.in_(message_ids))
+    if limit:
+        first_messages = select(*message_key).where(*filters).group_by(
+            *message_key
+        ).order_by(*message_key).limit(limit)
+        filters.append(tuple_(*message_key).in_(first_messages))
+    return select(*DETECTION_COLUMNS).where(*filters).order_by(
+        *message_key, detection.detection_timestamp, detection.box_index
+    )
+
+def _group_detections(rows) -> Dict[str, List[dict]]:
+    # Rows come from a single channel (see detections_batch_stmt), so message_id is a unique key
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row.message_id, []).append(dict(row._mapping))
+    return grouped
 
+async def get_detections_batch_async(db: AsyncSession, channel_sk: str, **filters) -> Dict[str, List[dict]]:
+    """
+    Returns detections for many of a channel's messages at once, grouped by message_id,
+    as plain dicts shaped like schemas.ImageDetection.
+    Select them by message_ids and/or a detection date range.
+    """
+    return _group_detections((await db.execute(detections_batch_stmt(channel_sk, **filters))).all())
+
+
+def _detection_summaries_stmt(message_keys: List[Tuple[str, str]]):
+    """Per-class detection counts for (channel_fk, message_id) pairs (Telegram message ids are per channel)."""
+    detection = models.FctImageDetection
+    return select(
+        detection.channel_fk,
+        detection.message_id,
+        detection.detected_object_class,
+        func.count().label("detection_count"),
+        func.max(detection.confidence_score).label("max_confidence"),
+    ).where(
+        tuple_(detection.channel_fk, detection.message_id).in_(message_keys)
+    ).group_by(
+        detection.channel_fk,
+        detection.message_id,
+        detection.detected_object_class
+    ).order_by(
+        detection.channel_fk,
+        detection.message_id,
+        desc("detection_count")
+    )
+
+def _attach_detection_summaries(messages: List[dict], rows) -> List[dict]:
+    summaries = {}
+    for row in rows:
+        summaries.setdefault((row.channel_fk, row.message_id), []).append({
+            "detected_object_class": row.detected_object_class,
+            "detection_count": row.detection_count,
+            "max_confidence": row.max_confidence,
+        })
+    for message in messages:
+        message["detections"] = summaries.get((message["channel_fk"], message["message_id"]), [])
+    return messages
+
+async def attach_detection_summaries_async(db: AsyncSession, messages: List[dict]) -> List[dict]:
+    """
+    Fills in the 'detections' of a page of search results with one grouped query
+    (instead of one detections lookup per message).
+    """
+    if not messages:
+        return messages
+    stmt = _detection_summaries_stmt([(m["channel_fk"], m["message_id"]) for m in messages])
+    return _attach_detection_summaries(messages, (await db.execute(stmt)).all())
+
+
+# --- Search cursor helpers (opaque keyset pagination tokens) ---
+def _encode_cursor(mode: str, values: dict) -> str:
+    payload = json.dumps({"m": mode, **values}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
 
-def search_messages(db: Session, query: str, limit: int = 100) -> List[schemas.Message]:
+def _decode_cursor(cursor: str, mode: str) -> dict:
+    """Decodes a cursor from _next_search_cursor; raises ValueError (a 400) for anything else."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(values, dict):
+            raise ValueError("expected a JSON object")
+        if values.get("m") != mode:
+            raise ValueError("cursor belongs to a different search mode")
+        required = {"t", "c", "id", "k", "r"} if mode == "fulltext" else {"t", "c", "id", "k"}
+        missing = required - set(values)
+        if missing:
+            raise ValueError(f"missing {', '.join(sorted(missing))}")
+        if not isinstance(values["c"], str) or not isinstance(values["id"], str):
+            raise ValueError("c and id must be strings")
+        if not isinstance(values["k"], int) or isinstance(values["k"], bool):
+            raise ValueError("k must be an integer")
+        position = {"t": datetime.fromisoformat(values["t"]), "c": values["c"],
+                    "id": values["id"], "k": values["k"]}
+        if mode == "fulltext":
+            position["r"] = Decimal(values["r"])
+            if not position["r"].is_finite():
+                raise ValueError("rank must be a finite number")
+        return position
+    except (KeyError, TypeError, ValueError, ArithmeticError) as e:
+        raise ValueError(f"Invalid search cursor: {e}")
+
+
+def search_messages_stmt(
+        query: str,
+        limit: int,
+        mode: str,
+        channel_sk: Optional[str],
+        start_date: Optional[date],
+        end_date: Optional[date],
+        cursor: Optional[str],
+        columns: Optional[list] = None,
+):
     """
-    Searches for messages containing a specific keyword.
+    Builds one page of a message search (plus one look-ahead row).
+    Selects MESSAGE_COLUMNS (or the given columns/entities, which must include the sort key
+    columns the next page's cursor is built from) followed by a 'rank' column.
     """
-    # Using ILIKE for case-insensitive substring search
-    messages = db.query(models.FctMessage).filter(
-        models.FctMessage.message_text.ilike(f"%{query}%")
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode '{mode}'. Expected one of {SEARCH_MODES}.")
+
+    message = models.FctMessage
+    filters = _date_range_filters(message.message_timestamp, start_date, end_date)
+    # The keyset order (and the cursor) needs a timestamp; messages without one aren't searchable
+    filters.append(message.message_timestamp.isnot(None))
+    if channel_sk:
+        filters.append(message.channel_fk == channel_sk)
+
+    if mode == "fulltext":
+        ts_query = func.websearch_to_tsquery(TEXT_SEARCH_CONFIG, query)
+        # Rounded to NUMERIC so the rank in the cursor compares exactly on the next page
+        rank = func.round(cast(func.ts_rank_cd(message.message_tsv, ts_query), Numeric), 6)
+        filters.append(message.message_tsv.op("@@")(ts_query))
+        sort_key = (rank, message.message_timestamp, message.channel_fk, message.message_id, message.raw_id)
+    else:
+        escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        rank = null()
+        filters.append(message.message_text.ilike(f"%{escaped}%", escape="\\"))
+        sort_key = (message.message_timestamp, message.channel_fk, message.message_id, message.raw_id)
+
+    if cursor:
+        position = _decode_cursor(cursor, mode)
+        after = (position["t"], position["c"], position["id"], position["k"])
+        if mode == "fulltext":
+            after = (position["r"],) + after
+        filters.append(tuple_(*sort_key) < tuple_(*after))
+
+    # Fetch one extra row to find out whether another page exists
+    selected = columns if columns is not None else MESSAGE_COLUMNS
+    return select(*selected, rank.label("rank")).where(
+        *filters
     ).order_by(
-        models.FctMessage.message_timestamp.desc()
-    ).limit(limit).all()
+        *[desc(column) for column in sort_key]
+    ).limit(limit + 1)
+
+def _next_search_cursor(mode: str, row) -> str:
+    # The whole sort key: raw_id makes it unique, so rows tied on the rest aren't skipped
+    values = {"t": row.message_timestamp.isoformat(), "c": row.channel_fk, "id": row.message_id, "k": row.raw_id}
+    if mode == "fulltext":
+        values["r"] = str(row.rank)
+    return _encode_cursor(mode, values)
+
+def _split_search_page(rows, limit: int, mode: str) -> Tuple[list, Optional[str]]:
+    """Drops the look-ahead row, returning (page rows, cursor for the next page or None)."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, _next_search_cursor(mode, rows[-1])
+
+def _to_search_page(rows, limit: int, mode: str) -> Tuple[List[dict], Optional[str]]:
+    rows, next_cursor = _split_search_page(rows, limit, mode)
+    results = _row_dicts(rows)
+    for item in results:
+        if item["rank"] is not None:
+            item["rank"] = float(item["rank"])
+        item["detections"] = None
+    return results, next_cursor
+
+async def search_messages_async(
+        db: AsyncSession,
+        query: str,
+        limit: int = 100,
+        mode: str = "fulltext",
+        channel_sk: Optional[str] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        cursor: Optional[str] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Searches for messages matching a query and returns one page of results (plain dicts
+    shaped like schemas.Message) plus the cursor for the next page (None on the last page).
+    - 'fulltext' matches words against the GIN-indexed message_tsv column and orders by relevance.
+    - 'substring' does a case-insensitive partial-word match served by the trigram index,
+      newest messages first.
+    channel_sk is the already resolved channel (see api/channels.py).
+    Pagination is keyset based, so deep pages cost the same as the first one.
+    Raises ValueError for an unknown mode or a malformed cursor.
+    """
+    stmt = search_messages_stmt(query, limit, mode, channel_sk, start_date, end_date, cursor)
+    return _to_search_page((await db.execute(stmt)).all(), limit, mode)
+
+
+# --- Columnar results (Arrow/Parquet responses built straight from result columns, see api/formats.py) ---
+
+async def fetch_columns_async(db: AsyncSession, stmt) -> Tuple[List[str], list]:
+    """Executes stmt and returns (column names, row tuples) without building any models."""
+    result = await db.execute(stmt)
+    return list(result.keys()), result.all()
+
+async def search_messages_columns_async(
+        db: AsyncSession,
+        query: str,
+        limit: int = 100,
+        mode: str = "fulltext",
+        channel_sk: Optional[str] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        cursor: Optional[str] = None,
+) -> Tuple[List[str], list, Optional[str]]:
+    """Columnar variant of search_messages_async: returns (column names, rows, next cursor)."""
+    stmt = search_messages_stmt(query, limit, mode, channel_sk, start_date, end_date, cursor)
+    columns, rows = await fetch_columns_async(db, stmt)
+    rows, next_cursor = _split_search_page(rows, limit, mode)
+    return columns, rows, next_cursor
+
+
+# --- Bulk export statements (streamed from a server-side cursor by api/export.py) ---
+
+def export_messages_stmt(channel_sk: Optional[str] = None,
+                         start_date: Optional[date] = None,
+                         end_date: Optional[date] = None):
+    """fct_messages rows for a channel and/or date range, oldest first."""
+    filters = _date_range_filters(models.FctMessage.message_timestamp, start_date, end_date)
+    if channel_sk:
+        filters.append(models.FctMessage.channel_fk == channel_sk)
+    return select(*MESSAGE_COLUMNS).where(*filters).order_by(
+        models.FctMessage.message_timestamp, models.FctMessage.message_id
+    )
 
-    return [schemas.Message.from_orm(msg) for msg in messages]
\ No newline at end of file
+def export_detections_stmt(channel_sk: Optional[str] = None,
+                           start_date: Optional[date] = None,
+                           end_date: Optional[date] = None):
+    """fct_image_detections rows for a channel and/or detection date range."""
+    detection = models.FctImageDetection
+    filters = _date_range_filters(detection.detection_timestamp, start_date, end_date)
+    if channel_sk:
+        filters.append(detection.channel_fk == channel_sk)
+    return select(*DETECTION_COLUMNS).where(*filters).order_by(detection.detection_timestamp, detection.detection_id)
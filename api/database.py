@@ -1,9 +1,12 @@
 # api/database.py
 import os
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+from .metrics import TimedQueuePool, TimedAsyncAdaptedQueuePool, instrument_engine
+
 # Load database connection details from environment variables
 # These should match what you use for dbt's profiles.yml or the current Python env
 POSTGRES_HOST = os.getenv("POSTGRES_HOST")
@@ -12,16 +15,57 @@ POSTGRES_USER = os.getenv("POSTGRES_USER")
 POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")
 POSTGRES_PORT = os.getenv("POSTGRES_PORT", "5432") # Default to 5432 if not set
 
+# Connection pool settings (per worker process)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10")) # Connections kept open
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20")) # Extra connections allowed under burst load
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "10")) # Seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800")) # Reconnect after this many seconds
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000")) # Server-side cap per statement
+# asyncpg prepared statement cache; set to 0 behind a transaction-mode pooler (e.g. pgbouncer)
+DB_PREPARED_STATEMENT_CACHE_SIZE = int(os.getenv("DB_PREPARED_STATEMENT_CACHE_SIZE", "500"))
+
 # Construct the database URL
 # Assuming 'public' is your schema where dbt built models
 DATABASE_URL = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
 
-# Create the SQLAlchemy engine
+_POOL_OPTIONS = dict(
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=True, # Transparently replace connections dropped by the server
+)
+
+# Create the SQLAlchemy engine (sync path, used by scripts and the sync crud functions)
 # echo=True will log all SQL statements, useful for debugging
-engine = create_engine(DATABASE_URL, echo=False)
+engine = create_engine(
+    DATABASE_URL,
+    echo=False,
+    connect_args={"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"},
+    poolclass=TimedQueuePool,
+    **_POOL_OPTIONS
+)
+
+# Async engine over asyncpg, used by the API endpoints so waiting on Postgres doesn't hold a thread
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    echo=False,
+    connect_args={
+        "server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)},
+        "prepared_statement_cache_size": DB_PREPARED_STATEMENT_CACHE_SIZE,
+    },
+    poolclass=TimedAsyncAdaptedQueuePool,
+    **_POOL_OPTIONS
+)
+
+# Per-request query count, SQL time, rows and pool wait (see api/metrics.py)
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
 
 # Create a SessionLocal class to get database sessions
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = sessionmaker(bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 # Base class for our SQLAlchemy models
 Base = declarative_base()
@@ -34,4 +78,9 @@ def get_db():
     finally:
         db.close()
 
+# Dependency to get an async database session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
 print(f"Database connection setup for: {POSTGRES_USER}@{POSTGRES_HOST}/{POSTGRES_DB}")
\ No newline at end of file
@@ -0,0 +1,70 @@
+# api/export.py
+import os
+import io
+import csv
+import json
+import zlib
+from typing import AsyncIterator
+
+from .database import AsyncSessionLocal
+
+# Rows fetched per round trip from the server-side cursor; memory use is bounded by this, not by the export size
+EXPORT_BATCH_SIZE = int(os.getenv("API_EXPORT_BATCH_SIZE", "5000"))
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _encode_ndjson(columns, rows, include_header: bool) -> str:
+    return "".join(
+        json.dumps(dict(zip(columns, row)), default=str, ensure_ascii=False) + "\n" for row in rows
+    )
+
+
+def _encode_csv(columns, rows, include_header: bool) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if include_header:
+        writer.writerow(columns)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+_ENCODERS = {
+    "ndjson": _encode_ndjson,
+    "csv": _encode_csv,
+}
+
+
+async def stream_export(stmt, fmt: str, compress: bool = False) -> AsyncIterator[bytes]:
+    """
+    Streams the result of stmt as NDJSON or CSV chunks.
+    Rows come from a server-side cursor in batches of EXPORT_BATCH_SIZE and each batch is
+    encoded (and gzip-compressed on the fly when asked) before the next one is fetched,
+    so an export of any size never has to fit in the API process.
+    The generator opens its own session because it keeps running after the endpoint returns.
+    """
+    encode = _ENCODERS[fmt]
+    # wbits=16+MAX_WBITS writes a gzip container instead of a raw zlib stream
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        columns = list(result.keys())
+        include_header = True
+        async for rows in result.partitions(EXPORT_BATCH_SIZE):
+            chunk = encode(columns, rows, include_header).encode("utf-8")
+            include_header = False
+            if compressor:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+
+        if include_header and fmt == "csv":
+            # Empty export: still emit the header row
+            chunk = encode(columns, [], True).encode("utf-8")
+            yield compressor.compress(chunk) if compressor else chunk
+        if compressor:
+            yield compressor.flush()
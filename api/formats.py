@@ -0,0 +1,92 @@
+# api/formats.py
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, List, Optional, Sequence
+
+from fastapi import Header, HTTPException, Query
+from fastapi.responses import Response
+
+# pyarrow is optional: without it the API only serves JSON
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+
+COLUMNAR_MEDIA_TYPES = {
+    "arrow": ARROW_STREAM_MEDIA_TYPE,
+    "parquet": PARQUET_MEDIA_TYPE,
+}
+
+
+def response_format(
+        format: Optional[str] = Query(None, regex="^(json|arrow|parquet)$",
+                                      description="Response format; overrides the Accept header."),
+        accept: Optional[str] = Header(None),
+) -> str:
+    """
+    Dependency that negotiates the response format of an analytical endpoint.
+    Returns 'json' (default), 'arrow' (Arrow IPC stream) or 'parquet', from the
+    ?format= parameter or else the Accept header.
+    """
+    if format:
+        fmt = format
+    elif accept and ARROW_STREAM_MEDIA_TYPE in accept:
+        fmt = "arrow"
+    elif accept and PARQUET_MEDIA_TYPE in accept:
+        fmt = "parquet"
+    else:
+        fmt = "json"
+
+    if fmt != "json" and pa is None:
+        raise HTTPException(status_code=406, detail="Arrow/Parquet responses need pyarrow installed on the server.")
+    return fmt
+
+
+def encode_columnar(columns: List[str], rows: Sequence[tuple], fmt: str) -> bytes:
+    """
+    Encodes query result rows as an Arrow IPC stream or a Parquet file.
+    Rows are transposed into one list per column and handed to Arrow as whole
+    columns, so no per-row objects are created on the way.
+    """
+    if rows:
+        table = pa.table({name: list(values) for name, values in zip(columns, zip(*rows))})
+    else:
+        table = pa.table({name: pa.array([]) for name in columns})
+
+    sink = io.BytesIO()
+    if fmt == "parquet":
+        pq.write_table(table, sink)
+    else:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    return sink.getvalue()
+
+
+def columnar_response(payload: bytes, fmt: str, headers: Optional[dict] = None) -> Response:
+    return Response(content=payload, media_type=COLUMNAR_MEDIA_TYPES[fmt], headers=headers)
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def json_response(content: Any) -> Response:
+    """
+    JSON response for the plain dicts and lists returned by the lean crud helpers.
+    Returning a Response lets FastAPI skip validating the payload against the endpoint's
+    response_model, which would otherwise rebuild every row as a Pydantic object;
+    the response_model still documents the shape.
+    """
+    body = json.dumps(content, default=_json_default, ensure_ascii=False, separators=(",", ":"))
+    return Response(content=body.encode("utf-8"), media_type="application/json")
@@ -1,11 +1,19 @@
 # api/main.py
+from datetime import date
+import time
 from typing import List, Optional
-from fastapi import FastAPI, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 import uvicorn
 
 from . import models, schemas, crud
-from .database import engine, Base, get_db
+from .cache import response_cache
+from .channels import channel_directory
+from .export import EXPORT_FORMATS, stream_export
+from .formats import response_format, encode_columnar, columnar_response, json_response
+from .metrics import metrics_registry, start_request, server_timing_header, SERVER_TIMING_ENABLED
+from .database import engine, Base, get_async_db
 
 # Create all tables (if they don't exist yet, based on SQLAlchemy models)
 # This is useful for initial setup, but in production, dbt handles table creation.
@@ -17,67 +25,286 @@ app = FastAPI(
     version="1.0.0",
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """
+    Times every request and attributes its database work to the matched route template.
+    Streamed bodies (exports) are produced after this returns, so they count up to the first byte.
+    """
+    stats = start_request()
+    started = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - started
+
+    route = request.scope.get("route")
+    # Unmatched paths share one label so random URLs can't blow up the number of series
+    route_path = route.path if route is not None else "unmatched"
+    metrics_registry.observe(request.method, route_path, response.status_code, elapsed, stats)
+    if SERVER_TIMING_ENABLED:
+        response.headers["Server-Timing"] = server_timing_header(stats, elapsed)
+    return response
+
 @app.get("/", tags=["Root"])
 async def read_root():
     return {"message": "Welcome to the Ethiopian Medical Insights API! Access docs at /docs"}
 
+@app.get(
+    "/metrics",
+    response_class=PlainTextResponse,
+    summary="Prometheus metrics",
+    description="Request latency histograms and per-route SQL statement counts, SQL time, rows and "
+                "connection pool wait, in the Prometheus text format."
+)
+async def get_metrics():
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+async def _sync_data_version(db: AsyncSession):
+    """Re-reads the pipeline data version (throttled) so cached results and channels follow dbt runs."""
+    if response_cache.version_check_due():
+        response_cache.set_data_version(await crud.get_data_version_async(db))
+
+async def _cached(db: AsyncSession, endpoint: str, params: dict, compute):
+    """Serves an analytical result from the response cache, recomputing it only after a new dbt run."""
+    await _sync_data_version(db)
+    return await response_cache.get_or_set_async(endpoint, params, compute)
+
+async def _columnar(db: AsyncSession, endpoint: Optional[str], params: dict, stmt, fmt: str):
+    """
+    Arrow/Parquet response built straight from the result columns of stmt.
+    Cached like the JSON results when an endpoint name is given.
+    """
+    async def compute():
+        columns, rows = await crud.fetch_columns_async(db, stmt)
+        return encode_columnar(columns, rows, fmt)
+
+    if endpoint is None:
+        return columnar_response(await compute(), fmt)
+    return columnar_response(await _cached(db, endpoint, {**params, "format": fmt}, compute), fmt)
+
+async def _lookup_channel_sk(db: AsyncSession, channel_name: str) -> Optional[str]:
+    """Resolves a channel name through the in-memory channel directory."""
+    await _sync_data_version(db)
+    return await channel_directory.resolve_async(db, channel_name, response_cache.data_version)
+
+async def _require_channel_sk(db: AsyncSession, channel_name: str) -> str:
+    channel_sk = await _lookup_channel_sk(db, channel_name)
+    if not channel_sk:
+        raise HTTPException(status_code=404, detail=f"Channel '{channel_name}' not found.")
+    return channel_sk
+
+@app.get(
+    "/api/cache/stats",
+    response_model=schemas.CacheStats,
+    summary="Get response cache statistics",
+    description="Returns hit/miss counts and the data version the cached results belong to."
+)
+async def get_cache_stats():
+    return response_cache.stats()
+
 @app.get(
     "/api/reports/top-products",
     response_model=List[schemas.TopProduct],
     summary="Get the most frequently mentioned products/keywords",
-    description="Returns a list of top medical products or keywords based on message content."
+    description="Returns a list of top medical products or keywords based on message content. "
+                "Also available as Arrow or Parquet (?format= or Accept header)."
 )
-def get_top_products_endpoint(
+async def get_top_products_endpoint(
         limit: int = Query(10, ge=1, le=100),
-        db: Session = Depends(get_db)
+        fmt: str = Depends(response_format),
+        db: AsyncSession = Depends(get_async_db)
 ):
-    return crud.get_top_products(db, limit=limit)
+    if fmt != "json":
+        return await _columnar(db, "top_products", {"limit": limit}, crud.top_products_stmt(limit), fmt)
+    return await _cached(db, "top_products", {"limit": limit},
+                         lambda: crud.get_top_products_async(db, limit=limit))
 
 @app.get(
     "/api/channels/{channel_name}/activity",
     response_model=List[schemas.ChannelActivity],
     summary="Get posting activity for a specific channel",
-    description="Returns daily message counts and total views for a given Telegram channel."
+    description="Returns daily message counts, total views, image posts and detections for a given Telegram channel. "
+                "Also available as Arrow or Parquet (?format= or Accept header)."
 )
-def get_channel_activity_endpoint(
+async def get_channel_activity_endpoint(
         channel_name: str,
-        db: Session = Depends(get_db)
+        fmt: str = Depends(response_format),
+        db: AsyncSession = Depends(get_async_db)
 ):
-    # Check if channel exists (optional, but good practice)
-    channel = db.query(models.DimChannel).filter(models.DimChannel.channel_name == channel_name).first()
-    if not channel:
-        raise HTTPException(status_code=404, detail=f"Channel '{channel_name}' not found.")
-    return crud.get_channel_activity(db, channel_name=channel_name)
+    channel_sk = await _require_channel_sk(db, channel_name)
+    if fmt != "json":
+        return await _columnar(db, "channel_activity", {"channel_sk": channel_sk},
+                               crud.channel_activity_stmt(channel_sk), fmt)
+    return await _cached(db, "channel_activity", {"channel_sk": channel_sk},
+                         lambda: crud.get_channel_activity_async(db, channel_sk))
 
 @app.get(
     "/api/search/messages",
     response_model=schemas.MessageSearchResults, # Use the wrapper schema for search results
     summary="Search for messages by keyword",
-    description="Searches for messages containing a specified keyword and returns a list of matching messages."
+    description="Searches message content, either by full-text relevance or by partial-word match, "
+                "and returns one page of results with a cursor for the next page. "
+                "Arrow/Parquet responses return the cursor in the X-Next-Cursor header."
 )
-def search_messages_endpoint(
-        query: str = Query(..., min_length=2, description="Keyword to search in message content."),
-        limit: int = Query(100, ge=1, le=500, description="Maximum number of messages to return."),
-        db: Session = Depends(get_db)
+async def search_messages_endpoint(
+        query: str = Query(..., min_length=2, description="Keyword(s) to search in message content."),
+        mode: str = Query("fulltext", regex="^(fulltext|substring)$",
+                          description="'fulltext' ranks whole-word matches by relevance; "
+                                      "'substring' matches partial words, newest first."),
+        channel_name: Optional[str] = Query(None, description="Only return messages from this channel."),
+        start_date: Optional[date] = Query(None, description="Only return messages sent on or after this date."),
+        end_date: Optional[date] = Query(None, description="Only return messages sent on or before this date."),
+        cursor: Optional[str] = Query(None, description="next_cursor from the previous page."),
+        limit: int = Query(100, ge=1, le=500, description="Maximum number of messages to return per page."),
+        include_detections: bool = Query(False, description="Embed per-class YOLO detection summaries in each message (JSON only)."),
+        fmt: str = Depends(response_format),
+        db: AsyncSession = Depends(get_async_db)
 ):
-    messages = crud.search_messages(db, query=query, limit=limit)
-    return schemas.MessageSearchResults(query=query, count=len(messages), results=messages)
+    channel_sk = None
+    if channel_name:
+        channel_sk = await _lookup_channel_sk(db, channel_name)
+        if not channel_sk:
+            # Unknown channel: nothing can match
+            if fmt != "json":
+                columns = [column.key for column in crud.MESSAGE_COLUMNS] + ["rank"]
+                return columnar_response(encode_columnar(columns, [], fmt), fmt)
+            return json_response({"query": query, "mode": mode, "count": 0, "results": [], "next_cursor": None})
+    if fmt != "json":
+        try:
+            columns, rows, next_cursor = await crud.search_messages_columns_async(
+                db, query=query, limit=limit, mode=mode, channel_sk=channel_sk,
+                start_date=start_date, end_date=end_date, cursor=cursor
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+        return columnar_response(encode_columnar(columns, rows, fmt), fmt, headers=headers)
+    try:
+        messages, next_cursor = await crud.search_messages_async(
+            db, query=query, limit=limit, mode=mode, channel_sk=channel_sk,
+            start_date=start_date, end_date=end_date, cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if include_detections:
+        messages = await crud.attach_detection_summaries_async(db, messages)
+    return json_response({"query": query, "mode": mode, "count": len(messages),
+                          "results": messages, "next_cursor": next_cursor})
 
 # You can add more endpoints here, e.g., for fct_image_detections
+@app.post(
+    "/api/detections/batch",
+    response_model=schemas.DetectionBatchResults,
+    summary="Get YOLO detections for many of a channel's messages",
+    description="Returns detections for up to 1000 message IDs of one channel in one query, grouped by message_id. "
+                "Messages without detections are left out."
+)
+async def get_detections_batch_endpoint(
+        request: schemas.DetectionBatchRequest,
+        fmt: str = Depends(response_format),
+        db: AsyncSession = Depends(get_async_db)
+):
+    channel_sk = await _require_channel_sk(db, request.channel_name)
+    message_ids = list(dict.fromkeys(request.message_ids))
+    if fmt != "json":
+        # Columnar responses are flat: one row per detection
+        return await _columnar(db, None, {}, crud.detections_batch_stmt(channel_sk, message_ids=message_ids), fmt)
+    detections = await crud.get_detections_batch_async(db, channel_sk, message_ids=message_ids)
+    return json_response({"count": len(detections), "detections": detections})
+
+@app.get(
+    "/api/detections",
+    response_model=schemas.DetectionBatchResults,
+    summary="Get YOLO detections for a channel",
+    description="Returns detections for a channel's messages, optionally within a detection date range, "
+                "grouped by message_id. Use /api/export/detections for detections across channels."
+)
+async def get_detections_by_range_endpoint(
+        channel_name: str = Query(..., description="Channel whose messages' detections to return."),
+        start_date: Optional[date] = Query(None, description="Only return detections made on or after this date."),
+        end_date: Optional[date] = Query(None, description="Only return detections made on or before this date."),
+        limit: int = Query(5000, ge=1, le=50000,
+                           description="Maximum number of messages to return detections for (all of each message's detections are returned)."),
+        fmt: str = Depends(response_format),
+        db: AsyncSession = Depends(get_async_db)
+):
+    channel_sk = await _require_channel_sk(db, channel_name)
+    if fmt != "json":
+        stmt = crud.detections_batch_stmt(channel_sk, start_date=start_date, end_date=end_date, limit=limit)
+        return await _columnar(db, None, {}, stmt, fmt)
+    detections = await crud.get_detections_batch_async(
+        db, channel_sk, start_date=start_date, end_date=end_date, limit=limit
+    )
+    return json_response({"count": len(detections), "detections": detections})
+
 @app.get(
     "/api/detections/{message_id}",
     response_model=List[schemas.ImageDetection],
     summary="Get YOLO detections for a specific message",
-    description="Returns object detections made by YOLO for a given message_id."
+    description="Returns object detections made by YOLO for a channel's message. "
+                "Telegram message IDs are only unique within a channel, so the channel is required."
 )
-def get_detections_for_message(
+async def get_detections_for_message(
         message_id: str,
-        db: Session = Depends(get_db)
+        channel_name: str = Query(..., description="Channel the message was posted in."),
+        fmt: str = Depends(response_format),
+        db: AsyncSession = Depends(get_async_db)
 ):
-    detections = db.query(models.FctImageDetection).filter(models.FctImageDetection.message_id == message_id).all()
+    channel_sk = await _require_channel_sk(db, channel_name)
+    params = {"channel_sk": channel_sk, "message_id": message_id}
+    if fmt != "json":
+        return await _columnar(db, "detections", params, crud.detections_stmt(channel_sk, message_id), fmt)
+    detections = await _cached(db, "detections", params,
+                               lambda: crud.get_detections_for_message_async(db, channel_sk, message_id))
     if not detections:
-        raise HTTPException(status_code=404, detail=f"No image detections found for message ID '{message_id}'.")
-    return detections
+        raise HTTPException(status_code=404,
+                            detail=f"No image detections found for message ID '{message_id}' in channel '{channel_name}'.")
+    return json_response(detections)
+
+
+# --- Bulk exports ---
+
+async def _export_response(db: AsyncSession, name: str, build_stmt, fmt: str, gzip: bool,
+                           channel_name: Optional[str], start_date: Optional[date], end_date: Optional[date]):
+    channel_sk = await _require_channel_sk(db, channel_name) if channel_name else None
+    stmt = build_stmt(channel_sk=channel_sk, start_date=start_date, end_date=end_date)
+    filename = f"{name}.{fmt}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        stream_export(stmt, fmt, compress=gzip),
+        media_type="application/gzip" if gzip else EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@app.get(
+    "/api/export/messages",
+    summary="Export messages",
+    description="Streams every fct_messages row matching the filters as NDJSON or CSV, optionally gzip-compressed."
+)
+async def export_messages_endpoint(
+        format: str = Query("ndjson", regex="^(ndjson|csv)$", description="Output format."),
+        gzip: bool = Query(False, description="Compress the export with gzip."),
+        channel_name: Optional[str] = Query(None, description="Only export messages from this channel."),
+        start_date: Optional[date] = Query(None, description="Only export messages sent on or after this date."),
+        end_date: Optional[date] = Query(None, description="Only export messages sent on or before this date."),
+        db: AsyncSession = Depends(get_async_db)
+):
+    return await _export_response(db, "messages", crud.export_messages_stmt, format, gzip,
+                                  channel_name, start_date, end_date)
+
+@app.get(
+    "/api/export/detections",
+    summary="Export image detections",
+    description="Streams every fct_image_detections row matching the filters as NDJSON or CSV, optionally gzip-compressed."
+)
+async def export_detections_endpoint(
+        format: str = Query("ndjson", regex="^(ndjson|csv)$", description="Output format."),
+        gzip: bool = Query(False, description="Compress the export with gzip."),
+        channel_name: Optional[str] = Query(None, description="Only export detections for this channel's messages."),
+        start_date: Optional[date] = Query(None, description="Only export detections made on or after this date."),
+        end_date: Optional[date] = Query(None, description="Only export detections made on or before this date."),
+        db: AsyncSession = Depends(get_async_db)
+):
+    return await _export_response(db, "detections", crud.export_detections_stmt, format, gzip,
+                                  channel_name, start_date, end_date)
 
 
 # Main block to run the FastAPI app with Uvicorn
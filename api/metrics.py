@@ -0,0 +1,197 @@
+# api/metrics.py
+import os
+import time
+import threading
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+# Adds a Server-Timing header (db, pool and total time) to every response when enabled
+SERVER_TIMING_ENABLED = os.getenv("API_SERVER_TIMING", "false").lower() in ("1", "true", "yes")
+
+# Histogram buckets: request latency in seconds, and SQL statements per request (to spot N+1 patterns)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class RequestStats:
+    """Database work done while serving one request, filled in by the engine and pool hooks below."""
+
+    __slots__ = ("query_count", "sql_seconds", "rows", "pool_wait_seconds")
+
+    def __init__(self):
+        self.query_count = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+        self.pool_wait_seconds = 0.0
+
+
+# Stats of the request being served in the current task (None outside a request, e.g. at startup).
+# SQLAlchemy's asyncio layer runs the sync engine code in greenlets that share the task's context,
+# so the hooks see the same value for the async engine.
+_current_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def start_request() -> RequestStats:
+    stats = RequestStats()
+    _current_stats.set(stats)
+    return stats
+
+
+# --- SQLAlchemy hooks ---
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started_at"].pop()
+    stats = _current_stats.get()
+    if stats is None:
+        return
+    stats.query_count += 1
+    stats.sql_seconds += elapsed
+    # psycopg2 reports the row count of a SELECT; the asyncpg adapter reports -1 and holds the
+    # fetched rows in a buffer instead. Server-side (streamed) results count as 0 here.
+    if cursor.rowcount >= 0:
+        stats.rows += cursor.rowcount
+    else:
+        stats.rows += len(getattr(cursor, "_rows", ()))
+
+
+def instrument_engine(engine):
+    """Records query count, SQL time and rows of every statement on engine (use .sync_engine for async engines)."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class _TimedPoolMixin:
+    """Times how long checking out a connection takes: waiting for a free one, or opening a new one."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            stats = _current_stats.get()
+            if stats is not None:
+                stats.pool_wait_seconds += time.perf_counter() - started
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+# --- Per-route aggregates, rendered in the Prometheus text format ---
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries_per_request = Histogram(QUERY_COUNT_BUCKETS)
+        self.responses: Dict[str, int] = {}
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+        self.pool_wait_seconds = 0.0
+
+
+def _labels(**labels) -> str:
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _format_bound(bound: float) -> str:
+    return str(int(bound)) if float(bound).is_integer() else str(bound)
+
+
+class MetricsRegistry:
+    """
+    Request and database metrics per (method, route template), kept in process memory.
+    Like the response cache, every uvicorn worker has its own registry; scrape each worker
+    or aggregate on the Prometheus side.
+    """
+
+    def __init__(self):
+        self._routes: Dict[Tuple[str, str], RouteMetrics] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, method: str, route: str, status: int, seconds: float, stats: RequestStats):
+        with self._lock:
+            metrics = self._routes.setdefault((method, route), RouteMetrics())
+            metrics.latency.observe(seconds)
+            metrics.queries_per_request.observe(stats.query_count)
+            metrics.responses[str(status)] = metrics.responses.get(str(status), 0) + 1
+            metrics.queries += stats.query_count
+            metrics.sql_seconds += stats.sql_seconds
+            metrics.rows += stats.rows
+            metrics.pool_wait_seconds += stats.pool_wait_seconds
+
+    def render(self) -> str:
+        """Returns all metrics in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines = []
+
+            def histogram(name, help_text, attr):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for (method, route), metrics in routes:
+                    hist = getattr(metrics, attr)
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        labels = _labels(method=method, route=route, le=_format_bound(bound))
+                        lines.append(f"{name}_bucket{labels} {count}")
+                    lines.append(f"{name}_bucket{_labels(method=method, route=route, le='+Inf')} {hist.count}")
+                    lines.append(f"{name}_sum{_labels(method=method, route=route)} {hist.sum}")
+                    lines.append(f"{name}_count{_labels(method=method, route=route)} {hist.count}")
+
+            def counter(name, help_text, attr):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} counter")
+                for (method, route), metrics in routes:
+                    lines.append(f"{name}{_labels(method=method, route=route)} {getattr(metrics, attr)}")
+
+            histogram("api_request_duration_seconds", "Request latency by route.", "latency")
+            lines.append("# HELP api_requests_total Requests by route and status code.")
+            lines.append("# TYPE api_requests_total counter")
+            for (method, route), metrics in routes:
+                for status, count in sorted(metrics.responses.items()):
+                    lines.append(f"api_requests_total{_labels(method=method, route=route, status=status)} {count}")
+            histogram("api_db_queries_per_request", "SQL statements executed per request.", "queries_per_request")
+            counter("api_db_queries_total", "SQL statements executed by route.", "queries")
+            counter("api_db_query_seconds_total", "Time spent executing SQL by route.", "sql_seconds")
+            counter("api_db_rows_total", "Rows returned by SQL statements by route.", "rows")
+            counter("api_db_pool_wait_seconds_total", "Time spent checking out pooled connections by route.",
+                    "pool_wait_seconds")
+        return "\n".join(lines) + "\n"
+
+
+def server_timing_header(stats: RequestStats, total_seconds: float) -> str:
+    return (f'db;dur={stats.sql_seconds * 1000:.1f};desc="{stats.query_count} queries", '
+            f'pool;dur={stats.pool_wait_seconds * 1000:.1f}, '
+            f'total;dur={total_seconds * 1000:.1f}')
+
+
+# Process-wide registry used by api/main.py
+metrics_registry = MetricsRegistry()
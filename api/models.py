@@ -1,10 +1,14 @@
 # api/models.py
 from sqlalchemy import Column, Integer, BigInteger, String, Text, Boolean, DateTime, Numeric, Date
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred
 from .database import Base
 
 # Convention: dbt models are often in the 'public' schema by default
 # Adjust schema name if your dbt project creates models in a different schema
 DBT_SCHEMA = "public"
+# The tables and their indexes are built by dbt (meta.physical_design in each model);
+# check them against the queries in crud.py with benchmarks/check_index_usage.py.
 
 class DimChannel(Base):
     __tablename__ = "dim_channels"
@@ -35,6 +39,7 @@ class FctMessage(Base):
     __table_args__ = {"schema": DBT_SCHEMA}
 
     message_id = Column(String, primary_key=True, index=True) # Assuming message_id is unique enough as a PK
+    raw_id = Column(BigInteger) # raw_telegram_messages.id; unlike message_id, unique per row
     channel_fk = Column(String) # Foreign key to dim_channels.channel_sk
     message_date_fk = Column(Integer) # Foreign key to dim_dates.date_key
     message_length = Column(Integer)
@@ -43,17 +48,45 @@ class FctMessage(Base):
     message_scraped_date_fk = Column(Integer) # Foreign key to dim_dates.date_key
     message_timestamp = Column(DateTime(timezone=True)) # Use DateTime(timezone=True) for TIMESTAMP WITH TIME ZONE
     message_text = Column(Text)
+    # to_tsvector('simple', message_text), GIN indexed; deferred so it's never loaded into responses
+    message_tsv = deferred(Column(TSVECTOR))
 
 class FctImageDetection(Base):
     __tablename__ = "fct_image_detections"
     __table_args__ = {"schema": DBT_SCHEMA}
 
-    # For fact tables without a natural single-column PK, consider a composite PK
-    # or a synthetic one if not already created in dbt.
-    # Assuming message_id + detected_object_class + detection_timestamp is unique for simplicity
-    # If your dbt model has a primary key defined, use that.
-    detection_id = Column(String, primary_key=True, index=True) # Assuming dbt generated a unique ID
-    message_id = Column(String) # Foreign key to fct_messages.message_id
+    # Surrogate key generated by dbt from channel_name + message_id + box_index
+    detection_id = Column("image_detection_pk", String, primary_key=True, index=True)
+    message_id = Column(String) # Telegram message id; with channel_fk, a foreign key to fct_messages
+    channel_fk = Column(String) # Foreign key to dim_channels.channel_sk
     detected_object_class = Column(String)
     confidence_score = Column(Numeric)
-    detection_timestamp = Column(DateTime(timezone=True)) # Assuming this from dbt model
\ No newline at end of file
+    detection_timestamp = Column(DateTime(timezone=True)) # Assuming this from dbt model
+    box_index = Column(Integer) # Position of the box among its image's detections
+
+class FctProductMention(Base):
+    __tablename__ = "fct_product_mentions"
+    __table_args__ = {"schema": DBT_SCHEMA}
+
+    # One row per message and mentioned product (see src/extract_product_mentions.py)
+    message_id = Column(String, primary_key=True)
+    channel_fk = Column(String, primary_key=True) # Foreign key to dim_channels.channel_sk
+    product_keyword = Column(String, primary_key=True, index=True)
+    message_date_fk = Column(Integer) # Foreign key to dim_dates.date_key
+    mention_count = Column(Integer)
+
+class AggChannelDaily(Base):
+    __tablename__ = "agg_channel_daily"
+    __table_args__ = {"schema": DBT_SCHEMA}
+
+    # Incremental dbt rollup of fct_messages/fct_image_detections, one row per channel per day
+    channel_fk = Column(String, primary_key=True) # Foreign key to dim_channels.channel_sk
+    date_key = Column(Integer, primary_key=True) # Foreign key to dim_dates.date_key
+    activity_date = Column(Date)
+    message_count = Column(Integer)
+    total_views = Column(BigInteger)
+    image_post_count = Column(Integer)
+    detection_count = Column(Integer)
+    last_scraped_date_fk = Column(Integer)
+    last_detection_at = Column(DateTime)
+    last_detection_loaded_at = Column(DateTime(timezone=True))
@@ -1,6 +1,6 @@
 # api/schemas.py
 from datetime import date, datetime
-from typing import Optional, List
+from typing import Dict, Optional, List
 from pydantic import BaseModel, Field
 
 # --- Base Schemas (for shared attributes) ---
@@ -30,6 +30,7 @@ class MessageBase(BaseModel):
 
 class ImageDetectionBase(BaseModel):
     message_id: str
+    channel_fk: Optional[str] = None # Telegram message ids are per channel
     detected_object_class: str
     confidence_score: float # Pydantic will convert Numeric to float
     detection_timestamp: datetime
@@ -45,10 +46,18 @@ class Date(DateBase):
     class Config:
         orm_mode = True
 
+class DetectionSummary(BaseModel):
+    detected_object_class: str
+    detection_count: int
+    max_confidence: float
+
 class Message(MessageBase):
     channel_fk: Optional[str] = None
+    raw_id: Optional[int] = None # Unique per row (message_id is only unique within a channel)
     message_date_fk: Optional[int] = None
     message_scraped_date_fk: Optional[int] = None
+    rank: Optional[float] = None # Relevance score, only set by full-text search
+    detections: Optional[List[DetectionSummary]] = None # Only set when search is asked to include detections
     # You can embed related models if desired, but for simplicity, we'll keep FKs
     class Config:
         orm_mode = True
@@ -70,11 +79,36 @@ class ChannelActivity(BaseModel):
     activity_date: date
     message_count: int
     total_views: Optional[int] = None
+    image_post_count: Optional[int] = None
+    detection_count: Optional[int] = None
 
 # GET /api/search/messages?query=paracetamol
 # The Message schema can be directly used here for individual messages.
 # For a list of messages:
 class MessageSearchResults(BaseModel):
     query: str
+    mode: str = "fulltext"
     count: int
-    results: List[Message]
\ No newline at end of file
+    results: List[Message]
+    next_cursor: Optional[str] = None # Pass back as ?cursor= to fetch the next page
+
+# POST /api/detections/batch
+class DetectionBatchRequest(BaseModel):
+    channel_name: str # Telegram message ids are only unique within a channel
+    message_ids: List[str] = Field(..., min_items=1, max_items=1000)
+
+# POST /api/detections/batch and GET /api/detections
+class DetectionBatchResults(BaseModel):
+    count: int # Number of messages with at least one detection
+    detections: Dict[str, List[ImageDetection]] # Keyed by message_id (all from one channel)
+
+# GET /api/cache/stats
+class CacheStats(BaseModel):
+    hits: int
+    shared_hits: int
+    misses: int
+    hit_ratio: float
+    size: int
+    maxsize: int
+    shared: bool
+    data_version: Optional[str] = None
\ No newline at end of file
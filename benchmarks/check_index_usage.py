@@ -0,0 +1,152 @@
+# benchmarks/check_index_usage.py
+"""
+Checks that the API's queries are served by the indexes the dbt models declare in
+meta.physical_design (see medical_insights_dwh/dbt_project/macros/physical_design.sql).
+
+Every statement is built by api/crud.py exactly as the endpoints build it, with sample values read
+from the marts (the busiest channel, a message that has detections, the most mentioned product),
+then run through EXPLAIN. A query fails when its plan reads one of the mart tables with a
+sequential scan, unless that table is smaller than --min-pages (where a sequential scan is the
+cheaper plan anyway). Exits with status 1 if any query fails, so it can run after `dbt run` in CI.
+
+On a small dev database the planner rightly prefers sequential scans; pass --disable-seqscan to
+check that a usable index exists at all.
+
+    python benchmarks/check_index_usage.py --disable-seqscan
+"""
+import os
+import sys
+import logging
+import argparse
+from datetime import timedelta
+from dotenv import load_dotenv
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Add project root to sys.path to allow importing api.*
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+load_dotenv(os.path.join(project_root, '.env'))
+
+from sqlalchemy import select, func, desc
+from api import crud, models
+from api.database import engine
+
+MART_TABLES = {model.__tablename__ for model in (
+    models.DimChannel, models.FctMessage, models.FctImageDetection,
+    models.FctProductMention, models.AggChannelDaily,
+)}
+INDEX_SCANS = ("Index Scan", "Index Only Scan", "Bitmap Index Scan")
+
+
+def sample_values(conn):
+    """Realistic parameters for the checked queries, or None when the marts are empty."""
+    message = models.FctMessage
+    busiest = conn.execute(
+        select(message.channel_fk, func.max(message.message_timestamp).label("latest"))
+        .group_by(message.channel_fk).order_by(desc(func.count())).limit(1)
+    ).first()
+    detected = conn.execute(
+        select(models.FctImageDetection.channel_fk, models.FctImageDetection.message_id).limit(1)
+    ).first()
+    keyword = conn.execute(crud.top_products_stmt(1)).scalar()
+    channel_name = conn.execute(
+        select(models.DimChannel.channel_name).where(models.DimChannel.channel_sk == busiest.channel_fk)
+    ).scalar() if busiest else None
+    if not busiest or not channel_name:
+        return None
+    latest_date = busiest.latest.date()
+    return {
+        "channel_sk": busiest.channel_fk,
+        "channel_name": channel_name,
+        "message_id": detected.message_id if detected else "0",
+        "detection_channel_sk": detected.channel_fk if detected else busiest.channel_fk,
+        "query": keyword or "paracetamol",
+        "start_date": latest_date - timedelta(days=1),
+        "end_date": latest_date,
+    }
+
+
+def checked_statements(values):
+    """(name, statement) for every index-backed query the API runs."""
+    channel_sk, day = values["channel_sk"], (values["start_date"], values["end_date"])
+    detection_channel_sk = values["detection_channel_sk"]
+    return [
+        ("channel lookup by name", crud._channel_sk_stmt(values["channel_name"])),
+        ("channel activity", crud.channel_activity_stmt(channel_sk)),
+        ("detections for a message", crud.detections_stmt(detection_channel_sk, values["message_id"])),
+        ("detection batch by ids", crud.detections_batch_stmt(detection_channel_sk, message_ids=[values["message_id"]])),
+        ("detection batch by date", crud.detections_batch_stmt(channel_sk, start_date=day[0], end_date=day[1], limit=1000)),
+        ("detection summaries", crud._detection_summaries_stmt([(detection_channel_sk, values["message_id"])])),
+        ("fulltext search", crud.search_messages_stmt(values["query"], 100, "fulltext", None, None, None, None)),
+        ("substring search", crud.search_messages_stmt(values["query"], 100, "substring", None, None, None, None)),
+        ("channel search", crud.search_messages_stmt(values["query"], 100, "fulltext", channel_sk, *day, None)),
+        ("message export by channel", crud.export_messages_stmt(channel_sk, *day)),
+        ("detection export by date", crud.export_detections_stmt(None, *day)),
+    ]
+
+
+def plan_scans(plan):
+    """Yields (node type, table, index) for every scan node in an EXPLAIN (FORMAT JSON) plan."""
+    if "Relation Name" in plan or "Index Name" in plan:
+        yield plan["Node Type"], plan.get("Relation Name"), plan.get("Index Name")
+    for child in plan.get("Plans", []):
+        yield from plan_scans(child)
+
+
+def table_pages(conn):
+    """{table: size in 8 kB pages, as of its last ANALYZE} for the mart tables."""
+    rows = conn.exec_driver_sql(
+        "SELECT relname, relpages FROM pg_class WHERE relnamespace = %(schema)s::regnamespace AND relkind = 'r'",
+        {"schema": models.DBT_SCHEMA},
+    )
+    return {name: pages for name, pages in rows if name in MART_TABLES}
+
+
+def explain(conn, stmt):
+    compiled = stmt.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})
+    return conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()[0]["Plan"]
+
+
+def check_queries(disable_seqscan, min_pages):
+    failures = 0
+    with engine.connect() as conn:
+        values = sample_values(conn)
+        if values is None:
+            logging.error("The marts are empty; run the pipeline (or dbt run) first.")
+            return False
+        small_tables = {table for table, pages in table_pages(conn).items() if pages < min_pages}
+        if disable_seqscan:
+            conn.exec_driver_sql("SET enable_seqscan = off")
+
+        print(f"{'query':<28} {'result':<6} scans")
+        for name, stmt in checked_statements(values):
+            scans = list(plan_scans(explain(conn, stmt)))
+            seq_scans = [table for node, table, _ in scans if node == "Seq Scan" and table in MART_TABLES]
+            failed = [table for table in seq_scans if table not in small_tables]
+            indexes = sorted({index for node, _, index in scans if node in INDEX_SCANS})
+            result = "FAIL" if failed else "ok"
+            detail = indexes + [f"seq scan on {table}" + ("" if table in failed else " (small table)")
+                                for table in seq_scans]
+            detail = ", ".join(detail) or "-"
+            print(f"{name:<28} {result:<6} {detail}")
+            failures += bool(failed)
+        conn.rollback()
+
+    if failures:
+        logging.error(f"{failures} queries read a mart table with a sequential scan.")
+    return not failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that the API's queries use index scans.")
+    parser.add_argument("--disable-seqscan", action="store_true",
+                        help="Plan with enable_seqscan off (for dev databases too small to favour indexes).")
+    parser.add_argument("--min-pages", type=int, default=10,
+                        help="Sequential scans on mart tables smaller than this many pages are accepted.")
+    args = parser.parse_args()
+
+    sys.exit(0 if check_queries(args.disable_seqscan, args.min_pages) else 1)
@@ -0,0 +1,143 @@
+# benchmarks/search_projection.py
+"""
+Micro-benchmark for the message search read path: whole FctMessage ORM entities copied through
+schemas.Message.from_orm (the old path) versus the column projection serialized straight
+to JSON (crud.search_messages_async + formats.json_response, the current path).
+
+Runs against a scratch schema (default 'bench') seeded with synthetic fct_messages rows, so the
+dbt-built tables are never touched. Reports rows/sec and tracemalloc peak memory per path.
+
+    python benchmarks/search_projection.py --rows 200000 --limit 5000 --repeat 5
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import tracemalloc
+from dotenv import load_dotenv
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Add project root to sys.path to allow importing api.*
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+load_dotenv(os.path.join(project_root, '.env'))
+
+from sqlalchemy import text
+from api import crud, models, schemas
+from api.database import engine, async_engine, AsyncSessionLocal
+from api.formats import json_response
+
+
+def seed_messages(schema, rows):
+    """(Re)creates <schema>.fct_messages with `rows` synthetic messages and the search indexes."""
+    seed_engine = engine.execution_options(schema_translate_map={models.DBT_SCHEMA: schema})
+    with seed_engine.begin() as conn:
+        conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{schema}"'))
+        models.FctMessage.__table__.drop(conn, checkfirst=True)
+        models.FctMessage.__table__.create(conn)
+        conn.execute(text(f"""
+            INSERT INTO "{schema}".fct_messages (
+                message_id, channel_fk, message_date_fk, message_length, has_image, views_count,
+                message_scraped_date_fk, message_timestamp, message_text, message_tsv
+            )
+            SELECT
+                g::TEXT,
+                MD5((g % 20)::TEXT),
+                TO_CHAR(ts, 'YYYYMMDD')::INTEGER,
+                LENGTH(body),
+                g % 3 = 0,
+                (g * 7919) % 5000,
+                TO_CHAR(ts, 'YYYYMMDD')::INTEGER,
+                ts,
+                body,
+                TO_TSVECTOR('simple', body)
+            FROM GENERATE_SERIES(1, :rows) AS g
+            CROSS JOIN LATERAL (SELECT TIMESTAMPTZ '2024-01-01' + g * INTERVAL '1 minute' AS ts) t
+            CROSS JOIN LATERAL (
+                SELECT (ARRAY['paracetamol', 'amoxicillin', 'vaccine', 'sanitizer'])[1 + g % 4]
+                       || ' syrup delivery available in Addis Ababa, call for price ' || g AS body
+            ) b;
+        """), {"rows": rows})
+        conn.execute(text(f'CREATE INDEX ON "{schema}".fct_messages USING GIN (message_tsv)'))
+        conn.execute(text(f'CREATE INDEX ON "{schema}".fct_messages (message_timestamp DESC, message_id DESC)'))
+        conn.execute(text(f'ANALYZE "{schema}".fct_messages'))
+    logging.info(f"Seeded {rows} messages into {schema}.fct_messages.")
+
+
+async def orm_path(db, query, mode, limit):
+    """The old read path: entities into the identity map, then one Pydantic model per row."""
+    stmt = crud.search_messages_stmt(query, limit, mode, None, None, None, None, columns=[models.FctMessage])
+    rows = (await db.execute(stmt)).all()
+    results = []
+    for msg, msg_rank in rows[:limit]:
+        item = schemas.Message.from_orm(msg)
+        item.rank = float(msg_rank) if msg_rank is not None else None
+        results.append(item)
+    body = schemas.MessageSearchResults(query=query, mode=mode, count=len(results), results=results).json()
+    return len(results), len(body)
+
+
+async def projection_path(db, query, mode, limit):
+    """The current read path: selected columns as plain dicts, serialized straight to JSON."""
+    messages, next_cursor = await crud.search_messages_async(db, query=query, limit=limit, mode=mode)
+    response = json_response({"query": query, "mode": mode, "count": len(messages),
+                              "results": messages, "next_cursor": next_cursor})
+    return len(messages), len(response.body)
+
+
+async def measure(path, session_factory, args):
+    # Warm up the connection pool and the prepared statement cache
+    async with session_factory() as db:
+        await path(db, args.query, args.mode, args.limit)
+
+    elapsed = 0.0
+    total_rows = 0
+    for _ in range(args.repeat):
+        async with session_factory() as db:
+            started = time.perf_counter()
+            row_count, _ = await path(db, args.query, args.mode, args.limit)
+            elapsed += time.perf_counter() - started
+            total_rows += row_count
+
+    # Peak memory is measured on a separate run: tracemalloc slows everything down
+    tracemalloc.start()
+    async with session_factory() as db:
+        await path(db, args.query, args.mode, args.limit)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return total_rows / elapsed if elapsed else 0.0, peak
+
+
+async def run_benchmark(args):
+    bench_engine = async_engine.execution_options(schema_translate_map={models.DBT_SCHEMA: args.schema})
+
+    def session_factory():
+        return AsyncSessionLocal(bind=bench_engine)
+
+    print(f"{'path':<12} {'rows/sec':>12} {'peak MiB':>10}")
+    for name, path in (("orm", orm_path), ("projection", projection_path)):
+        rows_per_sec, peak = await measure(path, session_factory, args)
+        print(f"{name:<12} {rows_per_sec:>12,.0f} {peak / 2 ** 20:>10.1f}")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the ORM and column projection search read paths.")
+    parser.add_argument("--schema", default="bench", help="Scratch schema holding the seeded fct_messages table.")
+    parser.add_argument("--rows", type=int, default=100000, help="Number of synthetic messages to seed.")
+    parser.add_argument("--skip-seed", action="store_true", help="Reuse the rows already in the scratch schema.")
+    parser.add_argument("--query", default="paracetamol", help="Search query.")
+    parser.add_argument("--mode", default="fulltext", choices=crud.SEARCH_MODES, help="Search mode.")
+    parser.add_argument("--limit", type=int, default=5000, help="Rows fetched per search.")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed searches per path.")
+    args = parser.parse_args()
+
+    if not args.skip_seed:
+        seed_messages(args.schema, args.rows)
+    asyncio.run(run_benchmark(args))
@@ -0,0 +1,41 @@
+-- macros/incremental.sql
+-- Helpers for the incremental models that follow raw_telegram_messages by ingestion time.
+
+{% macro relation_has_column(relation, column_name) %}
+    {%- set column_names = adapter.get_columns_in_relation(relation) | map(attribute='name') | list -%}
+    {{ return(column_name in column_names) }}
+{% endmacro %}
+
+
+{#
+    Lower bound for the ingestion timestamps an incremental run has to read: the latest one
+    already in {{ this }}, minus the ingestion_lookback var (a load's rows carry the time its
+    transaction started, so they can commit after a build that saw later rows; re-reading them
+    is harmless with a unique_key). '-infinity' while {{ this }} doesn't have the column yet,
+    e.g. on the first run after the model became incremental, so that run rebuilds everything.
+#}
+{% macro ingestion_watermark(column_name='ingestion_timestamp') %}
+    {%- if relation_has_column(this, column_name) -%}
+        ((SELECT COALESCE(MAX({{ column_name }}), '-infinity'::TIMESTAMP) FROM {{ this }})
+            - INTERVAL '{{ var("ingestion_lookback", "1 hour") }}')
+    {%- else -%}
+        '-infinity'::TIMESTAMP
+    {%- endif -%}
+{% endmacro %}
+
+
+{#
+    The scraped dates (lake partitions) an incremental run rebuilds: those with rows in
+    `relation` ingested after the watermark, new and late-arriving partitions alike, plus the
+    start_date..end_date range the pipeline passes when it (re)builds partitions
+    (orchestration/definitions.py), so a re-run of one day refreshes that day only.
+#}
+{% macro changed_scraped_dates(relation, scraped_date_column='scraped_date') %}
+    SELECT DISTINCT {{ scraped_date_column }}
+    FROM {{ relation }}
+    WHERE ingestion_timestamp > {{ ingestion_watermark() }}
+    {%- if var('start_date', none) and var('end_date', none) %}
+    UNION
+    SELECT GENERATE_SERIES('{{ var("start_date") }}'::DATE, '{{ var("end_date") }}'::DATE, INTERVAL '1 day')::DATE
+    {%- endif %}
+{% endmacro %}
@@ -0,0 +1,74 @@
+-- macros/physical_design.sql
+-- Indexes, clustering and statistics of the models, declared per model as
+-- meta={'physical_design': {...}} in its config and applied after every build by
+-- apply_physical_design(), the post-hook all models get in dbt_project.yml:
+--
+--   indexes:    [{'columns': [...], 'type': 'btree' (default) | 'brin' | 'gin' | ...,
+--                 'unique': false, 'with': {storage parameter: value}, 'name': alias}, ...]
+--   cluster_by: alias of a btree index to CLUSTER the table on. Tables rebuilt by every run
+--               are clustered each time, incremental models only on --full-refresh (it
+--               rewrites the whole table).
+--   analyze:    ANALYZE after the build (default true), so the planner has statistics for
+--               the new rows before the API queries them.
+--
+-- Declared indexes get managed names, ix_<table>_<definition hash>_<epoch>: an index is created
+-- when the table has none with its definition hash yet, and managed indexes that are no longer
+-- declared are dropped. (The epoch keeps names unique while a rebuilt table's old copy, with
+-- the previous indexes, still exists.) Indexes not created here are left alone.
+
+{% macro physical_index_spec(index) %}
+    {%- set storage = index.get('with', {}) -%}
+    {{- 'unique ' if index.get('unique', false) else '' -}}
+    index {name} on {relation} using {{ index.get('type', 'btree') | lower }} ({{ index['columns'] | join(', ') }})
+    {%- if storage %} with ({% for key, value in storage.items() %}{{ key }} = {{ value }}{{ ', ' if not loop.last }}{% endfor %}){% endif -%}
+{% endmacro %}
+
+
+{% macro apply_physical_design() %}
+    {%- set design = model.config.get('meta', {}).get('physical_design') -%}
+    {%- if not execute or not design -%}
+        {{ return('') }}
+    {%- endif -%}
+
+    {%- set prefix = 'ix_' ~ this.identifier[:20] ~ '_' -%}
+    {%- set existing_indexes = {} -%}
+    {%- set existing = run_query(
+        "select indexname from pg_indexes where schemaname = '" ~ this.schema ~ "' and tablename = '" ~ this.identifier ~ "'"
+    ) -%}
+    {%- for row in existing if row[0].startswith(prefix) -%}
+        {%- do existing_indexes.update({row[0][prefix | length:(prefix | length) + 8]: row[0]}) -%}
+    {%- endfor -%}
+
+    {%- set statements = [] -%}
+    {%- set index_names = {} -%}
+    {%- set declared = [] -%}
+    {%- for index in design.get('indexes', []) -%}
+        {%- set spec = physical_index_spec(index) | trim -%}
+        {%- set definition_hash = local_md5(spec)[:8] -%}
+        {%- do declared.append(definition_hash) -%}
+        {%- if definition_hash in existing_indexes -%}
+            {%- set index_name = existing_indexes[definition_hash] -%}
+        {%- else -%}
+            {%- set index_name = prefix ~ definition_hash ~ '_' ~ (run_started_at.timestamp() | int) -%}
+            {%- do statements.append('create ' ~ spec.replace('{name}', index_name).replace('{relation}', this | string)) -%}
+        {%- endif -%}
+        {%- do index_names.update({index.get('name', definition_hash): index_name}) -%}
+    {%- endfor -%}
+    {%- for definition_hash, index_name in existing_indexes.items() if definition_hash not in declared -%}
+        {%- do statements.append('drop index if exists ' ~ adapter.quote(this.schema) ~ '.' ~ adapter.quote(index_name)) -%}
+    {%- endfor -%}
+
+    {%- set cluster_by = design.get('cluster_by') -%}
+    {%- if cluster_by and (model.config.materialized != 'incremental' or flags.FULL_REFRESH) -%}
+        {%- if cluster_by not in index_names -%}
+            {{ exceptions.raise_compiler_error("physical_design.cluster_by of " ~ this ~ " names no declared index: " ~ cluster_by) }}
+        {%- endif -%}
+        {%- do statements.append('cluster ' ~ this ~ ' using ' ~ adapter.quote(index_names[cluster_by])) -%}
+    {%- endif -%}
+
+    {%- if design.get('analyze', true) -%}
+        {%- do statements.append('analyze ' ~ this) -%}
+    {%- endif -%}
+
+    {{ return(statements | join(';\n')) }}
+{% endmacro %}
@@ -0,0 +1,96 @@
+-- models/marts/agg_channel_daily.sql
+-- Daily activity per channel, served by /api/channels/{channel_name}/activity.
+-- Incremental: each run only recomputes the (channel, day) rows touched by newly scraped
+-- messages or new detections, then replaces those rows (delete+insert on the unique key).
+{{ config(
+    materialized='incremental',
+    unique_key=['channel_fk', 'date_key'],
+    incremental_strategy='delete+insert',
+    on_schema_change='append_new_columns',
+    meta={'physical_design': {
+        'indexes': [
+            {'columns': ['channel_fk', 'activity_date'], 'unique': True},
+            {'columns': ['channel_fk', 'date_key']}
+        ]
+    }}
+) }}
+
+WITH fct_messages AS (
+    SELECT * FROM {{ ref('fct_messages') }}
+),
+fct_image_detections AS (
+    SELECT * FROM {{ ref('fct_image_detections') }}
+),
+{% if is_incremental() %}
+-- Channel/day pairs that received messages scraped since the last build
+-- (the latest scraped day is always recomputed, it may still be filling up)
+touched_days AS (
+    SELECT DISTINCT channel_fk, message_date_fk
+    FROM fct_messages
+    WHERE message_scraped_date_fk >= (SELECT COALESCE(MAX(last_scraped_date_fk), -1) FROM {{ this }})
+    UNION
+    -- ...pairs of late-arriving partitions (older scraped dates loaded since the last build)
+    SELECT DISTINCT channel_fk, message_date_fk
+    FROM fct_messages
+    WHERE ingestion_timestamp > {{ ingestion_watermark('last_ingestion_timestamp') }}
+    UNION
+    -- ...and pairs whose messages received detections since the last build. Watermarked on when
+    -- they were loaded: cached detections keep their original detection_timestamp, and backfilled
+    -- partitions bring detections of old messages
+    SELECT DISTINCT fm.channel_fk, fm.message_date_fk
+    FROM fct_image_detections fid
+    INNER JOIN fct_messages fm
+        ON fid.channel_fk = fm.channel_fk
+        AND fid.message_id = fm.message_id
+    WHERE fid.loaded_at > {{ ingestion_watermark('last_detection_loaded_at') }}
+),
+{% endif %}
+messages AS (
+    SELECT
+        fm.channel_fk,
+        fm.message_date_fk,
+        fm.message_id,
+        fm.views_count,
+        fm.has_image,
+        fm.message_scraped_date_fk,
+        fm.ingestion_timestamp
+    FROM fct_messages fm
+    {% if is_incremental() %}
+    INNER JOIN touched_days td
+        ON fm.channel_fk = td.channel_fk
+        AND fm.message_date_fk = td.message_date_fk
+    {% endif %}
+),
+detections AS (
+    SELECT
+        channel_fk,
+        message_id,
+        COUNT(*) AS detection_count,
+        MAX(detection_timestamp) AS last_detection_at,
+        MAX(loaded_at) AS last_detection_loaded_at
+    FROM fct_image_detections
+    WHERE (channel_fk, message_id) IN (SELECT channel_fk, message_id FROM messages)
+    GROUP BY channel_fk, message_id
+)
+SELECT
+    m.channel_fk,
+    m.message_date_fk AS date_key,
+    dd.full_date AS activity_date,
+    COUNT(*) AS message_count,
+    SUM(m.views_count) AS total_views,
+    COUNT(*) FILTER (WHERE m.has_image) AS image_post_count,
+    COALESCE(SUM(d.detection_count), 0) AS detection_count,
+    MAX(m.message_scraped_date_fk) AS last_scraped_date_fk,
+    MAX(d.last_detection_at) AS last_detection_at,
+    MAX(d.last_detection_loaded_at) AS last_detection_loaded_at,
+    MAX(m.ingestion_timestamp) AS last_ingestion_timestamp
+FROM messages m
+INNER JOIN {{ ref('dim_dates') }} dd
+    ON m.message_date_fk = dd.date_key
+LEFT JOIN detections d
+    ON m.channel_fk = d.channel_fk
+    AND m.message_id = d.message_id
+GROUP BY
+    m.channel_fk,
+    m.message_date_fk,
+    dd.full_date
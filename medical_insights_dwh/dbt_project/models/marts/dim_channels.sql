@@ -1,4 +1,19 @@
 -- models/marts/dim_channels.sql
+-- Incremental: only messages ingested since the last build are deduplicated, and the channels
+-- they mention replace their row (delete+insert on telegram_channel_id); other channels are untouched.
+-- channel_name is indexed for the API's channel lookups by name.
+{{ config(
+    materialized='incremental',
+    unique_key='telegram_channel_id',
+    incremental_strategy='delete+insert',
+    on_schema_change='append_new_columns',
+    meta={'physical_design': {
+        'indexes': [
+            {'columns': ['telegram_channel_id'], 'unique': True},
+            {'columns': ['channel_name']}
+        ]
+    }}
+) }}
 
 WITH source_channels AS (
     SELECT
@@ -10,6 +25,9 @@ WITH source_channels AS (
     WHERE
         telegram_channel_id IS NOT NULL -- Ensure we only process valid channel IDs
         AND channel_name IS NOT NULL -- Ensure we have a name for the channel
+        {% if is_incremental() %}
+        AND ingestion_timestamp > {{ ingestion_watermark('latest_ingestion_timestamp') }}
+        {% endif %}
 ),
 
 -- Deduplicate channels: If a channel appears multiple times,
@@ -18,6 +36,7 @@ deduplicated_channels AS (
     SELECT
         telegram_channel_id,
         channel_name,
+        ingestion_timestamp,
         ROW_NUMBER() OVER (PARTITION BY telegram_channel_id ORDER BY ingestion_timestamp DESC) as rn
     FROM
         source_channels
@@ -25,10 +44,19 @@ deduplicated_channels AS (
 
 SELECT
     -- Generate a surrogate key for the dimension table
-    {{ dbt_utils.generate_surrogate_key(['telegram_channel_id']) }} AS channel_sk,
-    telegram_channel_id,
-    channel_name
+    {{ dbt_utils.generate_surrogate_key(['dc.telegram_channel_id']) }} AS channel_sk,
+    dc.telegram_channel_id,
+    dc.channel_name,
+    dc.ingestion_timestamp AS latest_ingestion_timestamp
 FROM
-    deduplicated_channels
+    deduplicated_channels dc
+{% if is_incremental() and relation_has_column(this, 'latest_ingestion_timestamp') %}
+LEFT JOIN {{ this }} existing
+    ON dc.telegram_channel_id = existing.telegram_channel_id
+{% endif %}
 WHERE
-    rn = 1 -- This filters to keep only the latest record for each unique channel_telegram_id
\ No newline at end of file
+    dc.rn = 1 -- This filters to keep only the latest record for each unique channel_telegram_id
+    {% if is_incremental() and relation_has_column(this, 'latest_ingestion_timestamp') %}
+    -- Rows re-read within the lookback window must not replace a newer name
+    AND (existing.telegram_channel_id IS NULL OR dc.ingestion_timestamp >= existing.latest_ingestion_timestamp)
+    {% endif %}
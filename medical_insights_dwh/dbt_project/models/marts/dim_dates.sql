@@ -1,4 +1,12 @@
-{{ config(materialized='table') }}
+{{ config(
+    materialized='table',
+    meta={'physical_design': {
+        'indexes': [
+            {'columns': ['date_key'], 'unique': True},
+            {'columns': ['full_date'], 'unique': True}
+        ]
+    }}
+) }}
 
 WITH date_spine AS (
     SELECT
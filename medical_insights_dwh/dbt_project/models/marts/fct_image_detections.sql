@@ -1,20 +1,63 @@
 -- models/marts/fct_image_detections.sql
-{{ config(materialized='table') }}
+-- Detections keyed by the Telegram message of the image (message_id + the lake directory the
+-- scraper saved it under, see src/yolo_image_analyzer.py). channel_fk is resolved through the
+-- Telegram channel id of that message, like fct_messages does, so the two join on
+-- (channel_fk, message_id) and a channel's later renames don't detach its detections.
+-- Indexes: detections of a message (or a page of messages) in detection order, which the table
+-- is also clustered on, a channel's detections, and exports by detection date.
+{{ config(
+    materialized='table',
+    meta={'physical_design': {
+        'indexes': [
+            {'columns': ['channel_fk', 'message_id', 'detection_timestamp'], 'name': 'message_detections'},
+            {'columns': ['channel_fk', 'detection_timestamp']},
+            {'columns': ['detection_timestamp', 'image_detection_pk']}
+        ],
+        'cluster_by': 'message_detections'
+    }}
+) }}
 
 WITH yolo_detections AS (
     SELECT
         CAST(message_id AS VARCHAR) AS message_id,
+        channel_name,
         detected_object_class,
         confidence_score,
-        CAST(detection_timestamp AS TIMESTAMP) AS detection_timestamp
+        CAST(detection_timestamp AS TIMESTAMP) AS detection_timestamp,
+        box_index,
+        loaded_at
     FROM {{ source('raw', 'yolo_detections_csv') }}
+),
+-- The Telegram channel id of each detected message; the directory name only identifies the
+-- channel as it was named when the image was scraped
+message_channels AS (
+    SELECT DISTINCT ON (sm.channel_name, sm.message_id)
+        sm.channel_name,
+        sm.message_id,
+        sm.telegram_channel_id
+    FROM {{ ref('stg_telegram_messages') }} sm
+    WHERE sm.telegram_channel_id IS NOT NULL
+        AND (sm.channel_name, sm.message_id) IN (SELECT channel_name, message_id FROM yolo_detections)
+    ORDER BY sm.channel_name, sm.message_id, sm.ingestion_timestamp DESC
+),
+dim_channels AS (
+    SELECT * FROM {{ ref('dim_channels') }}
 )
 
 SELECT
-    {{ dbt_utils.generate_surrogate_key(['message_id', 'detected_object_class', 'detection_timestamp']) }} AS image_detection_pk,
+    -- Same columns as the importer's natural key (src/import_yolo_detections.py DETECTION_KEY)
+    {{ dbt_utils.generate_surrogate_key(['yd.channel_name', 'yd.message_id', 'yd.box_index']) }} AS image_detection_pk,
     yd.message_id,
+    COALESCE(dc.channel_sk, '-1') AS channel_fk,
     yd.detected_object_class,
     yd.confidence_score,
-    yd.detection_timestamp
+    yd.detection_timestamp,
+    yd.box_index,
+    yd.loaded_at
 FROM yolo_detections yd
--- LEFT JOIN {{ ref('fct_messages') }} fm ON yd.message_id = fm.message_pk
\ No newline at end of file
+-- One row per (channel_name, message_id) on both sides, so detections are never duplicated
+LEFT JOIN message_channels mc
+    ON yd.channel_name = mc.channel_name
+    AND yd.message_id = mc.message_id
+LEFT JOIN dim_channels dc
+    ON mc.telegram_channel_id = dc.telegram_channel_id
@@ -1,7 +1,37 @@
-{{ config(materialized='table') }}
+-- models/marts/fct_messages.sql
+-- Incremental by scraped date, like stg_telegram_messages: the partitions that received rows
+-- since the last build are replaced (delete+insert on message_scraped_date_fk).
+-- Indexes: search matches (GIN on message_tsv for @@, trigram GIN on message_text for ILIKE),
+-- search / export pages in (message_timestamp, channel_fk, message_id, raw_id) order for all or
+-- one channel, joins from fct_image_detections on (channel_fk, message_id), and the incremental
+-- delete key and watermark.
+{{ config(
+    materialized='incremental',
+    unique_key='message_scraped_date_fk',
+    incremental_strategy='delete+insert',
+    on_schema_change='append_new_columns',
+    pre_hook="CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    meta={'physical_design': {
+        'indexes': [
+            {'columns': ['message_tsv'], 'type': 'gin'},
+            {'columns': ['message_text gin_trgm_ops'], 'type': 'gin'},
+            {'columns': ['message_timestamp DESC', 'channel_fk DESC', 'message_id DESC', 'raw_id DESC']},
+            {'columns': ['channel_fk', 'message_timestamp', 'message_id', 'raw_id'], 'name': 'channel_timeline'},
+            {'columns': ['channel_fk', 'message_date_fk']},
+            {'columns': ['message_id']},
+            {'columns': ['message_scraped_date_fk']},
+            {'columns': ['ingestion_timestamp'], 'type': 'brin'}
+        ],
+        'cluster_by': 'channel_timeline'
+    }}
+) }}
 
 WITH stg_messages AS (
     SELECT * FROM {{ ref('stg_telegram_messages') }}
+    {# Tables built before raw_id existed are rebuilt whole, so every row gets one #}
+    {% if is_incremental() and relation_has_column(this, 'raw_id') %}
+    WHERE scraped_date IN ({{ changed_scraped_dates(ref('stg_telegram_messages')) }})
+    {% endif %}
 ),
 dim_channels AS (
     SELECT * FROM {{ ref('dim_channels') }}
@@ -11,6 +41,9 @@ dim_dates AS (
 )
 SELECT
     sm.message_id, -- Keep only one instance of message_id
+    -- Unique per row, unlike message_id (per channel, and repeated when a message is scraped on
+    -- several days); the API's search pages break ties on it
+    sm.raw_id,
     -- Ensure channel_fk's type matches channel_sk's type (TEXT)
     COALESCE(dc.channel_sk, '-1') AS channel_fk,
     COALESCE(dd_message_date.date_key, -1) AS message_date_fk,
@@ -22,7 +55,10 @@ SELECT
     sm.views_count,
     COALESCE(dd_scraped_date.date_key, -1) AS message_scraped_date_fk,
     sm.message_timestamp,
-    sm.message_text
+    sm.message_text,
+    -- Search document for /api/search/messages ('simple' config: no stemming for mixed English/Amharic text)
+    TO_TSVECTOR('simple', COALESCE(sm.message_text, '')) AS message_tsv,
+    sm.ingestion_timestamp
 FROM stg_messages sm
 LEFT JOIN dim_channels dc
     ON sm.telegram_channel_id = dc.telegram_channel_id
@@ -0,0 +1,41 @@
+-- models/marts/fct_product_mentions.sql
+-- One row per message and mentioned product, produced by src/extract_product_mentions.py
+{{ config(
+    materialized='table',
+    meta={'physical_design': {
+        'indexes': [
+            {'columns': ['product_keyword', 'message_id']},
+            {'columns': ['channel_fk', 'message_date_fk']}
+        ]
+    }}
+) }}
+
+WITH product_mentions AS (
+    SELECT
+        raw_id,
+        product_keyword,
+        mention_count
+    FROM {{ source('raw', 'raw_product_mentions') }}
+),
+stg_messages AS (
+    SELECT * FROM {{ ref('stg_telegram_messages') }}
+),
+dim_channels AS (
+    SELECT * FROM {{ ref('dim_channels') }}
+),
+dim_dates AS (
+    SELECT * FROM {{ ref('dim_dates') }}
+)
+SELECT
+    sm.message_id,
+    COALESCE(dc.channel_sk, '-1') AS channel_fk,
+    COALESCE(dd.date_key, -1) AS message_date_fk,
+    pm.product_keyword,
+    pm.mention_count
+FROM product_mentions pm
+INNER JOIN stg_messages sm
+    ON pm.raw_id = sm.raw_id
+LEFT JOIN dim_channels dc
+    ON sm.telegram_channel_id = dc.telegram_channel_id
+LEFT JOIN dim_dates dd
+    ON sm.message_timestamp::DATE = dd.full_date
@@ -1,4 +1,18 @@
 -- models/staging/stg_telegram_messages.sql
+-- Incremental by scraped date: each run re-parses only the partitions that received rows since
+-- the last build (see macros/incremental.sql) and replaces them (delete+insert on scraped_date).
+-- Rows are appended in ingestion order, so a BRIN index is enough for the watermark lookups.
+{{ config(
+    materialized='incremental',
+    unique_key='scraped_date',
+    incremental_strategy='delete+insert',
+    meta={'physical_design': {
+        'indexes': [
+            {'columns': ['scraped_date']},
+            {'columns': ['ingestion_timestamp'], 'type': 'brin'}
+        ]
+    }}
+) }}
 
 WITH source_data AS (
     SELECT
@@ -9,6 +23,10 @@ WITH source_data AS (
         ingestion_timestamp
     FROM
         {{ source('raw', 'raw_telegram_messages') }}
+    {% if is_incremental() %}
+    WHERE
+        scraped_date IN ({{ changed_scraped_dates(source('raw', 'raw_telegram_messages')) }})
+    {% endif %}
 )
 
 SELECT
@@ -29,4 +47,4 @@ SELECT
     scraped_date,
     ingestion_timestamp
 FROM
-    source_data
\ No newline at end of file
+    source_data
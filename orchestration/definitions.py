@@ -1,101 +1,144 @@
 # orchestration/definitions.py
 import os
-from dagster import op, job, ScheduleDefinition
+from datetime import datetime
+from dagster import (
+    asset, AssetExecutionContext, AssetObservation, AssetSelection, BackfillPolicy, DailyPartitionsDefinition,
+    Definitions, build_schedule_from_partitioned_job, define_asset_job
+)
 import subprocess
 import sys
 
+# Add project root to sys.path to allow importing utils.*
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.process_runner import run_streaming
+
 # Define paths to your wrapper scripts
 SCRIPTS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), 'scripts'))
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
 TELEGRAM_SCRAPER_SCRIPT = os.path.join(SCRIPTS_DIR, 'run_telegram_scraper.py')
-RAW_DATA_LOADER_SCRIPT = os.path.join(SCRIPTS_DIR, 'load_telegram_raw_data.py')
+LAKE_LOADER_SCRIPT = os.path.join(SRC_DIR, 'load_to_postgres.py')
 YOLO_DETECTOR_SCRIPT = os.path.join(SCRIPTS_DIR, 'run_yolo_detection.py')
 DBT_TRANSFORMATIONS_SCRIPT = os.path.join(SCRIPTS_DIR, 'run_dbt_transformations.py')
+PRODUCT_EXTRACTION_SCRIPT = os.path.join(SCRIPTS_DIR, 'run_product_extraction.py')
+
+# One partition per scraped date, i.e. per <date>/ directory of the data lake.
+# end_offset=1 includes today's partition, the one the scraper is writing to; the timezone
+# should match the scraper host's, since it names the directories after its local date.
+PIPELINE_START_DATE = os.getenv("PIPELINE_START_DATE", "2024-01-01")
+PIPELINE_TIMEZONE = os.getenv("PIPELINE_TIMEZONE", "UTC")
+daily_partitions = DailyPartitionsDefinition(start_date=PIPELINE_START_DATE, timezone=PIPELINE_TIMEZONE, end_offset=1)
 
 # Helper function to run Python scripts as subprocesses
-def _run_python_script(script_path: str, context):
-    context.log.info(f"Executing script: {script_path}")
+# Their output is forwarded to the step log as it is printed (bounded, see utils/process_runner.py),
+# and the progress they report is recorded as observations of the asset
+def _run_python_script(script_path: str, context, args=None):
+    context.log.info(f"Executing script: {script_path} {' '.join(args or [])}")
+
+    def observe_progress(event):
+        context.log_event(AssetObservation(
+            asset_key=context.asset_key,
+            partition=context.partition_key if context.has_partition_key else None,
+            metadata={
+                "items_done": event.done,
+                "items_total": event.total,
+                "unit": event.unit,
+                "rate_per_second": round(event.rate, 2),
+                "eta_seconds": round(event.eta_seconds) if event.eta_seconds is not None else None,
+            }
+        ))
+
     try:
-        result = subprocess.run(
-            [sys.executable, script_path],
-            capture_output=True,
-            text=True,
-            check=True,
-            env=os.environ.copy() # Pass current environment variables to subprocess
+        result = run_streaming(
+            [sys.executable, script_path] + (args or []),
+            context.log,
+            env=os.environ.copy(), # Pass current environment variables to subprocess
+            on_progress=observe_progress
         )
-        context.log.info(f"Script Stdout:\n{result.stdout}")
-        if result.stderr:
-            context.log.warning(f"Script Stderr:\n{result.stderr}")
-        context.log.info(f"Script {script_path} completed successfully.")
+        context.log.info(f"Script {script_path} completed successfully in {result.elapsed_seconds:.0f}s.")
     except subprocess.CalledProcessError as e:
         context.log.error(f"Script {script_path} failed with exit code {e.returncode}")
-        context.log.error(f"Stdout:\n{e.stdout}")
-        context.log.error(f"Stderr:\n{e.stderr}")
         raise  # Re-raise the exception to mark the op as failed in Dagster
     except FileNotFoundError:
         context.log.error(f"Script not found: {script_path}. Check path and permissions.")
         raise
 
-# --- Ops Definition ---
-
-@op
-def scrape_telegram_data(context):
-    """Scrapes new data from Telegram channels."""
-    _run_python_script(TELEGRAM_SCRAPER_SCRIPT, context)
-
-@op
-def load_raw_to_postgres(context, start_after_scrape):
-    """Loads raw scraped Telegram data (JSON) into PostgreSQL."""
-    _run_python_script(RAW_DATA_LOADER_SCRIPT, context)
-
-@op
-def run_yolo_enrichment(context, start_after_scrape):
-    """Runs YOLO object detection on new images and generates detections CSV."""
-    _run_python_script(YOLO_DETECTOR_SCRIPT, context)
-
-@op
-def run_dbt_transformations(context, start_after_load, start_after_yolo):
-    """Runs dbt transformations (run and test) to build data marts."""
-    _run_python_script(DBT_TRANSFORMATIONS_SCRIPT, context)
+# --- Asset Definitions ---
+# Every asset but the marts is materialized one scraped date at a time: a run only reads and
+# writes its own partition, and a backfill launches one run per date, in parallel up to the
+# run coordinator's concurrency limit.
 
-# --- Job Definition ---
-
-@job
-def medical_insights_pipeline():
+@asset(partitions_def=daily_partitions, backfill_policy=BackfillPolicy.multi_run(1), group_name="ingestion")
+def raw_telegram_files(context: AssetExecutionContext):
     """
-    Orchestrates the entire medical insights data pipeline.
-    Dependencies:
-    - scrape_telegram_data runs first.
-    - load_raw_to_postgres depends on scrape_telegram_data.
-    - run_yolo_enrichment depends on scrape_telegram_data.
-    - run_dbt_transformations depends on both load_raw_to_postgres and run_yolo_enrichment.
+    Scraped messages and images in the data lake (data/raw/telegram_*/<date>/).
+    Telegram can only be scraped as of now, so the scraper runs for today's partition only;
+    earlier partitions keep the files they have.
     """
-    # Step 1: Scrape data
-    scrape_result = scrape_telegram_data()
-
-    # Step 2: Load raw data to Postgres (depends on scrape)
-    load_result = load_raw_to_postgres(start_after_scrape=scrape_result)
+    window = context.partition_time_window
+    if window.start <= datetime.now(window.start.tzinfo) < window.end:
+        _run_python_script(TELEGRAM_SCRAPER_SCRIPT, context)
+    else:
+        context.log.info(f"Partition {context.partition_key} is in the past; using the lake files as they are.")
+
+@asset(deps=[raw_telegram_files], partitions_def=daily_partitions, backfill_policy=BackfillPolicy.multi_run(1),
+       group_name="ingestion")
+def raw_telegram_messages(context: AssetExecutionContext):
+    """The partition's lake files loaded into public.raw_telegram_messages (new or changed files only)."""
+    _run_python_script(LAKE_LOADER_SCRIPT, context, ["--partition", context.partition_key])
+
+@asset(deps=[raw_telegram_messages], partitions_def=daily_partitions, backfill_policy=BackfillPolicy.multi_run(1),
+       group_name="enrichment")
+def product_mentions(context: AssetExecutionContext):
+    """Product mentions of the partition's messages, in public.raw_product_mentions."""
+    _run_python_script(PRODUCT_EXTRACTION_SCRIPT, context, ["--partition", context.partition_key])
+
+@asset(deps=[raw_telegram_files], partitions_def=daily_partitions, backfill_policy=BackfillPolicy.multi_run(1),
+       group_name="enrichment")
+def image_detections(context: AssetExecutionContext):
+    """YOLO detections of the partition's images, written straight into public.yolo_detections_csv."""
+    _run_python_script(YOLO_DETECTOR_SCRIPT, context, ["--partition", context.partition_key, "--sink", "postgres"])
+
+@asset(deps=[raw_telegram_messages, product_mentions, image_detections], partitions_def=daily_partitions,
+       backfill_policy=BackfillPolicy.single_run(), group_name="marts")
+def dbt_marts(context: AssetExecutionContext):
+    """
+    The dbt marts (run and test). The marts are shared by all dates, so a backfill builds them
+    once for its whole date range instead of once per partition.
+    """
+    partition_range = context.partition_key_range
+    _run_python_script(DBT_TRANSFORMATIONS_SCRIPT, context,
+                       ["--start-date", partition_range.start, "--end-date", partition_range.end])
 
-    # Step 3: Run YOLO enrichment (depends on scrape for images)
-    yolo_result = run_yolo_enrichment(start_after_scrape=scrape_result)
+# --- Job Definition ---
 
-    # Step 4: Run dbt transformations (depends on both raw data load and YOLO enrichment)
-    run_dbt_transformations(start_after_load=load_result, start_after_yolo=yolo_result)
+# Materializes one date partition of every asset:
+# raw_telegram_files -> raw_telegram_messages -> product_mentions -> dbt_marts, and
+# raw_telegram_files -> image_detections -> dbt_marts.
+medical_insights_pipeline = define_asset_job(
+    "medical_insights_pipeline",
+    selection=AssetSelection.all(),
+    partitions_def=daily_partitions,
+    description="Orchestrates the medical insights data pipeline for one scraped date."
+)
 
 # --- Schedule Definition ---
 
-# Schedule the pipeline to run daily at a specific time (e.g., 2 AM UTC)
-# Adjust cron_schedule as needed for your desired frequency
-daily_medical_insights_schedule = ScheduleDefinition(
-    job=medical_insights_pipeline,
-    cron_schedule="0 2 * * *", # Every day at 2:00 AM UTC
+# Schedule the pipeline to run daily at a specific time (e.g., 2 AM in PIPELINE_TIMEZONE),
+# for the partition of the day it runs on
+daily_medical_insights_schedule = build_schedule_from_partitioned_job(
+    medical_insights_pipeline,
+    hour_of_day=2,
+    minute_of_hour=0,
     description="Daily run of the medical insights data pipeline."
 )
 
-# Define the repository, which contains your job and schedule
+# Define the repository, which contains your assets, job and schedule
 # This is how Dagster discovers your definitions
-from dagster import Definitions
-
 defs = Definitions(
+    assets=[raw_telegram_files, raw_telegram_messages, product_mentions, image_detections, dbt_marts],
     jobs=[medical_insights_pipeline],
     schedules=[daily_medical_insights_schedule]
-)
\ No newline at end of file
+)
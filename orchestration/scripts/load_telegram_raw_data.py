@@ -1,7 +1,11 @@
 # orchestration/scripts/load_telegram_raw_data.py
 import psycopg2
+import csv
 import json
 import os
+import argparse
+from io import StringIO
+from datetime import datetime
 from dotenv import load_dotenv
 
 # Load environment variables (POSTGRES_*)
@@ -15,12 +19,83 @@ POSTGRES_PASSWORD = os.getenv('POSTGRES_PASSWORD')
 POSTGRES_HOST = os.getenv('POSTGRES_HOST')
 POSTGRES_PORT = os.getenv('POSTGRES_PORT', '5432')
 
-# Path to your raw JSON file
+# Path to your raw JSON file (a JSON array of messages, or NDJSON with one message per line)
 RAW_JSON_FILE_PATH = os.path.abspath(os.path.join(
     project_root, 'data', 'raw', 'telegram_messages.json'
 ))
 
-def load_raw_data():
+# Messages sent per COPY; together with CHUNK_SIZE this bounds memory, whatever the file size
+BATCH_SIZE = 5000
+# Characters read from the file at a time by the incremental parser
+CHUNK_SIZE = 1 << 20
+# Characters a single message may span; past this a message that still doesn't decode is
+# reported as malformed instead of buffering the rest of the file
+MAX_MESSAGE_SIZE = 16 << 20
+
+_WHITESPACE = " \t\r\n"
+
+def iter_json_messages(f, chunk_size=CHUNK_SIZE, max_message_size=MAX_MESSAGE_SIZE):
+    """
+    Yields the messages of a JSON array or of NDJSON one at a time, reading the file in chunks.
+    Only the current chunk and the message being decoded are held in memory. Raises ValueError
+    with the message's character offset in the file if it doesn't decode, at the end of the file
+    or once more than max_message_size characters of it are buffered.
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+    consumed = 0 # Characters of the file before buffer
+    in_array = None # Unknown until the first character: '[' for a JSON array, anything else for NDJSON
+
+    def refill():
+        # Drop what has been consumed and append the next chunk
+        nonlocal buffer, pos, eof, consumed
+        chunk = f.read(chunk_size)
+        consumed += pos
+        buffer, pos, eof = buffer[pos:] + chunk, 0, not chunk
+
+    while True:
+        # Skip whitespace, and the commas between array elements
+        while pos < len(buffer) and (buffer[pos] in _WHITESPACE or (in_array and buffer[pos] == ",")):
+            pos += 1
+        if pos == len(buffer):
+            if eof:
+                return
+            refill()
+            continue
+
+        if in_array is None:
+            in_array = buffer[pos] == "["
+            if in_array:
+                pos += 1
+                continue
+        if in_array and buffer[pos] == "]":
+            return
+
+        try:
+            message, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            if eof or len(buffer) - pos > max_message_size:
+                raise ValueError(f"Malformed message at character offset {consumed + pos}: {e.msg} "
+                                 f"(at character offset {consumed + e.pos})") from e
+            refill() # The message continues in the next chunk
+            continue
+        if end == len(buffer) and not eof:
+            refill() # A value ending exactly at the chunk boundary may be cut short; decode it again
+            continue
+        yield message
+        pos = end
+
+def copy_messages(cur, rows):
+    """Bulk-writes a batch of (message_json, scraped_date) rows with COPY."""
+    buffer = StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cur.copy_expert(
+        "COPY public.raw_telegram_messages (message_data, scraped_date) FROM STDIN WITH (FORMAT CSV);",
+        buffer
+    )
+
+def load_raw_data(file_path=RAW_JSON_FILE_PATH, batch_size=BATCH_SIZE):
     conn = None
     cur = None
     try:
@@ -52,44 +127,43 @@ def load_raw_data():
         # conn.commit()
         # print("Truncated raw_telegram_messages table.")
 
-        with open(RAW_JSON_FILE_PATH, 'r', encoding='utf-8') as f:
-            raw_messages = json.load(f)
-
-        # Prepare data for insertion
-        data_to_insert = []
         current_scraped_date = datetime.now().date() # Use current date as scraped_date
 
-        for msg in raw_messages:
-            # Ensure 'date' is a datetime object if it's not already
-            # msg_date = datetime.fromisoformat(msg['date']) if isinstance(msg['date'], str) else msg['date']
-            # For simplicity, we'll insert the whole dict as JSONB
-            data_to_insert.append((json.dumps(msg), current_scraped_date))
-
-        # Use executemany for efficient batch insert
-        if data_to_insert:
-            print(f"Inserting {len(data_to_insert)} raw messages into raw_telegram_messages...")
-            cur.executemany(
-                """
-                INSERT INTO public.raw_telegram_messages (message_data, scraped_date)
-                VALUES (%s, %s);
-                """,
-                data_to_insert
-            )
+        # Stream the file: messages are parsed and sent in batches of batch_size, so memory use
+        # doesn't depend on the file size. All batches go in one transaction, so a failed run
+        # leaves nothing half-loaded behind.
+        inserted = 0
+        rows = []
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for msg in iter_json_messages(f):
+                rows.append((json.dumps(msg), current_scraped_date))
+                if len(rows) >= batch_size:
+                    copy_messages(cur, rows)
+                    inserted += len(rows)
+                    rows = []
+                    print(f"Copied {inserted} raw messages so far...")
+        if rows:
+            copy_messages(cur, rows)
+            inserted += len(rows)
+
+        if inserted:
             conn.commit()
-            print("Raw Telegram data loaded successfully.")
+            print(f"Raw Telegram data loaded successfully ({inserted} messages).")
         else:
             print("No raw messages to insert.")
 
     except FileNotFoundError:
-        print(f"Error: Raw JSON file not found at {RAW_JSON_FILE_PATH}")
+        print(f"Error: Raw JSON file not found at {file_path}")
         raise
     except psycopg2.Error as e:
         if conn:
             conn.rollback()
         print(f"Database error occurred: {e}")
         raise
-    except json.JSONDecodeError:
-        print(f"Error: Could not decode JSON from {RAW_JSON_FILE_PATH}. Is it valid JSON?")
+    except ValueError as e:
+        if conn:
+            conn.rollback()
+        print(f"Error: Could not decode JSON from {file_path}. Is it a valid JSON array or NDJSON? {e}")
         raise
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
@@ -101,4 +175,9 @@ def load_raw_data():
             conn.close()
 
 if __name__ == "__main__":
-    load_raw_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Stream a raw Telegram messages file into PostgreSQL.")
+    parser.add_argument("--file", default=RAW_JSON_FILE_PATH,
+                        help="JSON array or NDJSON file of messages (defaults to data/raw/telegram_messages.json).")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Messages sent per COPY.")
+    args = parser.parse_args()
+    load_raw_data(file_path=args.file, batch_size=args.batch_size)
@@ -1,8 +1,14 @@
 # orchestration/scripts/run_dbt_transformations.py
-import subprocess
 import os
-import sys
+import json
+import uuid
+import shutil
+import hashlib
+import argparse
+import psycopg2
 from dotenv import load_dotenv
+from dbt.cli.main import dbtRunner
+from dbt.artifacts.schemas.results import FreshnessStatus
 
 # Load environment variables (POSTGRES_*)
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
@@ -11,57 +17,158 @@ load_dotenv(os.path.join(project_root, '.env'), override=True)
 DBT_PROJECT_DIR = os.path.abspath(os.path.join(
     project_root, "medical_insights_dwh", "dbt_project"
 ))
+DBT_PACKAGES_DIR = os.path.join(DBT_PROJECT_DIR, "dbt_packages")
+# Hash of the packages.yml / package-lock.yml that dbt_packages was installed from
+PACKAGES_HASH_FILE = os.path.join(DBT_PACKAGES_DIR, ".packages_hash")
+# sources.json of the last successful build (`dbt clean` removes it, forcing a full build)
+STATE_DIR = os.path.join(DBT_PROJECT_DIR, "target", "last_build")
 
-def run_dbt():
-    print(f"Running dbt commands in: {DBT_PROJECT_DIR}")
-    env_with_vars = os.environ.copy() # Ensure all env vars are passed to subprocess
+# Models downstream of sources that received rows since the last build, and dim_dates,
+# which has no source but extends its calendar from CURRENT_DATE
+CHANGED_SELECTION = ["source_status:fresher+", "dim_dates"]
+# Models that rebuild the start_date..end_date scraped dates they're given (changed_scraped_dates)
+PARTITION_SELECTION = ["source:raw.raw_telegram_messages+"]
 
-    # Run dbt deps
+def write_data_version():
+    """
+    Records a new data version marker once the marts have been rebuilt.
+    The API's response cache compares against this marker, so nothing cached
+    before this dbt run is served afterwards.
+    """
+    data_version = uuid.uuid4().hex
+    conn = psycopg2.connect(
+        dbname=os.getenv('POSTGRES_DB'),
+        user=os.getenv('POSTGRES_USER'),
+        password=os.getenv('POSTGRES_PASSWORD'),
+        host=os.getenv('POSTGRES_HOST'),
+        port=os.getenv('POSTGRES_PORT', '5432')
+    )
     try:
-        print("Running dbt deps...")
-        result = subprocess.run(
-            ["dbt", "deps"],
-            capture_output=True, text=True, check=True, cwd=DBT_PROJECT_DIR, env=env_with_vars
-        )
-        print(result.stdout)
-        if result.stderr: print("dbt deps Stderr:\n", result.stderr)
-        print("dbt deps completed.")
-    except subprocess.CalledProcessError as e:
-        print(f"dbt deps failed: {e.returncode}\n{e.stdout}\n{e.stderr}")
-        raise
-    except FileNotFoundError:
-        print("Error: dbt command not found. Ensure dbt is in your PATH.")
-        raise
+        with conn, conn.cursor() as cur:
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS public.pipeline_data_version (
+                id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+                data_version VARCHAR(64) NOT NULL,
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            );
+            """)
+            cur.execute("""
+            INSERT INTO public.pipeline_data_version (id, data_version, updated_at)
+            VALUES (1, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT (id) DO UPDATE
+                SET data_version = EXCLUDED.data_version,
+                    updated_at = EXCLUDED.updated_at;
+            """, (data_version,))
+    finally:
+        conn.close()
+    print(f"Data version marker set to {data_version}.")
+
+def packages_hash():
+    digest = hashlib.sha256()
+    for name in ("packages.yml", "package-lock.yml"):
+        path = os.path.join(DBT_PROJECT_DIR, name)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                digest.update(name.encode() + b"\0" + f.read())
+    return digest.hexdigest()
 
-    # Run dbt run
+def invoke(dbt, args, description):
+    """Runs a dbt command in-process; raises if it fails."""
+    print(f"\nRunning {description}...")
+    result = dbt.invoke(args)
+    if not result.success:
+        raise RuntimeError(f"{description} failed") from result.exception
+    return result
+
+def source_freshness(dbt):
+    """
+    Records the max loaded_at of every source into target/sources.json. A source past its
+    error_after threshold is reported but doesn't stop the build: the models of the other
+    sources (and the stale one's last data) should still be built. Raises on any other failure.
+    """
+    print("\nRunning dbt source freshness...")
+    result = dbt.invoke(["source", "freshness"])
+    if result.success:
+        return
+    results = result.result.results if result.result is not None else []
+    stale = [r.node.name for r in results if r.status == FreshnessStatus.Error]
+    if result.exception is not None or not stale or any(r.status == FreshnessStatus.RuntimeErr for r in results):
+        raise RuntimeError("dbt source freshness failed") from result.exception
+    print(f"Sources past their freshness error threshold: {', '.join(stale)}; building anyway.")
+
+def install_packages():
+    """Runs dbt deps, unless dbt_packages is already installed from the same packages.yml / package-lock.yml."""
+    expected_hash = packages_hash()
     try:
-        print("\nRunning dbt run...")
-        result = subprocess.run(
-            ["dbt", "run"],
-            capture_output=True, text=True, check=True, cwd=DBT_PROJECT_DIR, env=env_with_vars
-        )
-        print(result.stdout)
-        if result.stderr: print("dbt run Stderr:\n", result.stderr)
-        print("dbt run completed successfully.")
-    except subprocess.CalledProcessError as e:
-        print(f"dbt run failed: {e.returncode}\n{e.stdout}\n{e.stderr}")
-        raise
+        with open(PACKAGES_HASH_FILE, 'r') as f:
+            if f.read().strip() == expected_hash:
+                print("dbt packages are up to date, skipping dbt deps.")
+                return
+    except FileNotFoundError:
+        pass
+    invoke(dbtRunner(), ["deps"], "dbt deps")
+    # Hashed again: dbt deps writes package-lock.yml if there was none
+    with open(PACKAGES_HASH_FILE, 'w') as f:
+        f.write(packages_hash())
+
+def run_dbt(start_date=None, end_date=None, full_build=False):
+    """
+    Runs dbt in-process: deps (only when the packages changed), then run and test of the
+    models downstream of sources that received rows since the last build (`dbt source
+    freshness` against the previous build's sources.json), or of every model with
+    full_build or when there is no previous build. start_date / end_date (the scraped dates
+    of the pipeline partitions being built) are passed to the models as vars, and the models
+    that rebuild those partitions are built even if no source received new rows.
+    """
+    print(f"Running dbt commands in: {DBT_PROJECT_DIR}")
+    os.chdir(DBT_PROJECT_DIR) # Same project and profiles lookup as running dbt from the project directory
+    dbt_vars = {name: value for name, value in (("start_date", start_date), ("end_date", end_date)) if value}
+    vars_args = ["--vars", json.dumps(dbt_vars)] if dbt_vars else []
+
+    install_packages()
+    # Parsed once; run and test reuse the manifest
+    manifest = invoke(dbtRunner(), ["parse"] + vars_args, "dbt parse").result
+    dbt = dbtRunner(manifest=manifest)
+
+    source_freshness(dbt)
+    current_sources = os.path.join(DBT_PROJECT_DIR, "target", "sources.json")
+    if full_build or not os.path.exists(os.path.join(STATE_DIR, "sources.json")):
+        print("Building every model.")
+        select_args = []
+    else:
+        # A requested partition rebuild or backfill runs even when no source received new rows
+        selection = CHANGED_SELECTION + (PARTITION_SELECTION if dbt_vars else [])
+        select_args = ["--select"] + selection + ["--state", STATE_DIR]
+        models = invoke(dbt, ["ls", "--resource-type", "model", "--output", "name"] + select_args,
+                        "dbt ls").result
+        if not dbt_vars and (not models or models == ["dim_dates"]):
+            print("No source received new rows since the last build; nothing to do.")
+            return
+        print(f"Building {len(models)} models: {', '.join(models)}")
+
+    invoke(dbt, ["run"] + select_args + vars_args, "dbt run")
+    print("dbt run completed successfully.")
+    # The next build compares against the source freshness this one started from
+    os.makedirs(STATE_DIR, exist_ok=True)
+    shutil.copyfile(current_sources, os.path.join(STATE_DIR, "sources.json"))
+
+    # The marts changed, invalidate the API response cache
+    write_data_version()
 
-    # Run dbt test
+    # Tests of the same selection
     try:
-        print("\nRunning dbt test...")
-        result = subprocess.run(
-            ["dbt", "test"],
-            capture_output=True, text=True, check=True, cwd=DBT_PROJECT_DIR, env=env_with_vars
-        )
-        print(result.stdout)
-        if result.stderr: print("dbt test Stderr:\n", result.stderr)
+        invoke(dbt, ["test"] + select_args + vars_args, "dbt test")
         print("dbt test completed. Check output for results.")
-    except subprocess.CalledProcessError as e:
-        print(f"dbt test failed: {e.returncode}\n{e.stdout}\n{e.stderr}")
+    except RuntimeError as e:
         # Do not raise here, as tests can fail without pipeline failure
         # but log the error clearly.
-        pass # Dagster will show the error in logs even if not raised
+        print(f"{e}: {e.__cause__ or 'see the test results above'}")
 
 if __name__ == "__main__":
-    run_dbt()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the dbt transformations.")
+    parser.add_argument("--start-date", default=None, help="First scraped date (YYYY-MM-DD) being built.")
+    parser.add_argument("--end-date", default=None, help="Last scraped date (YYYY-MM-DD) being built.")
+    parser.add_argument("--full-build", action="store_true",
+                        help="Run and test every model, not only those downstream of sources with new rows.")
+    args = parser.parse_args()
+    run_dbt(start_date=args.start_date, end_date=args.end_date, full_build=args.full_build)
\ No newline at end of file
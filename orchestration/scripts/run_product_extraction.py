@@ -0,0 +1,35 @@
+# orchestration/scripts/run_product_extraction.py
+import subprocess
+import os
+import sys
+
+PRODUCT_EXTRACTION_SCRIPT = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..', '..', 'src', 'extract_product_mentions.py'
+))
+
+# Ensure the .env file is loaded for the POSTGRES_* settings
+from dotenv import load_dotenv
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+load_dotenv(os.path.join(project_root, '.env'), override=True)
+
+# Add project root to sys.path to allow importing utils.*
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.process_runner import PrintLog, run_streaming
+
+def run_product_extraction():
+    print(f"Running product mention extraction: {PRODUCT_EXTRACTION_SCRIPT}")
+    try:
+        run_streaming([sys.executable, PRODUCT_EXTRACTION_SCRIPT] + sys.argv[1:], PrintLog(),
+                      env=os.environ.copy(), relay=True)
+        print("Product mention extraction completed successfully.")
+    except subprocess.CalledProcessError as e:
+        print(f"Product mention extraction failed: {e.returncode}")
+        raise
+    except FileNotFoundError:
+        print(f"Error: Product extraction script not found at {PRODUCT_EXTRACTION_SCRIPT}")
+        raise
+
+if __name__ == "__main__":
+    run_product_extraction()
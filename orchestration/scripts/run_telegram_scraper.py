@@ -13,25 +13,20 @@ from dotenv import load_dotenv
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
 load_dotenv(os.path.join(project_root, '.env'), override=True)
 
+# Add project root to sys.path to allow importing utils.*
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.process_runner import PrintLog, run_streaming
+
 def run_scraper():
     print(f"Running Telegram scraper: {TELEGRAM_SCRAPER_SCRIPT}")
     try:
         # Use sys.executable to ensure the script runs with the active venv Python
-        result = subprocess.run(
-            [sys.executable, TELEGRAM_SCRAPER_SCRIPT],
-            capture_output=True,
-            text=True,
-            check=True,
-            env=os.environ.copy() # Pass current environment variables
-        )
-        print("Scraper Stdout:\n", result.stdout)
-        if result.stderr:
-            print("Scraper Stderr:\n", result.stderr)
+        run_streaming([sys.executable, TELEGRAM_SCRAPER_SCRIPT], PrintLog(), env=os.environ.copy(), relay=True)
         print("Telegram scraper completed successfully.")
     except subprocess.CalledProcessError as e:
         print(f"Telegram scraper failed: {e.returncode}")
-        print(f"Stdout:\n{e.stdout}")
-        print(f"Stderr:\n{e.stderr}")
         raise # Re-raise to indicate failure to Dagster
     except FileNotFoundError:
         print(f"Error: Telegram scraper script not found at {TELEGRAM_SCRAPER_SCRIPT}")
@@ -5,7 +5,7 @@ import sys
 
 # Adjust this path if your actual YOLO detector is elsewhere
 YOLO_DETECTOR_SCRIPT = os.path.abspath(os.path.join(
-    os.path.dirname(__file__), '..', '..', 'src', 'yolo_detector.py' # Assuming yolo_detector is in src
+    os.path.dirname(__file__), '..', '..', 'src', 'yolo_image_analyzer.py'
 ))
 
 # Ensure the .env file is loaded for any necessary configs
@@ -13,24 +13,22 @@ from dotenv import load_dotenv
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
 load_dotenv(os.path.join(project_root, '.env'), override=True)
 
+# Add project root to sys.path to allow importing utils.*
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.process_runner import PrintLog, run_streaming
+
 def run_yolo():
     print(f"Running YOLO object detection: {YOLO_DETECTOR_SCRIPT}")
     try:
-        result = subprocess.run(
-            [sys.executable, YOLO_DETECTOR_SCRIPT],
-            capture_output=True,
-            text=True,
-            check=True,
-            env=os.environ.copy()
-        )
-        print("YOLO Stdout:\n", result.stdout)
-        if result.stderr:
-            print("YOLO Stderr:\n", result.stderr)
+        # Output is streamed as it is printed; relay=True leaves the process in the caller's
+        # process group and passes its progress lines on (see utils/process_runner.py)
+        run_streaming([sys.executable, YOLO_DETECTOR_SCRIPT] + sys.argv[1:], PrintLog(),
+                      env=os.environ.copy(), relay=True)
         print("YOLO detection completed successfully.")
     except subprocess.CalledProcessError as e:
         print(f"YOLO detection failed: {e.returncode}")
-        print(f"Stdout:\n{e.stdout}")
-        print(f"Stderr:\n{e.stderr}")
         raise
     except FileNotFoundError:
         print(f"Error: YOLO detector script not found at {YOLO_DETECTOR_SCRIPT}")
@@ -0,0 +1,149 @@
+# src/compact_lake.py
+import os
+import sys
+import json
+import hashlib
+import logging
+import argparse
+from datetime import datetime, date, timedelta, timezone
+
+# Add project root to sys.path to allow importing utils.*
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.lake import (
+    DEFAULT_CODEC, SEGMENT_SUFFIXES, list_channel_directories, is_message_file, segment_file_name,
+    next_segment_part, write_segment, read_index, write_index
+)
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Base directory for telegram messages (same lake as src/load_to_postgres.py)
+base_directory = os.path.join(project_root, 'data', 'raw', 'telegram_messages')
+
+# Messages per segment; also bounds the memory the loader needs to read one
+SEGMENT_MESSAGES = 50000
+
+# Partitions younger than this are left alone, the scraper may still be writing to them
+MIN_AGE_DAYS = 1
+
+
+def _reject_constant(name):
+    # NaN/Infinity parse in Python but JSONB rejects them
+    raise ValueError(f"{name} is not valid JSON")
+
+
+def read_message_line(file_path):
+    """Returns the message of a lake file re-encoded as a single NDJSON line, or None (logged) if it's unusable."""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            message = json.load(f, parse_constant=_reject_constant)
+    except (OSError, UnicodeDecodeError, ValueError) as e:
+        logging.error(f"Leaving {file_path} uncompacted: {e}")
+        return None
+    return json.dumps(message, ensure_ascii=False, separators=(',', ':'))
+
+
+def compact_channel_directory(channel_path, codec=DEFAULT_CODEC, segment_messages=SEGMENT_MESSAGES,
+                              keep_originals=False):
+    """
+    Rolls the loose <message_id>.json files of one <date>/<channel_name>/ partition into NDJSON
+    segments and records them in the partition's index. Each segment is written and indexed
+    before the files it replaces are removed, so a crash never loses a message (at worst a
+    message is in both a segment and a loose file, which the loader's merge deduplicates).
+    Files whose message is already in an indexed segment (kept with keep_originals, or left by
+    such a crash) aren't compacted again; without keep_originals they're removed.
+    Returns the number of messages compacted.
+    """
+    index = read_index(channel_path)
+    indexed_ids = {message_id for segment in index["segments"] for message_id in segment.get("message_ids", [])}
+
+    file_names = []
+    for file_name in sorted(name for name in os.listdir(channel_path) if is_message_file(name)):
+        if os.path.splitext(file_name)[0] not in indexed_ids:
+            file_names.append(file_name)
+        elif not keep_originals:
+            os.remove(os.path.join(channel_path, file_name))
+    if not file_names:
+        return 0
+
+    part = next_segment_part(channel_path)
+    compacted = 0
+    for start in range(0, len(file_names), segment_messages):
+        lines, message_ids, source_files = [], [], []
+        for file_name in file_names[start:start + segment_messages]:
+            line = read_message_line(os.path.join(channel_path, file_name))
+            if line is None:
+                continue
+            lines.append(line)
+            message_ids.append(os.path.splitext(file_name)[0])
+            source_files.append(file_name)
+        if not lines:
+            continue
+
+        segment_name = segment_file_name(part, codec)
+        data = write_segment(os.path.join(channel_path, segment_name), lines, codec)
+        index["segments"].append({
+            "file": segment_name,
+            "codec": codec,
+            "messages": len(lines),
+            "message_ids": message_ids,
+            "bytes": len(data),
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "compacted_at": datetime.now(timezone.utc).isoformat(),
+        })
+        write_index(channel_path, index)
+
+        if not keep_originals:
+            for file_name in source_files:
+                os.remove(os.path.join(channel_path, file_name))
+        compacted += len(lines)
+        part += 1
+    return compacted
+
+
+def compact_lake(codec=DEFAULT_CODEC, segment_messages=SEGMENT_MESSAGES, min_age_days=MIN_AGE_DAYS,
+                 since=None, partitions=None, keep_originals=False):
+    """Compacts every partition of the lake that is at least min_age_days old."""
+    if not os.path.exists(base_directory):
+        logging.error(f"Base directory for raw data does not exist: {base_directory}.")
+        return
+
+    cutoff = date.today() - timedelta(days=min_age_days)
+    total_messages = 0
+    total_partitions = 0
+    for scraped_date, channel_name, channel_path in list_channel_directories(base_directory, since, partitions):
+        if scraped_date > cutoff:
+            continue
+        compacted = compact_channel_directory(channel_path, codec, segment_messages, keep_originals)
+        if compacted:
+            total_messages += compacted
+            total_partitions += 1
+            logging.info(f"Compacted {compacted} messages of {channel_name} on {scraped_date}.")
+
+    logging.info(f"Compaction finished: {total_messages} messages in {total_partitions} partitions.")
+
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact the per-message JSON files of the data lake into NDJSON segments.")
+    parser.add_argument("--codec", choices=sorted(set(SEGMENT_SUFFIXES.values())), default=DEFAULT_CODEC,
+                        help="Segment compression (zst needs the zstandard package).")
+    parser.add_argument("--segment-messages", type=int, default=SEGMENT_MESSAGES, help="Messages per segment.")
+    parser.add_argument("--min-age-days", type=int, default=MIN_AGE_DAYS,
+                        help="Only compact partitions at least this many days old.")
+    parser.add_argument("--since", type=_parse_date, default=None,
+                        help="Only compact date partitions on or after this date (YYYY-MM-DD).")
+    parser.add_argument("--partition", type=_parse_date, action="append", default=None,
+                        help="Only compact this date partition (YYYY-MM-DD); repeat for several.")
+    parser.add_argument("--keep-originals", action="store_true",
+                        help="Keep the per-message files after they are written to a segment.")
+    args = parser.parse_args()
+    compact_lake(codec=args.codec, segment_messages=args.segment_messages, min_age_days=args.min_age_days,
+                 since=args.since, partitions=set(args.partition) if args.partition else None,
+                 keep_originals=args.keep_originals)
@@ -0,0 +1,157 @@
+# src/detection_sinks.py
+import os
+import sys
+import csv
+import json
+import time
+import glob
+import psycopg2
+from abc import ABC, abstractmethod
+
+# Add project root to sys.path to allow importing utils.*
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from import_yolo_detections import (
+    DETECTION_COLUMNS, create_detection_tables, copy_detection_rows, merge_staged_detections
+)
+from utils import config
+
+# Buffered rows are written out once there are this many, or this many seconds after the last write
+FLUSH_ROWS = 5000
+FLUSH_SECONDS = 30
+# File sinks start a new part file after this many rows
+ROTATE_ROWS = 100000
+
+
+class DetectionSink(ABC):
+    """
+    Receives the detections of each analyzed image and writes them out in batches instead of
+    holding the whole run in memory. After every write the images it covered are checkpointed
+    (see DetectionCache.mark_emitted), so an interrupted run resumes after the last write.
+    A crash between a write and its checkpoint re-sends that batch on resume; the rows are
+    identical (cached detections keep their timestamp), so the importer's upsert absorbs them.
+    Subclasses implement _write(rows), which must be durable when it returns, and _close().
+    """
+
+    def __init__(self, checkpoint, flush_rows=FLUSH_ROWS, flush_seconds=FLUSH_SECONDS):
+        self.checkpoint = checkpoint
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.rows = []
+        self.image_paths = []
+        self.rows_written = 0
+        self.last_flush = time.monotonic()
+
+    def add(self, image_path, rows):
+        self.rows.extend(rows)
+        self.image_paths.append(image_path)
+        if (len(self.rows) >= self.flush_rows or len(self.image_paths) >= self.flush_rows
+                or time.monotonic() - self.last_flush >= self.flush_seconds):
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self._write(self.rows)
+            self.rows_written += len(self.rows)
+        if self.image_paths:
+            self.checkpoint(self.image_paths)
+        self.rows, self.image_paths = [], []
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        """Writes what is still buffered and releases the sink."""
+        try:
+            self.flush()
+        finally:
+            self._close()
+
+    @abstractmethod
+    def _write(self, rows):
+        """Writes out a batch of detection rows; durable when it returns."""
+
+    @abstractmethod
+    def _close(self):
+        """Releases what the sink holds (files, connections)."""
+
+
+class FileSink(DetectionSink):
+    """
+    Appends detections to CSV or NDJSON part files, <run_id>-<part>.<csv|ndjson> in directory,
+    starting a new part every rotate_rows rows. A resumed run starts a new part rather than
+    appending to one that may end in a torn line. The importer reads both formats, and
+    checkpoints each part it imported, so it only reads parts again that were appended to since.
+    """
+
+    def __init__(self, checkpoint, directory, run_id, file_format='csv', rotate_rows=ROTATE_ROWS, **kwargs):
+        super().__init__(checkpoint, **kwargs)
+        self.directory = directory
+        self.run_id = run_id
+        self.file_format = file_format
+        self.rotate_rows = rotate_rows
+        self.file = None
+        self.file_rows = 0
+        os.makedirs(directory, exist_ok=True)
+        self.part = len(glob.glob(os.path.join(directory, f"{run_id}-*.{file_format}")))
+
+    def _open_part(self):
+        self.part += 1
+        path = os.path.join(self.directory, f"{self.run_id}-{self.part:04d}.{self.file_format}")
+        self.file = open(path, 'w', encoding='utf-8', newline='')
+        self.file_rows = 0
+        if self.file_format == 'csv':
+            csv.writer(self.file).writerow(DETECTION_COLUMNS)
+        print(f"Writing detections to {path}")
+
+    def _write(self, rows):
+        while rows:
+            if self.file is None or self.file_rows >= self.rotate_rows:
+                self._close()
+                self._open_part()
+            chunk, rows = rows[:self.rotate_rows - self.file_rows], rows[self.rotate_rows - self.file_rows:]
+            if self.file_format == 'csv':
+                csv.DictWriter(self.file, fieldnames=DETECTION_COLUMNS).writerows(chunk)
+            else:
+                self.file.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in chunk)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file_rows += len(chunk)
+
+    def _close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class PostgresSink(DetectionSink):
+    """
+    COPYs each batch of detections straight into public.yolo_detections_csv, through the
+    importer's staging table and natural-key upsert, one transaction per batch.
+    """
+
+    def __init__(self, checkpoint, **kwargs):
+        super().__init__(checkpoint, **kwargs)
+        self.conn = psycopg2.connect(
+            dbname=config.POSTGRES_DB,
+            user=config.POSTGRES_USER,
+            password=config.POSTGRES_PASSWORD,
+            host=config.POSTGRES_HOST,
+            port=config.POSTGRES_PORT
+        )
+        self.cur = self.conn.cursor()
+        create_detection_tables(self.cur)
+        self.conn.commit()
+
+    def _write(self, rows):
+        try:
+            copy_detection_rows(self.cur, [[row[column] for column in DETECTION_COLUMNS] for row in rows])
+            merge_staged_detections(self.cur)
+            self.conn.commit()
+        except psycopg2.Error:
+            self.conn.rollback()
+            raise
+
+    def _close(self):
+        self.cur.close()
+        self.conn.close()
@@ -0,0 +1,256 @@
+# src/extract_product_mentions.py
+import os
+import sys
+import csv
+import logging
+import argparse
+import psycopg2
+from io import StringIO
+from dotenv import load_dotenv
+from datetime import datetime, timedelta
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Add project root to sys.path to allow importing utils.*
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.product_matcher import ProductMatcher, load_product_dictionary, dictionary_fingerprint
+
+load_dotenv(os.path.join(project_root, '.env'))
+
+DB_NAME = os.getenv("POSTGRES_DB")
+DB_USER = os.getenv("POSTGRES_USER")
+DB_PASSWORD = os.getenv("POSTGRES_PASSWORD")
+DB_HOST = os.getenv("POSTGRES_HOST")
+DB_PORT = os.getenv("POSTGRES_PORT")
+
+# Number of raw messages fetched from the server-side cursor and written per COPY
+BATCH_SIZE = 5000
+
+# Messages edited after they were extracted keep their id and only get a newer ingestion_timestamp,
+# so runs also rescan rows ingested after the last one's latest. A load's rows carry the time its
+# transaction started and can commit after an extraction already read later rows, so the
+# watermark is moved back by this much (like dbt's ingestion_lookback); rescanning is harmless.
+INGESTION_LOOKBACK = timedelta(hours=1)
+
+# Session advisory lock serializing extractions: partition runs (disjoint scraped dates) share it,
+# full and incremental runs, which rescan and may truncate everything, hold it exclusively
+EXTRACTION_LOCK_KEY = 'extract_product_mentions'
+
+
+def create_mention_tables(cursor):
+    """
+    Creates the table holding extracted product mentions (one row per raw message and product)
+    and the single-row state table used to resume extraction where the last run stopped.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS public.raw_product_mentions (
+            raw_id BIGINT NOT NULL,
+            product_keyword VARCHAR(255) NOT NULL,
+            mention_count INTEGER NOT NULL,
+            extracted_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (raw_id, product_keyword)
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS public.product_mention_extraction_state (
+            id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+            last_raw_id BIGINT NOT NULL,
+            last_ingestion_timestamp TIMESTAMP,
+            dictionary_hash VARCHAR(64) NOT NULL,
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cursor.execute("""
+        ALTER TABLE public.product_mention_extraction_state
+        ADD COLUMN IF NOT EXISTS last_ingestion_timestamp TIMESTAMP;
+    """)
+    logging.info("Tables 'public.raw_product_mentions' and 'public.product_mention_extraction_state' ensured to exist.")
+
+
+def read_state(cursor):
+    """
+    Returns (last_raw_id, last_ingestion_timestamp, dictionary_hash), or None before the first run.
+    State saved before last_ingestion_timestamp existed falls back to the time of that run.
+    """
+    cursor.execute("""
+        SELECT last_raw_id, COALESCE(last_ingestion_timestamp, updated_at::TIMESTAMP), dictionary_hash
+        FROM public.product_mention_extraction_state WHERE id = 1;
+    """)
+    return cursor.fetchone()
+
+
+def get_resume_point(cursor, fingerprint, full_refresh=False):
+    """
+    Returns (last_raw_id, last_ingestion_timestamp): the raw_telegram_messages.id to resume after,
+    and the latest ingestion_timestamp already extracted (None if unknown).
+    Starts over (and clears old mentions) when asked to, or when the dictionary changed since the last run.
+    """
+    state = read_state(cursor)
+    if state and state[2] == fingerprint and not full_refresh:
+        return state[0], state[1]
+
+    if state and state[2] != fingerprint:
+        logging.info("Product dictionary changed since the last run; re-extracting all mentions.")
+    cursor.execute("TRUNCATE TABLE public.raw_product_mentions;")
+    return 0, None
+
+
+def save_resume_point(cursor, last_raw_id, last_ingestion_timestamp, fingerprint):
+    cursor.execute(
+        """
+        INSERT INTO public.product_mention_extraction_state
+            (id, last_raw_id, last_ingestion_timestamp, dictionary_hash, updated_at)
+        VALUES (1, %s, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (id) DO UPDATE
+            SET last_raw_id = EXCLUDED.last_raw_id,
+                last_ingestion_timestamp = EXCLUDED.last_ingestion_timestamp,
+                dictionary_hash = EXCLUDED.dictionary_hash,
+                updated_at = EXCLUDED.updated_at;
+        """,
+        (last_raw_id, last_ingestion_timestamp, fingerprint)
+    )
+
+
+def copy_mentions(cursor, mention_rows):
+    """Bulk-writes a batch of (raw_id, product_keyword, mention_count) rows with COPY."""
+    buffer = StringIO()
+    csv.writer(buffer).writerows(mention_rows)
+    buffer.seek(0)
+    cursor.copy_expert(
+        "COPY public.raw_product_mentions (raw_id, product_keyword, mention_count) FROM STDIN WITH (FORMAT CSV);",
+        buffer
+    )
+
+
+def extract_product_mentions(full_refresh=False, dictionary_path=None, partition=None):
+    """
+    Scans new raw Telegram messages once each with the Aho-Corasick product matcher
+    and stores the matches in public.raw_product_mentions for the fct_product_mentions mart.
+    With a partition (scraped date), re-extracts just the messages scraped that day, leaving
+    the resume point alone; the pipeline's daily assets run this way. If the stored mentions
+    weren't extracted with this dictionary (or full_refresh is set), the partition run becomes
+    a full re-extraction, since the other partitions would otherwise keep stale mentions; one
+    run does it while concurrent partition runs wait (see EXTRACTION_LOCK_KEY).
+    """
+    dictionary = load_product_dictionary(dictionary_path)
+    fingerprint = dictionary_fingerprint(dictionary)
+    matcher = ProductMatcher(dictionary)
+    logging.info(f"Loaded product dictionary with {len(dictionary)} products.")
+
+    conn = None
+    try:
+        conn = psycopg2.connect(
+            dbname=DB_NAME,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            host=DB_HOST,
+            port=DB_PORT
+        )
+        conn.autocommit = False
+        cursor = conn.cursor()
+
+        create_mention_tables(cursor)
+        conn.commit()
+        if partition:
+            cursor.execute("SELECT pg_advisory_lock_shared(hashtext(%s));", (EXTRACTION_LOCK_KEY,))
+            state = read_state(cursor)
+            if full_refresh or not state or state[2] != fingerprint:
+                # Only one run re-extracts everything; concurrent partition runs wait for it here
+                # and then find the state up to date
+                cursor.execute("SELECT pg_advisory_unlock_shared(hashtext(%s));", (EXTRACTION_LOCK_KEY,))
+                cursor.execute("SELECT pg_advisory_lock(hashtext(%s));", (EXTRACTION_LOCK_KEY,))
+                state = read_state(cursor)
+            if full_refresh or not state or state[2] != fingerprint:
+                logging.info(f"Mentions aren't up to date with this product dictionary; "
+                             f"scanning all messages instead of just partition {partition}.")
+                partition = None
+        else:
+            cursor.execute("SELECT pg_advisory_lock(hashtext(%s));", (EXTRACTION_LOCK_KEY,))
+        if partition:
+            last_raw_id, last_ingested = state[0], state[1]
+            conn.commit()
+            logging.info(f"Extracting product mentions for raw messages scraped on {partition}.")
+            scope, params = "scraped_date = %s", (partition,)
+        else:
+            last_raw_id, last_ingested = get_resume_point(cursor, fingerprint, full_refresh)
+            conn.commit()
+            if last_ingested is None:
+                logging.info(f"Extracting product mentions for raw messages with id > {last_raw_id}.")
+                scope, params = "id > %s", (last_raw_id,)
+            else:
+                since = last_ingested - INGESTION_LOOKBACK
+                logging.info(f"Extracting product mentions for raw messages with id > {last_raw_id} "
+                             f"or ingested (new or edited) after {since}.")
+                scope, params = "id > %s OR ingestion_timestamp > %s", (last_raw_id, since)
+
+        # Named (server-side) cursor so the message text is streamed instead of loaded at once
+        reader = conn.cursor(name='product_mention_reader')
+        reader.itersize = BATCH_SIZE
+        reader.execute(
+            f"""
+            SELECT id, message_data->>'message', ingestion_timestamp
+            FROM public.raw_telegram_messages
+            WHERE {scope}
+            ORDER BY id;
+            """,
+            params
+        )
+
+        scanned_messages = 0
+        total_mentions = 0
+        while True:
+            rows = reader.fetchmany(BATCH_SIZE)
+            if not rows:
+                break
+
+            mention_rows = []
+            for raw_id, message_text, _ in rows:
+                for keyword, count in matcher.count_mentions(message_text).items():
+                    mention_rows.append((raw_id, keyword, count))
+
+            # Replace whatever an earlier run (partitioned or not) extracted for these messages
+            cursor.execute("DELETE FROM public.raw_product_mentions WHERE raw_id = ANY(%s);",
+                           ([row[0] for row in rows],))
+            if mention_rows:
+                copy_mentions(cursor, mention_rows)
+            scanned_messages += len(rows)
+            total_mentions += len(mention_rows)
+            if not partition:
+                # Rescanned edits have older ids, so the resume point only moves forward
+                last_raw_id = max(last_raw_id, rows[-1][0])
+                ingested = [row[2] for row in rows if row[2] is not None]
+                if last_ingested is not None:
+                    ingested.append(last_ingested)
+                last_ingested = max(ingested, default=None)
+
+        reader.close()
+        # A partition run keeps the resume point where it was (other days may still be pending)
+        save_resume_point(cursor, last_raw_id, last_ingested, fingerprint)
+        conn.commit()
+        logging.info(f"Scanned {scanned_messages} messages and recorded {total_mentions} product mentions.")
+
+    except psycopg2.Error as e:
+        logging.error(f"Database error: {e}")
+        if conn:
+            conn.rollback()
+        raise
+    finally:
+        if conn:
+            conn.close()
+            logging.info("PostgreSQL connection closed.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract product mentions from raw Telegram messages.")
+    parser.add_argument("--full-refresh", action="store_true",
+                        help="Discard previously extracted mentions and rescan every raw message.")
+    parser.add_argument("--dictionary", default=None,
+                        help="Path to a product dictionary JSON file (defaults to PRODUCT_DICTIONARY_PATH).")
+    parser.add_argument("--partition", type=lambda value: datetime.strptime(value, '%Y-%m-%d').date(), default=None,
+                        help="Only (re-)extract the messages scraped on this date (YYYY-MM-DD).")
+    args = parser.parse_args()
+    extract_product_mentions(full_refresh=args.full_refresh, dictionary_path=args.dictionary, partition=args.partition)
@@ -1,74 +1,334 @@
-import psycopg2
+# src/import_yolo_detections.py
+import os
+import sys
 import csv
+import json
+import argparse
+import psycopg2
 from io import StringIO
 
-# Database connection parameters (ensure these match your Neon credentials EXACTLY)
-POSTGRES_DB = 'neondb'
-POSTGRES_USER = 'neondb_owner'
-POSTGRES_PASSWORD = 'npg_3AdCgPQDvcz1'
-POSTGRES_HOST = 'ep-dry-bonus-a2r95tms-pooler.eu-central-1.aws.neon.tech'
-POSTGRES_PORT = '5432'
-
-# Path to your CSV file
-CSV_FILE_PATH = r'D:\10academy\week7\kara_solutions_ethiopian_medical_insights\data\processed\yolo_detections.csv'
-
-conn = None
-cur = None
-
-try:
-    # Connect to your Neon database
-    conn = psycopg2.connect(
-        dbname=POSTGRES_DB,
-        user=POSTGRES_USER,
-        password=POSTGRES_PASSWORD,
-        host=POSTGRES_HOST,
-        port=POSTGRES_PORT
+# Add project root to sys.path to allow importing utils.*
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+# Connection settings come from the environment / .env (see utils/config.py)
+from utils import config
+
+# Part files written by src/yolo_image_analyzer.py (see src/detection_sinks.py)
+DEFAULT_DETECTIONS_PATH = os.path.join(project_root, 'data', 'processed', 'yolo_detections')
+
+DETECTION_COLUMNS = ['message_id', 'channel_name', 'detected_object_class', 'confidence_score',
+                     'detection_timestamp', 'box_index']
+
+# A detection is identified by its Telegram message (ids are per channel) and its position among
+# the boxes of the image (the same columns dbt builds image_detection_pk from in
+# fct_image_detections). box_index tells apart boxes of one image that share a class. A message
+# keeps the boxes of its latest analysis only: re-analyzing an image (--refresh-cache, a new
+# model) replaces its detections, see merge_staged_detections.
+DETECTION_KEY = ['channel_name', 'message_id', 'box_index']
+MESSAGE_KEY = ['channel_name', 'message_id']
+# Unique indexes on earlier keys, dropped once DETECTION_KEY's is in place
+LEGACY_KEY_INDEXES = ['uq_yolo_detections_csv_detection_key', 'uq_yolo_detections_csv_box_key',
+                      'uq_yolo_detections_csv_message_key']
+
+# Files already imported, by absolute path with the size and mtime they had, so a re-run only
+# reads the part files that are new or were appended to since
+IMPORTS_TABLE = 'public.yolo_detection_imports'
+
+# NDJSON lines converted and sent per COPY
+NDJSON_BATCH_SIZE = 5000
+
+CSV_EXTENSIONS = ('.csv',)
+NDJSON_EXTENSIONS = ('.ndjson', '.jsonl')
+
+
+def create_detection_tables(cur):
+    """
+    Ensures the detections table, its unique index on DETECTION_KEY and the session's staging table exist.
+    Rows from before detections carried their Telegram message (keyed by a hash of the image path,
+    which no message joins on) are dropped when the index is created; the analyzer re-emits every
+    image in its scope from its detection cache, so a run without --partition restores them.
+    So are boxes of a message's earlier analyses, which older imports kept next to the latest one.
+    loaded_at records when a row was last written, which is what dbt's source freshness follows:
+    cached detections keep their original detection_timestamp, so that can't tell new rows apart.
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS public.yolo_detections_csv (
+            message_id VARCHAR,
+            channel_name VARCHAR,
+            detected_object_class VARCHAR,
+            confidence_score NUMERIC,
+            detection_timestamp TIMESTAMP,
+            box_index INTEGER,
+            loaded_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+    """)
+    cur.execute("""
+        ALTER TABLE public.yolo_detections_csv
+        ADD COLUMN IF NOT EXISTS loaded_at TIMESTAMPTZ NOT NULL DEFAULT now();
+    """)
+    cur.execute("SELECT to_regclass('public.uq_yolo_detections_csv_message_box_key');")
+    if cur.fetchone()[0] is None:
+        cur.execute("""
+            ALTER TABLE public.yolo_detections_csv
+            ADD COLUMN IF NOT EXISTS channel_name VARCHAR,
+            ADD COLUMN IF NOT EXISTS box_index INTEGER;
+        """)
+        cur.execute("DELETE FROM public.yolo_detections_csv WHERE channel_name IS NULL OR box_index IS NULL;")
+        if cur.rowcount:
+            print(f"Removed {cur.rowcount} detections keyed by image path hash instead of Telegram message; "
+                  f"run src/yolo_image_analyzer.py without --partition to write them again from its cache.")
+        cur.execute(f"""
+            DELETE FROM public.yolo_detections_csv d
+            USING (
+                SELECT {', '.join(MESSAGE_KEY)}, MAX(detection_timestamp) AS detection_timestamp
+                FROM public.yolo_detections_csv
+                GROUP BY {', '.join(MESSAGE_KEY)}
+            ) latest
+            WHERE {' AND '.join(f'd.{column} = latest.{column}' for column in MESSAGE_KEY)}
+                AND d.detection_timestamp < latest.detection_timestamp;
+        """)
+        if cur.rowcount:
+            print(f"Removed {cur.rowcount} detections superseded by a later analysis of their image.")
+        cur.execute(f"""
+            CREATE UNIQUE INDEX uq_yolo_detections_csv_message_box_key
+            ON public.yolo_detections_csv ({', '.join(DETECTION_KEY)});
+        """)
+        for index_name in LEGACY_KEY_INDEXES:
+            cur.execute(f"DROP INDEX IF EXISTS public.{index_name};")
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {IMPORTS_TABLE} (
+            file_path TEXT PRIMARY KEY,
+            file_size BIGINT NOT NULL,
+            mtime_ns BIGINT NOT NULL,
+            imported_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+    """)
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS yolo_detections_staging (
+            message_id VARCHAR,
+            channel_name VARCHAR,
+            detected_object_class VARCHAR,
+            confidence_score NUMERIC,
+            detection_timestamp TIMESTAMP,
+            box_index INTEGER
+        ) ON COMMIT DELETE ROWS;
+    """)
+
+
+def is_legacy_file(columns):
+    """Files written before detections carried their Telegram message and box_index lack key columns."""
+    return not set(DETECTION_KEY) <= set(columns)
+
+
+def copy_csv_file(cur, path):
+    """
+    Streams a CSV file into the staging table with COPY ... HEADER; psycopg2 reads the file in
+    chunks, so it's never held in memory. The header only decides the column order.
+    Returns False, without copying, for legacy files.
+    """
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        header = next(csv.reader([f.readline()]), [])
+        unknown = [column for column in header if column not in DETECTION_COLUMNS]
+        if unknown:
+            raise ValueError(f"{path}: expected columns {DETECTION_COLUMNS}, found {header}")
+        if is_legacy_file(header):
+            return False
+        f.seek(0)
+        cur.copy_expert(
+            f"COPY yolo_detections_staging ({', '.join(header)}) FROM STDIN WITH (FORMAT CSV, HEADER);",
+            f
+        )
+    return True
+
+
+def copy_detection_rows(cur, rows):
+    buffer = StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cur.copy_expert(
+        f"COPY yolo_detections_staging ({', '.join(DETECTION_COLUMNS)}) FROM STDIN WITH (FORMAT CSV);",
+        buffer
     )
-    cur = conn.cursor()
-
-    print("Attempting to import data into 'yolo_detections_csv' table using copy_expert...")
-
-    # Prepare data for copy_expert: Read CSV, skip header, and create a StringIO object
-    with open(CSV_FILE_PATH, 'r') as f:
-        # Read the entire content of the file
-        content = f.read()
-        # Split into lines, keeping line endings, then join from the second line (skipping header)
-        lines = content.splitlines(True) # 'True' keeps newline characters
-        data_without_header = "".join(lines[1:])
-
-    # Create a file-like object in memory from the processed string
-    csv_file_like_object = StringIO(data_without_header)
-
-    # Use copy_expert for efficient bulk import with a raw COPY command
-    # This provides the exact COPY SQL command to PostgreSQL.
-    copy_sql = """
-        COPY public.yolo_detections_csv(message_id, detected_object_class, confidence_score, detection_timestamp)
-        FROM STDIN WITH (FORMAT CSV);
+
+
+def copy_ndjson_file(cur, path):
+    """
+    Streams an NDJSON file (one detection object per line) into the staging table in batches.
+    Returns False, without copying, for legacy files (judged by their first detection).
+    """
+    rows = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                detection = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}, line {line_number}: {e}")
+            if not rows and is_legacy_file(detection):
+                return False
+            rows.append([detection.get(column) for column in DETECTION_COLUMNS])
+            if len(rows) >= NDJSON_BATCH_SIZE:
+                copy_detection_rows(cur, rows)
+                rows = []
+    if rows:
+        copy_detection_rows(cur, rows)
+    return True
+
+
+def merge_staged_detections(cur):
+    """
+    Writes the staged detections, keeping each message's latest analysis: a message staged with a
+    later detection_timestamp than it has loses its earlier boxes, and its new boxes are upserted on
+    DETECTION_KEY. Re-importing a file (or an older one) changes nothing. Returns the number of rows
+    written or removed.
+    """
+    key = ', '.join(DETECTION_KEY)
+    staged_key = ', '.join(f'd.{column}' for column in DETECTION_KEY)
+    message_key = ', '.join(MESSAGE_KEY)
+    joined_on = ' AND '.join(f'd.{column} = staged.{column}' for column in MESSAGE_KEY)
+    latest_staged = f"""
+        SELECT {message_key}, MAX(detection_timestamp) AS detection_timestamp
+        FROM yolo_detections_staging
+        GROUP BY {message_key}
+    """
+    cur.execute(f"""
+        DELETE FROM public.yolo_detections_csv d
+        USING ({latest_staged}) staged
+        WHERE {joined_on}
+            AND d.detection_timestamp < staged.detection_timestamp;
+    """)
+    removed = cur.rowcount
+    cur.execute(f"""
+        INSERT INTO public.yolo_detections_csv ({', '.join(DETECTION_COLUMNS)})
+        SELECT DISTINCT ON ({staged_key}) {', '.join(f'd.{column}' for column in DETECTION_COLUMNS)}
+        FROM yolo_detections_staging d
+        JOIN ({latest_staged}) staged
+            ON {joined_on} AND d.detection_timestamp = staged.detection_timestamp
+        -- An older analysis than the one loaded (e.g. an old part file imported again) is skipped
+        WHERE NOT EXISTS (
+            SELECT 1 FROM public.yolo_detections_csv loaded
+            WHERE {' AND '.join(f'loaded.{column} = staged.{column}' for column in MESSAGE_KEY)}
+                AND loaded.detection_timestamp > staged.detection_timestamp
+        )
+        ORDER BY {staged_key}, d.confidence_score DESC
+        -- Left to conflict: boxes of the analysis already loaded (earlier ones were deleted above)
+        ON CONFLICT ({key}) DO UPDATE
+            SET detected_object_class = EXCLUDED.detected_object_class,
+                confidence_score = EXCLUDED.confidence_score,
+                loaded_at = now()
+            WHERE (yolo_detections_csv.detected_object_class, yolo_detections_csv.confidence_score)
+                IS DISTINCT FROM (EXCLUDED.detected_object_class, EXCLUDED.confidence_score);
+    """)
+    return removed + cur.rowcount
+
+
+def read_imported_files(cur):
+    """(file_size, mtime_ns) of every file imported so far, by absolute path."""
+    cur.execute(f"SELECT file_path, file_size, mtime_ns FROM {IMPORTS_TABLE};")
+    return {file_path: (file_size, mtime_ns) for file_path, file_size, mtime_ns in cur.fetchall()}
+
+
+def record_imported_file(cur, path, file_stat):
+    """Checkpoints an imported file, in the transaction that merged its rows."""
+    cur.execute(f"""
+        INSERT INTO {IMPORTS_TABLE} (file_path, file_size, mtime_ns)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (file_path) DO UPDATE
+            SET file_size = EXCLUDED.file_size, mtime_ns = EXCLUDED.mtime_ns, imported_at = now();
+    """, (path, file_stat.st_size, file_stat.st_mtime_ns))
+
+
+def expand_paths(paths):
+    """Expands directories to the detection files (CSV / NDJSON) directly inside them."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.lower().endswith(CSV_EXTENSIONS + NDJSON_EXTENSIONS)
+            )
+        else:
+            files.append(path)
+    return files
+
+
+def import_detections(paths, reimport=False):
+    """
+    Imports detection files into public.yolo_detections_csv, one transaction per file:
+    stream into the staging table, then upsert. Files already imported with their current size
+    and mtime are skipped (a part file the analyzer has since appended to is read again), unless
+    reimport is set. Safe to re-run on the same files.
     """
-    # We specify FORMAT CSV. We are sending data via STDIN (standard input)
-    # from the csv_file_like_object. 'WITH HEADER' is not used because we
-    # manually skipped the header line when preparing data_without_header.
-
-    cur.copy_expert(copy_sql, csv_file_like_object)
-
-    conn.commit() # Commit the data insertion
-    print("Data imported successfully into 'yolo_detections_csv' table using copy_expert.")
-
-except psycopg2.Error as e:
-    if conn:
-        conn.rollback() # Rollback any changes in case of a database error
-    print(f"Database error occurred: {e}")
-    if e.diag:
-        print(f"SQLSTATE: {e.diag.sqlstate}")
-        print(f"Message Detail: {e.diag.message_detail}")
-        print(f"Message Hint: {e.diag.message_hint}")
-except Exception as e:
-    print(f"An unexpected error occurred: {e}")
-
-finally:
-    # Ensure cursor and connection are closed
-    if cur:
-        cur.close()
-    if conn:
-        conn.close()
-    print("Database connection closed.")
\ No newline at end of file
+    conn = None
+    cur = None
+    try:
+        conn = psycopg2.connect(
+            dbname=config.POSTGRES_DB,
+            user=config.POSTGRES_USER,
+            password=config.POSTGRES_PASSWORD,
+            host=config.POSTGRES_HOST,
+            port=config.POSTGRES_PORT
+        )
+        cur = conn.cursor()
+        create_detection_tables(cur)
+        conn.commit()
+        imported = {} if reimport else read_imported_files(cur)
+
+        skipped = 0
+        for path in map(os.path.abspath, expand_paths(paths)):
+            file_stat = os.stat(path)
+            if imported.get(path) == (file_stat.st_size, file_stat.st_mtime_ns):
+                skipped += 1
+                continue
+            print(f"Importing detections from {path}...")
+            if path.lower().endswith(NDJSON_EXTENSIONS):
+                copied = copy_ndjson_file(cur, path)
+            else:
+                copied = copy_csv_file(cur, path)
+            if not copied:
+                print(f"Skipping {path}: written before detections carried their Telegram message "
+                      f"(re-run src/yolo_image_analyzer.py to write them again).")
+                continue
+            written = merge_staged_detections(cur)
+            record_imported_file(cur, path, file_stat)
+            conn.commit() # Also empties the staging table (ON COMMIT DELETE ROWS)
+            print(f"Imported {path}: {written} detections inserted, updated or replaced.")
+
+        if skipped:
+            print(f"Skipped {skipped} files already imported (use --reimport to read them again).")
+        print("Detections imported successfully into 'yolo_detections_csv'.")
+
+    except psycopg2.Error as e:
+        if conn:
+            conn.rollback() # Rollback any changes in case of a database error
+        print(f"Database error occurred: {e}")
+        if e.diag:
+            print(f"SQLSTATE: {e.diag.sqlstate}")
+            print(f"Message Detail: {e.diag.message_detail}")
+            print(f"Message Hint: {e.diag.message_hint}")
+        raise
+    except (OSError, ValueError) as e:
+        if conn:
+            conn.rollback()
+        print(f"Could not import detections: {e}")
+        raise
+    finally:
+        # Ensure cursor and connection are closed
+        if cur:
+            cur.close()
+        if conn:
+            conn.close()
+        print("Database connection closed.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import YOLO detection files (CSV or NDJSON) into PostgreSQL.")
+    parser.add_argument("paths", nargs="*", default=[DEFAULT_DETECTIONS_PATH],
+                        help="Detection files, or directories of them (defaults to data/processed/yolo_detections/).")
+    parser.add_argument("--reimport", action="store_true",
+                        help="Read files again even if they were already imported unchanged.")
+    args = parser.parse_args()
+    import_detections(args.paths, reimport=args.reimport)
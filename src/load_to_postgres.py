@@ -1,10 +1,40 @@
 # src/load_to_postgres.py
 import os
+import sys
+import csv
 import json
+import queue
+import hashlib
 import logging
+import argparse
+import threading
 import psycopg2
+import psycopg2.extras
+from io import StringIO
 from dotenv import load_dotenv
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+# Add project root to sys.path to allow importing utils.*
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.lake import list_channel_directories, is_message_file, segment_codec, decompress
+
+# orjson decodes several times faster than the json module; optional, json is the fallback
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _JSON_ERRORS = (orjson.JSONDecodeError, json.JSONDecodeError)
+except ImportError:
+    orjson = None
+    _JSON_ERRORS = (json.JSONDecodeError, ValueError)
+
+    def _reject_constant(name):
+        # NaN/Infinity parse in Python but JSONB rejects them (orjson refuses them as well)
+        raise ValueError(f"{name} is not valid JSON")
+
+    def _json_loads(text):
+        return json.loads(text, parse_constant=_reject_constant)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -28,6 +58,17 @@ project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) #
 # Base directory for telegram messages
 base_directory = os.path.join(project_root, 'data', 'raw', 'telegram_messages')
 
+# Parsed messages buffered per COPY into the staging table
+BATCH_SIZE = 5000
+
+# Parallel mode: decoded batches waiting for a DB writer, per writer connection.
+# Bounds memory when reading outpaces the database.
+QUEUE_BATCHES_PER_WRITER = 4
+
+# A message is identified by its channel, its Telegram message ID and the day it was scraped.
+# The unique index on this expression is what makes re-running the loader idempotent.
+MESSAGE_KEY = "(channel_name, ((message_data->>'id')::BIGINT), scraped_date)"
+
 logging.info(f"Project Root: {project_root}")
 logging.info(f"Base Directory for Raw Data: {base_directory}")
 
@@ -46,118 +87,511 @@ def create_raw_table(cursor):
                 ingestion_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             );
         """)
+        # Incremental dbt models look up the rows ingested since their last build, and the
+        # partitioned pipeline steps the rows of one scraped date
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS ix_raw_telegram_messages_ingestion_timestamp
+            ON public.raw_telegram_messages (ingestion_timestamp);
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS ix_raw_telegram_messages_scraped_date
+            ON public.raw_telegram_messages (scraped_date);
+        """)
         logging.info("Table 'public.raw_telegram_messages' ensured to exist.")
     except Exception as e:
         logging.error(f"Error creating public.raw_telegram_messages table: {e}")
         raise
 
-def insert_message_data(cursor, message_data, channel_name, scraped_date):
+def ensure_message_key_index(cursor):
+    """
+    Creates the unique index on MESSAGE_KEY that the bulk merge relies on.
+    Tables loaded before the index existed may hold duplicates (the old per-file check
+    could race or miss), so those are removed first, keeping the earliest copy.
+    """
+    cursor.execute("SELECT to_regclass('public.uq_raw_telegram_messages_message_key');")
+    if cursor.fetchone()[0] is not None:
+        return
+
+    cursor.execute("""
+        DELETE FROM public.raw_telegram_messages later
+        USING public.raw_telegram_messages earlier
+        WHERE later.id > earlier.id
+          AND later.channel_name = earlier.channel_name
+          AND (later.message_data->>'id')::BIGINT = (earlier.message_data->>'id')::BIGINT
+          AND later.scraped_date = earlier.scraped_date;
+    """)
+    if cursor.rowcount:
+        logging.info(f"Removed {cursor.rowcount} duplicate raw messages before creating the unique index.")
+    cursor.execute(f"""
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_raw_telegram_messages_message_key
+        ON public.raw_telegram_messages {MESSAGE_KEY};
+    """)
+    logging.info("Unique index 'uq_raw_telegram_messages_message_key' ensured to exist.")
+
+def create_manifest_table(cursor):
+    """
+    Creates the ingestion manifest: one row per lake file that has been loaded, with the size,
+    mtime and SHA-256 it had at the time. Later runs skip files whose size and mtime still match,
+    without opening them.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS public.raw_ingestion_manifest (
+            file_path TEXT PRIMARY KEY, -- <date>/<channel_name>/<file>, relative to the telegram_messages lake
+            scraped_date DATE NOT NULL,
+            file_size BIGINT NOT NULL,
+            mtime_ns BIGINT NOT NULL,
+            content_hash CHAR(64) NOT NULL,
+            ingested_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS ix_raw_ingestion_manifest_scraped_date
+        ON public.raw_ingestion_manifest (scraped_date);
+    """)
+    logging.info("Table 'public.raw_ingestion_manifest' ensured to exist.")
+
+def load_manifest(cursor, scraped_date):
+    """Returns {file_path: (file_size, mtime_ns, content_hash)} for the files of one date partition."""
+    cursor.execute(
+        """
+        SELECT file_path, file_size, mtime_ns, content_hash
+        FROM public.raw_ingestion_manifest
+        WHERE scraped_date = %s;
+        """,
+        (scraped_date,)
+    )
+    return {file_path: (size, mtime_ns, content_hash) for file_path, size, mtime_ns, content_hash in cursor}
+
+def record_manifest(cursor, records):
+    """Upserts the manifest rows of a batch of file records (see read_channel_directory)."""
+    psycopg2.extras.execute_values(
+        cursor,
+        """
+        INSERT INTO public.raw_ingestion_manifest (file_path, scraped_date, file_size, mtime_ns, content_hash)
+        VALUES %s
+        ON CONFLICT (file_path) DO UPDATE
+            SET scraped_date = EXCLUDED.scraped_date,
+                file_size = EXCLUDED.file_size,
+                mtime_ns = EXCLUDED.mtime_ns,
+                content_hash = EXCLUDED.content_hash,
+                ingested_at = CURRENT_TIMESTAMP;
+        """,
+        [(file_path, scraped_date, size, mtime_ns, content_hash)
+         for _, _, scraped_date, file_path, size, mtime_ns, content_hash in records],
+        page_size=BATCH_SIZE
+    )
+
+def create_staging_table(cursor):
+    """
+    Session-local staging table that COPY fills and the merge drains. staged_order keeps the
+    read order, so when a batch holds a message twice the copy read last wins.
     """
-    Inserts a single message's JSON data into the raw_telegram_messages table.
-    Checks for duplicates based on original Telegram message ID, channel name, and scraped date.
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS raw_telegram_messages_staging (
+            message_data JSONB,
+            channel_name VARCHAR(255),
+            scraped_date DATE,
+            staged_order BIGSERIAL
+        ) ON COMMIT DELETE ROWS;
+    """)
+
+def read_message_file(file_path):
+    """
+    Returns (message_json, content_hash) for a lake file, with the JSON as text ready for COPY.
+    The text is only decoded to validate it (Postgres parses it again into JSONB), so it isn't re-encoded.
+    Returns (None, None), and logs why, for files that can't be loaded.
     """
     try:
-        original_telegram_message_id = message_data.get('id')
-        if original_telegram_message_id is not None:
-            # Check for existing message to prevent duplicates
-            cursor.execute(
-                """
-                SELECT 1 FROM public.raw_telegram_messages
-                WHERE (message_data->>'id')::BIGINT = %s
-                  AND channel_name = %s
-                  AND scraped_date = %s;
-                """,
-                (original_telegram_message_id, channel_name, scraped_date)
-            )
-            if cursor.fetchone():
-                logging.debug(f"Skipping duplicate message ID {original_telegram_message_id} for channel {channel_name} on {scraped_date}.")
-                return
+        with open(file_path, 'rb') as f:
+            content = f.read()
+        message_json = content.decode('utf-8')
+        _json_loads(message_json)
+    except _JSON_ERRORS as e:
+        logging.error(f"Error decoding JSON from {file_path}: {e}")
+        return None, None
+    except (OSError, UnicodeDecodeError) as e:
+        logging.error(f"Error reading file {file_path}: {e}")
+        return None, None
+
+    # JSONB rejects NUL characters; one such file must not fail the whole COPY batch
+    if "\\u0000" in message_json:
+        logging.error(f"Skipping {file_path}: message contains a NUL character, which JSONB can't store.")
+        return None, None
+    return message_json, hashlib.sha256(content).hexdigest()
+
+def read_segment_file(file_path, codec):
+    """
+    Returns (message_jsons, content_hash) for a compacted NDJSON segment (see src/compact_lake.py),
+    one JSON text per message. Lines that can't be loaded are logged and left out; a segment that
+    can't be read at all returns (None, None) and is retried on the next run.
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            content = f.read()
+        lines = decompress(content, codec).decode('utf-8').splitlines()
+    except (OSError, EOFError, UnicodeDecodeError, RuntimeError) as e:
+        logging.error(f"Error reading segment {file_path}: {e}")
+        return None, None
+    except Exception as e:
+        # Corrupt compressed data (gzip.BadGzipFile, zstandard.ZstdError)
+        logging.error(f"Error decompressing segment {file_path}: {e}")
+        return None, None
+
+    message_jsons = []
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            _json_loads(line)
+        except _JSON_ERRORS as e:
+            logging.error(f"Error decoding JSON from {file_path}, line {line_number}: {e}")
+            continue
+        if "\\u0000" in line:
+            logging.error(f"Skipping {file_path}, line {line_number}: message contains a NUL character, which JSONB can't store.")
+            continue
+        message_jsons.append(line)
+    return tuple(message_jsons), hashlib.sha256(content).hexdigest()
+
+def plan_channel_directories(cursor, directories, stats, rescan=False):
+    """
+    Narrows each channel directory down to the files that still need loading, using the manifest.
+    Segments written by src/compact_lake.py are planned like any other file.
+    Yields (scraped_date, channel_name, channel_path, files) with files as
+    (file_name, file_size, mtime_ns, known_hash) for new files and files whose size or mtime
+    changed (known_hash is their manifest hash, or None if they are new).
+    Unchanged files are only counted, in stats["unchanged"]. rescan ignores the manifest.
+    """
+    manifest, manifest_date = {}, None
+    for scraped_date, channel_name, channel_path in directories:
+        if scraped_date != manifest_date:
+            # The manifest is read one date partition at a time, so its size never matters
+            manifest = {} if rescan else load_manifest(cursor, scraped_date)
+            manifest_date = scraped_date
+
+        files = []
+        found_files = False
+        with os.scandir(channel_path) as entries:
+            for entry in entries:
+                if not (is_message_file(entry.name) or segment_codec(entry.name)) or not entry.is_file():
+                    continue
+                found_files = True
+                file_stat = entry.stat()
+                known = manifest.get(f"{scraped_date.isoformat()}/{channel_name}/{entry.name}")
+                if known and known[0] == file_stat.st_size and known[1] == file_stat.st_mtime_ns:
+                    stats["unchanged"] += 1
+                    continue
+                files.append((entry.name, file_stat.st_size, file_stat.st_mtime_ns, known[2] if known else None))
+
+        if not found_files:
+            logging.warning(f"No JSON message files or segments found in {channel_path}.")
+        if files:
+            yield scraped_date, channel_name, channel_path, sorted(files)
+
+def read_channel_directory(scraped_date, channel_name, channel_path, files):
+    """
+    Reads and validates the given files of one channel directory.
+    Returns file records (message_jsons, channel_name, scraped_date, file_path, file_size, mtime_ns, content_hash),
+    message_jsons holding the message of a JSON file, or all messages of a segment.
+    message_jsons is None for a file that was only touched (same content hash as in the manifest),
+    so it just gets its manifest row refreshed. Files that can't be loaded get no record and are
+    retried on the next run. Module-level so the process pool can run it.
+    """
+    records = []
+    for file_name, file_size, mtime_ns, known_hash in files:
+        codec = segment_codec(file_name)
+        if codec:
+            message_jsons, content_hash = read_segment_file(os.path.join(channel_path, file_name), codec)
+        else:
+            message_json, content_hash = read_message_file(os.path.join(channel_path, file_name))
+            message_jsons = (message_json,)
+        if content_hash is None:
+            continue
+        if content_hash == known_hash:
+            message_jsons = None
+        records.append((message_jsons, channel_name, scraped_date,
+                        f"{scraped_date.isoformat()}/{channel_name}/{file_name}", file_size, mtime_ns, content_hash))
+    return records
 
-        cursor.execute(
-            """
+def copy_and_merge(cursor, rows):
+    """
+    Bulk-loads (message_json, channel_name, scraped_date) rows: COPY into the staging table,
+    then one INSERT ... ON CONFLICT into raw_telegram_messages on the unique index, instead of
+    a lookup per file. Messages already loaded come from files whose content changed (or a
+    rescan): their message_data is replaced if it differs (e.g. new view counts) and their
+    ingestion_timestamp bumped, so the incremental dbt models pick them up; identical ones are skipped.
+    Returns (new rows, updated rows).
+    """
+    buffer = StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(
+        "COPY raw_telegram_messages_staging (message_data, channel_name, scraped_date) FROM STDIN WITH (FORMAT CSV);",
+        buffer
+    )
+    cursor.execute(f"""
+        WITH merged AS (
             INSERT INTO public.raw_telegram_messages (message_data, channel_name, scraped_date)
-            VALUES (%s, %s, %s);
-            """,
-            (json.dumps(message_data), channel_name, scraped_date)
+            SELECT DISTINCT ON {MESSAGE_KEY} message_data, channel_name, scraped_date
+            FROM raw_telegram_messages_staging
+            ORDER BY channel_name, (message_data->>'id')::BIGINT, scraped_date, staged_order DESC
+            ON CONFLICT {MESSAGE_KEY} DO UPDATE
+                SET message_data = EXCLUDED.message_data,
+                    ingestion_timestamp = CURRENT_TIMESTAMP
+                WHERE raw_telegram_messages.message_data IS DISTINCT FROM EXCLUDED.message_data
+            RETURNING xmax = 0 AS inserted
         )
-        logging.debug(f"Inserted message ID {original_telegram_message_id} from channel {channel_name}")
+        SELECT COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted) FROM merged;
+    """)
+    inserted, updated = cursor.fetchone()
+    cursor.execute("TRUNCATE raw_telegram_messages_staging;")
+    return inserted, updated
+
+def write_batch(cursor, records):
+    """
+    Loads a batch of file records and marks the files as ingested in the manifest, in the
+    caller's transaction, so a file is only ever recorded together with its message.
+    Returns (new messages, updated messages).
+    """
+    rows = [(message_json, channel_name, scraped_date)
+            for message_jsons, channel_name, scraped_date, *_ in records if message_jsons is not None
+            for message_json in message_jsons]
+    written = copy_and_merge(cursor, rows) if rows else (0, 0)
+    record_manifest(cursor, records)
+    return written
+
+def add_written(totals, written):
+    inserted, updated = written
+    totals["inserted"] += inserted
+    totals["updated"] += updated
+
+def record_messages(record):
+    return len(record[0]) if record[0] else 0
+
+def split_full_batches(records):
+    """
+    Splits file records into batches of about BATCH_SIZE messages (a segment's messages always stay
+    in one batch, so it's recorded in the manifest together with all of them).
+    Returns (full_batches, remaining_records).
+    """
+    batches, start, size = [], 0, 0
+    for i, record in enumerate(records):
+        size += max(1, record_messages(record))
+        if size >= BATCH_SIZE:
+            batches.append(records[start:i + 1])
+            start, size = i + 1, 0
+    return batches, records[start:]
+
+def connect():
+    return psycopg2.connect(
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        port=DB_PORT
+    )
+
+def load_serial(conn, planned_directories):
+    """Reads and loads the planned channel directories one by one, committing after each date."""
+    cursor = conn.cursor()
+    create_staging_table(cursor)
+    read_files = 0
+    read_messages = 0
+    written = {"inserted": 0, "updated": 0}
+    current_date = None
+    records = []
+    for scraped_date, channel_name, channel_path, files in planned_directories:
+        if current_date is not None and scraped_date != current_date:
+            if records:
+                add_written(written, write_batch(cursor, records))
+                records = []
+            conn.commit() # Commit after each date directory to reduce transaction size
+            logging.info(f"Committed data for date: {current_date}")
+        current_date = scraped_date
+
+        logging.info(f"Processing directory: {channel_path} (Channel: {channel_name}, Date: {scraped_date}, "
+                     f"{len(files)} new or changed files)")
+        channel_records = read_channel_directory(scraped_date, channel_name, channel_path, files)
+        read_files += len(channel_records)
+        read_messages += sum(record_messages(record) for record in channel_records)
+        records.extend(channel_records)
+        full_batches, records = split_full_batches(records)
+        for batch in full_batches:
+            add_written(written, write_batch(cursor, batch))
+
+    if records:
+        add_written(written, write_batch(cursor, records))
+    if current_date is not None:
+        conn.commit()
+        logging.info(f"Committed data for date: {current_date}")
+    cursor.close()
+    return read_files, read_messages, written
+
+def _write_batches(batches, totals, totals_lock, failures):
+    """
+    DB writer thread: drains decoded batches from the queue over its own connection,
+    committing each one. After a failure it keeps draining (without writing) so the
+    reader never blocks on a full queue.
+    """
+    conn = None
+    try:
+        conn = connect()
+        cursor = conn.cursor()
+        create_staging_table(cursor)
+        while True:
+            records = batches.get()
+            if records is None:
+                break
+            if failures:
+                continue
+            batch_written = write_batch(cursor, records)
+            conn.commit()
+            with totals_lock:
+                add_written(totals, batch_written)
     except Exception as e:
-        logging.error(f"Error inserting message data for message ID {message_data.get('id', 'N/A')}: {e}")
+        logging.error(f"DB writer failed: {e}")
+        failures.append(e)
+        while batches.get() is not None:
+            pass
+    finally:
+        if conn:
+            conn.close()
+
+def load_parallel(planned_directories, workers, writers):
+    """
+    Fans the channel directories out over a pool of `workers` processes that read and decode
+    the JSON files, and feeds the decoded batches through a bounded queue to `writers` DB
+    writer threads, each with its own connection. Every batch is committed on its own;
+    re-running after a failure is safe because the merge upserts on the message key.
+    """
+    batches = queue.Queue(maxsize=QUEUE_BATCHES_PER_WRITER * writers)
+    totals = {"inserted": 0, "updated": 0}
+    totals_lock = threading.Lock()
+    failures = []
+    writer_threads = [
+        threading.Thread(target=_write_batches, args=(batches, totals, totals_lock, failures), daemon=True)
+        for _ in range(writers)
+    ]
+    for thread in writer_threads:
+        thread.start()
+
+    read_files = 0
+    read_messages = 0
+    records = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = set()
+            directories = iter(planned_directories)
+            exhausted = False
+            while pending or not exhausted:
+                # Keep a bounded number of directories in flight so results don't pile up in memory
+                while not exhausted and len(pending) < workers * 2:
+                    directory = next(directories, None)
+                    if directory is None:
+                        exhausted = True
+                        break
+                    pending.add(pool.submit(read_channel_directory, *directory))
+                if not pending:
+                    break
 
-def load_raw_data_to_postgres():
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    channel_records = future.result()
+                    read_files += len(channel_records)
+                    read_messages += sum(record_messages(record) for record in channel_records)
+                    records.extend(channel_records)
+                    full_batches, records = split_full_batches(records)
+                    for batch in full_batches:
+                        batches.put(batch)
+                if failures:
+                    break
+        if records and not failures:
+            batches.put(records)
+    finally:
+        for _ in writer_threads:
+            batches.put(None)
+        for thread in writer_threads:
+            thread.join()
+
+    if failures:
+        raise failures[0]
+    return read_files, read_messages, totals
+
+def load_raw_data_to_postgres(workers=1, writers=1, since=None, partitions=None, rescan=False):
     """
-    Connects to PostgreSQL and loads all scraped JSON data from the data lake
-    following the <date>/<channel_name>/<message_id>.json structure.
+    Connects to PostgreSQL and loads the scraped JSON data from the data lake
+    following the <date>/<channel_name>/<message_id>.json structure, including the NDJSON
+    segments that src/compact_lake.py rolls those files into.
+    Only files that are new or changed since they were last loaded are read (see the
+    ingestion manifest); `since` / `partitions` limit the scan to some dates, and `rescan`
+    re-reads every file in scope, e.g. for a backfill.
+    With workers > 1 the files are read and decoded by a process pool and written
+    by `writers` DB connections in parallel (see load_parallel).
     """
+    if not os.path.exists(base_directory):
+        logging.error(f"Base directory for raw data does not exist: {base_directory}. Please ensure data scraping has run and created files here.")
+        return
+
     conn = None
     try:
-        conn = psycopg2.connect(
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            host=DB_HOST,
-            port=DB_PORT
-        )
+        conn = connect()
         conn.autocommit = False # We'll manage transactions manually
         cursor = conn.cursor()
 
         create_raw_table(cursor)
+        ensure_message_key_index(cursor)
+        create_manifest_table(cursor)
+        conn.commit()
 
-        processed_files = 0
-        if not os.path.exists(base_directory):
-            logging.error(f"Base directory for raw data does not exist: {base_directory}. Please ensure data scraping has run and created files here.")
-            return
-
-        for date_dir in os.listdir(base_directory):
-            date_path = os.path.join(base_directory, date_dir)
-            if os.path.isdir(date_path):
-                try:
-                    # Date directories are named YYYY-MM-DD
-                    scraped_date_obj = datetime.strptime(date_dir, '%Y-%m-%d').date()
-                except ValueError:
-                    logging.warning(f"Skipping malformed date directory name: {date_dir}. Expected YYYY-MM-DD format.")
-                    continue
+        stats = {"unchanged": 0}
+        directories = list_channel_directories(base_directory, since=since, partitions=partitions)
+        if workers > 1:
+            logging.info(f"Loading in parallel with {workers} reader processes and {writers} DB writers.")
+            # This connection only reads the manifest from here on; don't hold a transaction open
+            conn.autocommit = True
+            read_files, read_messages, written = load_parallel(
+                plan_channel_directories(cursor, directories, stats, rescan), workers, writers
+            )
+        else:
+            read_files, read_messages, written = load_serial(
+                conn, plan_channel_directories(cursor, directories, stats, rescan)
+            )
 
-                for channel_subdir in os.listdir(date_path):
-                    channel_path = os.path.join(date_path, channel_subdir)
-                    if os.path.isdir(channel_path):
-                        channel_name = channel_subdir
-                        logging.info(f"Processing directory: {channel_path} (Channel: {channel_name}, Date: {scraped_date_obj})")
-
-                        json_files = [f for f in os.listdir(channel_path) if f.endswith('.json')]
-                        if not json_files:
-                            logging.warning(f"No JSON message files found in {channel_path}.")
-                            continue
-
-                        for json_file in json_files:
-                            file_path = os.path.join(channel_path, json_file)
-                            try:
-                                with open(file_path, 'r', encoding='utf-8') as f:
-                                    message_data = json.load(f)
-                                insert_message_data(cursor, message_data, channel_name, scraped_date_obj)
-                                processed_files += 1
-                            except json.JSONDecodeError as e:
-                                logging.error(f"Error decoding JSON from {file_path}: {e}")
-                            except Exception as e:
-                                logging.error(f"Error processing file {file_path}: {e}")
-                conn.commit() # Commit after each date directory to reduce transaction size
-                logging.info(f"Committed data for date: {scraped_date_obj}")
-
-        logging.info(f"Successfully processed and loaded {processed_files} JSON files into PostgreSQL.")
+        logging.info(f"Successfully processed {read_files} new or changed JSON files and segments into PostgreSQL "
+                     f"({written['inserted']} new messages, {written['updated']} updated, "
+                     f"{read_messages - written['inserted'] - written['updated']} already loaded unchanged); "
+                     f"skipped {stats['unchanged']} files unchanged since they were loaded.")
 
     except psycopg2.Error as e:
         logging.error(f"Database error: {e}")
         if conn:
             conn.rollback() # Rollback on database errors
+        raise # Non-zero exit, so the pipeline doesn't record the partition as loaded
     except Exception as e:
         logging.error(f"An unexpected error occurred: {e}")
         if conn:
             conn.rollback() # Rollback on other unexpected errors
+        raise
     finally:
         if conn:
-            cursor.close()
             conn.close()
             logging.info("PostgreSQL connection closed.")
 
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
 if __name__ == "__main__":
-    load_raw_data_to_postgres()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Load scraped Telegram messages from the data lake into PostgreSQL.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processes reading and decoding JSON files (1 = serial, 0 = one per CPU core).")
+    parser.add_argument("--writers", type=int, default=2,
+                        help="Parallel DB writer connections (only used with --workers other than 1).")
+    parser.add_argument("--since", type=_parse_date, default=None,
+                        help="Only scan date partitions on or after this date (YYYY-MM-DD).")
+    parser.add_argument("--partition", type=_parse_date, action="append", default=None,
+                        help="Only scan this date partition (YYYY-MM-DD); repeat for several.")
+    parser.add_argument("--rescan", action="store_true",
+                        help="Ignore the ingestion manifest and re-read every file in scope (for backfills).")
+    args = parser.parse_args()
+    load_raw_data_to_postgres(workers=args.workers or os.cpu_count(), writers=max(1, args.writers),
+                              since=args.since, partitions=set(args.partition) if args.partition else None,
+                              rescan=args.rescan)
@@ -1,12 +1,30 @@
-# src/yolo_image_analyzer.py - REVISED with MORE DEBUGGING PRINTS
+# src/yolo_image_analyzer.py
 import os
+import re
 import json
-import pandas as pd
+import time
+import sqlite3
+import logging
+import argparse
+import multiprocessing
+import cv2
+import torch
+import numpy as np
 from ultralytics import YOLO
 from datetime import datetime
-import hashlib # For generating a unique ID from file path
+from collections import deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import wait as wait_for_connections
+import hashlib
 from dotenv import load_dotenv
 
+from detection_sinks import FileSink, PostgresSink, ROTATE_ROWS
+from utils.process_runner import report_progress # detection_sinks puts the project root on sys.path
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
 # Load environment variables (assuming .env is in project root)
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 load_dotenv(os.path.join(project_root, '.env'), override=True)
@@ -16,20 +34,59 @@ load_dotenv(os.path.join(project_root, '.env'), override=True)
 # This should resolve to D:\10academy\week7\kara_solutions_ethiopian_medical_insights\data\raw\telegram_images
 BASE_IMAGES_DIR = os.path.join(project_root, 'data', 'raw', 'telegram_images')
 PROCESSED_DATA_DIR = os.path.join(project_root, 'data', 'processed')
-YOLO_OUTPUT_FILE = os.path.join(PROCESSED_DATA_DIR, 'yolo_detections.csv')
+YOLO_OUTPUT_DIR = os.path.join(PROCESSED_DATA_DIR, 'yolo_detections') # Part files of the csv / ndjson sinks
+# Detections already computed, per image content and model version (see DetectionCache)
+DETECTION_CACHE_FILE = os.path.join(PROCESSED_DATA_DIR, 'yolo_detection_cache.sqlite')
+
+# Images per forward pass; batching amortizes the per-call overhead of the model on CPU
+BATCH_SIZE = int(os.getenv("YOLO_BATCH_SIZE", "16"))
+# Threads reading, decoding and resizing upcoming images while the current batch runs
+# (OpenCV releases the GIL, so they overlap with inference)
+PREFETCH_WORKERS = int(os.getenv("YOLO_PREFETCH_WORKERS", "4"))
+# Inference size: images are downscaled to it while prefetching, so the model only has to pad them
+IMAGE_SIZE = 640
+# Sharded mode: inference processes, each with its own model and a fixed number of intra-op threads
+# (0 = the CPU cores divided between the workers)
+WORKERS = int(os.getenv("YOLO_WORKERS", "1"))
+THREADS_PER_WORKER = int(os.getenv("YOLO_THREADS_PER_WORKER", "0"))
+# A worker that spends longer than this per image on a batch is considered hung and restarted
+IMAGE_TIMEOUT_SECONDS = float(os.getenv("YOLO_IMAGE_TIMEOUT_SECONDS", "60"))
+# Restarts of a shard's worker in a row without any finished batch before the run gives up
+MAX_WORKER_RESTARTS = 3
+# Images as the scraper names them: message_<telegram message id>_<photo|document kind>.<ext>
+IMAGE_FILE_NAME = re.compile(r'^message_(\d+)_')
+# Where detections go: part files in YOLO_OUTPUT_DIR, or straight into Postgres (see src/detection_sinks.py)
+SINKS = ('csv', 'ndjson', 'postgres')
+SINK = os.getenv("YOLO_SINK", "csv")
 
-# Ensure processed data directory exists
-os.makedirs(PROCESSED_DATA_DIR, exist_ok=True)
+# Pre-trained YOLOv8 weights; 'yolov8n.pt' (nano) is good for quick testing
+MODEL_WEIGHTS = 'yolov8n.pt'
+_model = None
 
-# --- DEBUGGING PRINTS ---
-print(f"Project Root: {project_root}")
-print(f"Calculated BASE_IMAGES_DIR: {BASE_IMAGES_DIR}")
-print(f"Does BASE_IMAGES_DIR exist? {os.path.exists(BASE_IMAGES_DIR)}")
-print(f"Is BASE_IMAGES_DIR a directory? {os.path.isdir(BASE_IMAGES_DIR)}")
-# --- END DEBUGGING PRINTS ---
+def get_model():
+    """
+    The YOLO model, loaded on first use. Not at import: the sharded mode's spawned workers import
+    this module too, and only the processes that run inference should load it.
+    """
+    global _model
+    if _model is None:
+        _model = YOLO(MODEL_WEIGHTS)
+    return _model
 
-# Load a pre-trained YOLOv8 model
-model = YOLO('yolov8n.pt') # 'yolov8n.pt' (nano) is good for quick testing
+def get_model_version():
+    """
+    Identifies what produced a detection: the weights (by content) and the inference size.
+    Cached detections are only reused for the same version, so new weights re-analyze everything.
+    """
+    weights_path = getattr(get_model(), 'ckpt_path', None) or MODEL_WEIGHTS
+    weights_hash = hashlib.sha256()
+    try:
+        with open(weights_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                weights_hash.update(chunk)
+    except OSError:
+        weights_hash.update(weights_path.encode())
+    return f"{os.path.basename(weights_path)}:{weights_hash.hexdigest()[:16]}:{IMAGE_SIZE}"
 
 def get_image_files_recursive(base_dir):
     """Recursively finds all image files in a base directory and its subdirectories."""
@@ -40,59 +97,566 @@ def get_image_files_recursive(base_dir):
                 image_paths.append(os.path.join(root, file))
     return image_paths
 
-def analyze_images_with_yolo():
-    print("Starting YOLO image analysis...")
-    detection_records = []
+def load_image(image_path, image_size=IMAGE_SIZE):
+    """
+    Reads and decodes an image (BGR, as the model expects for arrays) and downscales it so its
+    longest side is image_size. np.fromfile + imdecode also copes with non-ASCII paths on Windows.
+    """
+    image = cv2.imdecode(np.fromfile(image_path, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("not a decodable image")
+    height, width = image.shape[:2]
+    scale = image_size / max(height, width)
+    if scale < 1:
+        image = cv2.resize(image, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+    return image
+
+def iter_image_batches(image_paths, batch_size=BATCH_SIZE, prefetch_workers=PREFETCH_WORKERS):
+    """
+    Yields batches of (image_path, image), decoding on a thread pool: while the caller runs
+    inference on one batch, the next one is already being read and resized.
+    Images that can't be decoded are reported and left out.
+    """
+    paths = iter(image_paths)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=prefetch_workers) as pool:
+        def prefetch(count):
+            for path in islice(paths, count):
+                pending.append((path, pool.submit(load_image, path)))
+
+        prefetch(batch_size * 2)
+        while pending:
+            batch = []
+            for _ in range(min(batch_size, len(pending))):
+                path, future = pending.popleft()
+                try:
+                    batch.append((path, future.result()))
+                except Exception as e:
+                    logging.error(f"Error reading image {path}: {e}")
+            prefetch(batch_size) # Keeps one batch decoding ahead of the one handed out
+            if batch:
+                yield batch
+
+def predict_batch(batch):
+    """
+    Runs the model on a batch of (image_path, image) in one forward pass. If the batch fails,
+    the images are retried one by one so a single bad image only costs its own detections.
+    Returns one result per image (None for images that failed).
+    """
+    model = get_model()
+    try:
+        return model([image for _, image in batch], imgsz=IMAGE_SIZE, verbose=False)
+    except Exception as e:
+        logging.warning(f"Error processing a batch of {len(batch)} images with YOLO, retrying one by one: {e}")
+
+    results = []
+    for image_path, image in batch:
+        try:
+            results.append(model(image, imgsz=IMAGE_SIZE, verbose=False)[0])
+        except Exception as e:
+            logging.error(f"Error processing image {image_path} with YOLO: {e}")
+            results.append(None)
+    return results
+
+def _hash_file(image_path):
+    with open(image_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+class DetectionCache:
+    """
+    Persistent detections keyed by (image content hash, model version), in a SQLite file next to
+    the detections output. An image re-posted by several channels, or seen again the next night,
+    is looked up here instead of going through the model.
+    Also remembers each file's size, mtime and content hash, so unchanged files aren't re-read
+    just to hash them.
+    """
+
+    def __init__(self, path, model_version):
+        self.model_version = model_version
+        # Partitioned runs may share the cache file; WAL lets them read while another one writes
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS image_files (
+                image_path TEXT PRIMARY KEY,
+                file_size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                content_hash TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS detections (
+                content_hash TEXT NOT NULL,
+                model_version TEXT NOT NULL,
+                detection_timestamp TEXT NOT NULL,
+                detections TEXT NOT NULL, -- JSON list of [detected_object_class, confidence_score]
+                PRIMARY KEY (content_hash, model_version)
+            );
+            -- Run checkpoints: the images whose detections a run has already written to its sink
+            CREATE TABLE IF NOT EXISTS detection_runs (
+                run_id TEXT PRIMARY KEY,
+                sink TEXT NOT NULL,
+                started_at TEXT NOT NULL,
+                finished_at TEXT
+            );
+            CREATE TABLE IF NOT EXISTS run_emitted_images (
+                run_id TEXT NOT NULL,
+                image_path TEXT NOT NULL,
+                PRIMARY KEY (run_id, image_path)
+            );
+        """)
+
+    def content_hashes(self, image_paths, workers=PREFETCH_WORKERS):
+        """Returns {image_path: content_hash}, hashing only new or changed files. Unreadable files are reported and left out."""
+        known = {path: (size, mtime_ns, content_hash) for path, size, mtime_ns, content_hash
+                 in self.conn.execute("SELECT image_path, file_size, mtime_ns, content_hash FROM image_files")}
+        hashes, to_hash = {}, []
+        for image_path in image_paths:
+            try:
+                file_stat = os.stat(image_path)
+            except OSError as e:
+                logging.error(f"Error reading image {image_path}: {e}")
+                continue
+            entry = known.get(image_path)
+            if entry and entry[0] == file_stat.st_size and entry[1] == file_stat.st_mtime_ns:
+                hashes[image_path] = entry[2]
+            else:
+                to_hash.append((image_path, file_stat.st_size, file_stat.st_mtime_ns))
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [(entry, pool.submit(_hash_file, entry[0])) for entry in to_hash]
+            updates = []
+            for (image_path, size, mtime_ns), future in futures:
+                try:
+                    hashes[image_path] = future.result()
+                except OSError as e:
+                    logging.error(f"Error reading image {image_path}: {e}")
+                    continue
+                updates.append((image_path, size, mtime_ns, hashes[image_path]))
+        self.conn.executemany("INSERT OR REPLACE INTO image_files VALUES (?, ?, ?, ?)", updates)
+        self.conn.commit()
+        return hashes
+
+    def lookup(self, content_hashes):
+        """Returns {content_hash: (detection_timestamp, detections)} for the hashes cached for this model version."""
+        content_hashes = list(content_hashes)
+        cached = {}
+        for start in range(0, len(content_hashes), 500): # SQLite caps the number of bound parameters
+            chunk = content_hashes[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT content_hash, detection_timestamp, detections FROM detections "
+                f"WHERE model_version = ? AND content_hash IN ({', '.join('?' * len(chunk))})",
+                [self.model_version, *chunk]
+            )
+            for content_hash, detection_timestamp, detections in rows:
+                cached[content_hash] = (detection_timestamp, json.loads(detections))
+        return cached
+
+    def store(self, entries):
+        """Caches (content_hash, detection_timestamp, detections) entries, detections as [(class, confidence)]."""
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO detections VALUES (?, ?, ?, ?)",
+            [(content_hash, self.model_version, detection_timestamp, json.dumps(detections))
+             for content_hash, detection_timestamp, detections in entries]
+        )
+        self.conn.commit()
+
+    def start_run(self, sink, new_run=False, partition=None):
+        """
+        Returns (run_id, emitted_image_paths): the last unfinished run of this sink (and partition)
+        and the images it already wrote, so an interrupted run picks up where it stopped, or a new run.
+        new_run abandons unfinished runs instead.
+        """
+        if partition:
+            sink = f"{sink}:{partition}"
+        row = self.conn.execute(
+            "SELECT run_id FROM detection_runs WHERE sink = ? AND finished_at IS NULL ORDER BY run_id DESC LIMIT 1",
+            (sink,)
+        ).fetchone()
+        if row and not new_run:
+            emitted = {image_path for image_path, in self.conn.execute(
+                "SELECT image_path FROM run_emitted_images WHERE run_id = ?", (row[0],))}
+            return row[0], emitted
+
+        if row:
+            self.conn.execute("UPDATE detection_runs SET finished_at = ? WHERE sink = ? AND finished_at IS NULL",
+                              (datetime.now().isoformat(), sink))
+        run_id = (f"{partition}_" if partition else "") + datetime.now().strftime('%Y%m%dT%H%M%S')
+        self.conn.execute("INSERT OR REPLACE INTO detection_runs VALUES (?, ?, ?, NULL)",
+                          (run_id, sink, datetime.now().isoformat()))
+        self.conn.commit()
+        return run_id, set()
+
+    def mark_emitted(self, run_id, image_paths):
+        self.conn.executemany("INSERT OR IGNORE INTO run_emitted_images VALUES (?, ?)",
+                              [(run_id, image_path) for image_path in image_paths])
+        self.conn.commit()
+
+    def finish_run(self, run_id):
+        self.conn.execute("UPDATE detection_runs SET finished_at = ? WHERE run_id = ?", (datetime.now().isoformat(), run_id))
+        self.conn.execute("DELETE FROM run_emitted_images WHERE run_id = ?", (run_id,))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+def result_detections(result):
+    """Returns the detections of one model result as [(detected_object_class, confidence_score)]."""
+    names = get_model().names
+    return [(names[int(box.cls[0])], float(box.conf[0])) for box in result.boxes]
+
+def iter_detections(image_paths, batch_size=BATCH_SIZE, prefetch_workers=PREFETCH_WORKERS):
+    """In-process inference: yields batches of (image_path, detections), detections None for images that failed."""
+    for batch in iter_image_batches(image_paths, batch_size, prefetch_workers):
+        results = predict_batch(batch)
+        yield [(image_path, result_detections(result) if result is not None else None)
+               for (image_path, _), result in zip(batch, results)]
 
-    image_files = get_image_files_recursive(BASE_IMAGES_DIR)
+def _shard_worker(conn, threads, prefetch_workers):
+    """
+    Inference process of the sharded mode. The model is loaded once, before the worker reports
+    ready. Receives jobs (image_paths, batch_size, isolate) until None and reports each batch
+    before ("start") and after ("done") inference, so the parent knows which images a crash or
+    hang hit. isolate jobs read each image only after reporting it, without prefetching, so a
+    failure is always attributed to the right image.
+    """
+    torch.set_num_threads(threads)
+    # The first forward pass is much slower than the rest; keep it out of the per-image timeout
+    get_model()(np.zeros((IMAGE_SIZE, IMAGE_SIZE, 3), dtype=np.uint8), imgsz=IMAGE_SIZE, verbose=False)
+    conn.send(("ready",))
+    while True:
+        job = conn.recv()
+        if job is None:
+            break
+        image_paths, batch_size, isolate = job
+        if isolate:
+            for image_path in image_paths:
+                conn.send(("start", [image_path]))
+                try:
+                    batch = [(image_path, load_image(image_path))]
+                except Exception as e:
+                    logging.error(f"Error reading image {image_path}: {e}")
+                    conn.send(("done", []))
+                    continue
+                result = predict_batch(batch)[0]
+                conn.send(("done", [(image_path, result_detections(result) if result is not None else None)]))
+        else:
+            for batch in iter_image_batches(image_paths, batch_size, prefetch_workers):
+                conn.send(("start", [image_path for image_path, _ in batch]))
+                results = predict_batch(batch)
+                conn.send(("done", [(image_path, result_detections(result) if result is not None else None)
+                                    for (image_path, _), result in zip(batch, results)]))
+        conn.send(("job_done",))
+    conn.close()
 
-    # --- DEBUGGING PRINTS ---
-    print(f"Number of image files found by recursive search: {len(image_files)}")
-    if len(image_files) > 0:
-        print(f"First 5 found image files (if any):")
-        for i, p in enumerate(image_files[:5]):
-            print(f"  {i+1}. {p}")
-    # --- END DEBUGGING PRINTS ---
+class _Shard:
+    """Parent-side state of one shard: its worker process, queued jobs and how far the current job got."""
+
+    def __init__(self, index, image_paths, batch_size):
+        self.index = index
+        self.batch_size = batch_size
+        self.jobs = deque([(image_paths, batch_size, False)] if image_paths else [])
+        self.job = None
+        self.positions = {}
+        self.done = set()
+        self.in_flight = None
+        self.last_started = -1 # Position in the job of the last image handed to the model
+        self.deadline = None
+        self.restarts = 0
+        self.process = None
+        self.conn = None
+
+    def send_next_job(self, image_timeout):
+        self.job = self.jobs.popleft() if self.jobs else None
+        self.positions = {image_path: i for i, image_path in enumerate(self.job[0])} if self.job else {}
+        self.done, self.in_flight, self.last_started = set(), None, -1
+        # The first batch has to be read before it can start
+        self.deadline = time.monotonic() + image_timeout * self.job[1] if self.job else None
+        self.conn.send(self.job)
+        return self.job is not None
+
+    def split_unfinished(self):
+        """
+        Splits the unfinished images of the current job into (suspects, rest): the batch in flight
+        plus, outside isolate jobs, the images the worker may have been prefetching after it.
+        Images before the batch in flight without a result couldn't be read and were reported.
+        """
+        if self.job is None:
+            return [], []
+        image_paths, batch_size, isolate = self.job
+        window_end = self.last_started + 1 + (0 if isolate else 2 * batch_size)
+        if isolate and self.in_flight is None:
+            window_end += 1
+        suspects = [p for p in (self.in_flight or []) if p not in self.done]
+        suspects += [p for p in image_paths[self.last_started + 1:window_end] if p not in self.done]
+        rest = [p for p in image_paths[window_end:] if p not in self.done]
+        return suspects, rest
+
+def iter_detections_sharded(image_paths, workers, threads_per_worker, batch_size=BATCH_SIZE,
+                            prefetch_workers=PREFETCH_WORKERS, image_timeout=IMAGE_TIMEOUT_SECONDS):
+    """
+    Sharded inference: splits the images over `workers` processes and yields their batches of
+    (image_path, detections) as they finish, detections None for images that failed.
+    A worker that crashes, or takes longer than image_timeout per image, is killed and restarted
+    on the rest of its shard. The images it may have been working on are retried one at a time,
+    and an image that fails on its own is given up on.
+    """
+    # spawn, not fork: forking a process that already runs PyTorch threads can deadlock
+    context = multiprocessing.get_context("spawn")
+    shards = [_Shard(i, image_paths[i::workers], batch_size) for i in range(workers)]
+
+    def start_worker(shard):
+        parent_conn, child_conn = context.Pipe()
+        shard.process = context.Process(target=_shard_worker, args=(child_conn, threads_per_worker, prefetch_workers),
+                                        daemon=True)
+        shard.process.start()
+        child_conn.close()
+        shard.conn = parent_conn
+        shard.job, shard.deadline = None, None
+
+    def restart_worker(shard, reason):
+        """Replaces a failed worker; returns the results to report for the image given up on, if any."""
+        shard.process.kill()
+        shard.process.join()
+        shard.conn.close()
+        shard.restarts += 1
+        if shard.restarts > MAX_WORKER_RESTARTS:
+            raise RuntimeError(f"YOLO worker for shard {shard.index} failed {shard.restarts} times in a row: {reason}")
+
+        suspects, rest = shard.split_unfinished()
+        logging.warning(f"YOLO worker for shard {shard.index} {reason}; restarting it on the "
+                        f"{len(suspects) + len(rest)} unfinished images of its current job.")
+        failed = []
+        isolating = shard.job is not None and shard.job[2]
+        if rest:
+            shard.jobs.appendleft((rest, 1, True) if isolating else (rest, shard.batch_size, False))
+        if isolating and suspects:
+            # Already on its own: this image is what takes the worker down
+            logging.error(f"Error processing image {suspects[0]} with YOLO: giving up after the worker {reason}")
+            failed = [(image_path, None) for image_path in suspects]
+        elif suspects:
+            shard.jobs.appendleft((suspects, 1, True))
+        if shard.jobs:
+            start_worker(shard)
+        else:
+            # Nothing left for this shard (e.g. the last image of its isolate job was the culprit)
+            shard.process, shard.conn = None, None
+        return failed
+
+    def stop_worker(conn, shard):
+        """Retires the worker of a shard with no jobs left (it exits on the None job it was sent)."""
+        del active[conn]
+        shard.process.join()
+        conn.close()
+
+    active = {}
+    for shard in shards:
+        if shard.jobs:
+            start_worker(shard)
+            active[shard.conn] = shard
+    try:
+        while active:
+            for conn in wait_for_connections(list(active), timeout=1.0):
+                shard = active[conn]
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    del active[conn]
+                    shard.process.join(timeout=5)
+                    failed = restart_worker(shard, f"exited with code {shard.process.exitcode}")
+                    if shard.conn is not None:
+                        active[shard.conn] = shard
+                    if failed:
+                        yield failed
+                    continue
+
+                if message[0] == "ready":
+                    if not shard.send_next_job(image_timeout):
+                        stop_worker(conn, shard)
+                elif message[0] == "start":
+                    shard.in_flight = message[1]
+                    shard.last_started = max(shard.positions[image_path] for image_path in message[1])
+                    shard.deadline = time.monotonic() + image_timeout * len(message[1])
+                elif message[0] == "done":
+                    shard.done.update(shard.in_flight)
+                    shard.in_flight, shard.restarts = None, 0
+                    # The next batch may still have to be read
+                    shard.deadline = time.monotonic() + image_timeout * shard.job[1]
+                    if message[1]:
+                        yield message[1]
+                elif message[0] == "job_done":
+                    if not shard.send_next_job(image_timeout):
+                        stop_worker(conn, shard)
+
+            now = time.monotonic()
+            for conn, shard in list(active.items()):
+                if shard.deadline is not None and now > shard.deadline:
+                    del active[conn]
+                    failed = restart_worker(shard, "timed out")
+                    if shard.conn is not None:
+                        active[shard.conn] = shard
+                    if failed:
+                        yield failed
+    finally:
+        for shard in shards:
+            if shard.process is not None and shard.process.is_alive():
+                shard.process.kill()
+
+def image_message_key(image_path):
+    """
+    Returns (channel_name, message_id) of the Telegram message an image was downloaded from,
+    read from the scraper's layout: telegram_images/<date>/<channel_name>/message_<id>_<kind>.<ext>.
+    Returns None for files that don't follow it.
+    """
+    match = IMAGE_FILE_NAME.match(os.path.basename(image_path))
+    if not match:
+        return None
+    return os.path.basename(os.path.dirname(image_path)), match.group(1)
+
+def detection_rows(image_path, detection_timestamp, detections):
+    # Keyed by the Telegram message (the ids fct_messages has), so the marts can join them;
+    # box_index numbers the boxes of the image (a batch shares one timestamp, so it can't tell them apart)
+    message_key = image_message_key(image_path)
+    if message_key is None:
+        logging.warning(f"Skipping detections of {image_path}: its name doesn't identify a Telegram message.")
+        return []
+    channel_name, message_id = message_key
+    return [{
+        'message_id': message_id,
+        'channel_name': channel_name,
+        'detected_object_class': detected_class_name,
+        'confidence_score': confidence,
+        'detection_timestamp': detection_timestamp,
+        'box_index': box_index
+    } for box_index, (detected_class_name, confidence) in enumerate(detections)]
+
+def analyze_images_with_yolo(batch_size=BATCH_SIZE, prefetch_workers=PREFETCH_WORKERS, refresh_cache=False,
+                             workers=WORKERS, threads_per_worker=THREADS_PER_WORKER,
+                             image_timeout=IMAGE_TIMEOUT_SECONDS, sink=SINK, rotate_rows=ROTATE_ROWS, new_run=False,
+                             partition=None):
+    """
+    Detects objects in the scraped images and writes the detections to the chosen sink.
+    partition (a scraped date) limits the run to telegram_images/<date>/, the layout the scraper writes.
+    """
+    logging.info("Starting YOLO image analysis...")
+    threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+    logging.info(f"Batch size: {batch_size}, prefetch workers: {prefetch_workers}, "
+                 f"inference workers: {workers}" + (f" x {threads_per_worker} threads" if workers > 1 else ""))
+    os.makedirs(PROCESSED_DATA_DIR, exist_ok=True)
+
+    images_dir = os.path.join(BASE_IMAGES_DIR, partition.isoformat()) if partition else BASE_IMAGES_DIR
+    image_files = get_image_files_recursive(images_dir)
+    logging.info(f"Found {len(image_files)} image files in {images_dir}.")
+    logging.debug("First image files: " + ", ".join(image_files[:5]))
 
     if not image_files:
-        print(f"No image files found in {BASE_IMAGES_DIR} or its subdirectories. Skipping YOLO analysis.")
+        logging.info(f"No image files found in {images_dir} or its subdirectories. Skipping YOLO analysis.")
         return
 
-    for image_path in image_files:
-        print(f"Analyzing image: {image_path}")
+    cache = DetectionCache(DETECTION_CACHE_FILE, get_model_version())
+    detection_sink = None
+    try:
+        run_id, emitted = cache.start_run(sink, new_run, partition)
+        if emitted:
+            logging.info(f"Resuming run {run_id}: {len(emitted)} images already written to the {sink} sink.")
+        else:
+            logging.info(f"Starting run {run_id} with the {sink} sink.")
 
-        unique_image_id = hashlib.sha256(image_path.encode()).hexdigest()
-        message_id_for_fk = unique_image_id
+        def checkpoint(image_paths):
+            cache.mark_emitted(run_id, image_paths)
 
-        try:
-            results = model(image_path)
-            if results and hasattr(results[0], 'boxes') and results[0].boxes:
-                for r in results:
-                    boxes = r.boxes
-                    for box in boxes:
-                        class_id = int(box.cls[0])
-                        confidence = float(box.conf[0])
-                        detected_class_name = model.names[class_id]
-
-                        detection_records.append({
-                            'message_id': message_id_for_fk,
-                            'detected_object_class': detected_class_name,
-                            'confidence_score': confidence,
-                            'detection_timestamp': datetime.now().isoformat()
-                        })
-            else:
-                print(f"No objects detected in {image_path}")
+        if sink == 'postgres':
+            detection_sink = PostgresSink(checkpoint)
+        else:
+            detection_sink = FileSink(checkpoint, YOLO_OUTPUT_DIR, run_id, file_format=sink, rotate_rows=rotate_rows)
 
-        except Exception as e:
-            print(f"Error processing image {image_path} with YOLO: {e}")
-            continue
+        # Group the images still to write by content: each distinct image goes through the model at most once
+        paths_by_hash = {}
+        for image_path, content_hash in cache.content_hashes(
+                [image_path for image_path in image_files if image_path not in emitted], prefetch_workers).items():
+            paths_by_hash.setdefault(content_hash, []).append(image_path)
+        cached = {} if refresh_cache else cache.lookup(paths_by_hash)
+
+        cache_hits = 0
+        for content_hash, (detection_timestamp, detections) in cached.items():
+            for image_path in paths_by_hash[content_hash]:
+                cache_hits += 1
+                detection_sink.add(image_path, detection_rows(image_path, detection_timestamp, detections))
+
+        to_analyze = {paths[0]: content_hash for content_hash, paths in paths_by_hash.items()
+                      if content_hash not in cached}
+        logging.info(f"Cache ({cache.model_version}): {cache_hits} of {len(image_files) - len(emitted)} images "
+                     f"already analyzed; {len(to_analyze)} distinct new images to analyze.")
+
+        started = time.perf_counter()
+        analyzed = 0
+        duplicates = 0
+        if workers > 1:
+            batches = iter_detections_sharded(list(to_analyze), workers, threads_per_worker, batch_size,
+                                              prefetch_workers, image_timeout)
+        else:
+            batches = iter_detections(to_analyze, batch_size, prefetch_workers)
+        for batch in batches:
+            detection_timestamp = datetime.now().isoformat()
+
+            new_entries = []
+            for image_path, detections in batch:
+                if detections is None:
+                    continue
+                analyzed += 1
+                new_entries.append((to_analyze[image_path], detection_timestamp, detections))
+                if not detections:
+                    logging.debug(f"No objects detected in {image_path}")
+            # Cached before they are written, so a resumed run never has to analyze them again
+            cache.store(new_entries)
+            for image_path, detections in batch:
+                if detections is None:
+                    continue
+                # Copies of the same image elsewhere in the lake get the same detections
+                for same_image_path in paths_by_hash[to_analyze[image_path]]:
+                    duplicates += same_image_path != image_path
+                    detection_sink.add(same_image_path, detection_rows(same_image_path, detection_timestamp, detections))
+
+            elapsed = time.perf_counter() - started
+            report_progress(analyzed, len(to_analyze), 'images', f"analyzed ({analyzed / elapsed:.1f} images/sec)")
+
+        detection_sink.close()
+        detection_sink = None
+        cache.finish_run(run_id)
+    finally:
+        if detection_sink is not None:
+            detection_sink.close() # Keep what was analyzed; the next run resumes after it
+        cache.close()
 
-    if detection_records:
-        df_detections = pd.DataFrame(detection_records)
-        df_detections.to_csv(YOLO_OUTPUT_FILE, index=False)
-        print(f"YOLO detections saved to {YOLO_OUTPUT_FILE}")
-    else:
-        print("No objects detected or no images processed from any subdirectory.")
+    elapsed = time.perf_counter() - started
+    logging.info(f"Analyzed {analyzed} images in {elapsed:.1f}s "
+                 f"({analyzed / elapsed if elapsed else 0:.1f} images/sec)")
+    total = cache_hits + duplicates + analyzed
+    logging.info(f"Cache hit rate: {(cache_hits + duplicates) / total if total else 0:.1%} ({cache_hits} cached, "
+                 f"{duplicates} duplicates of images analyzed in this run, {analyzed} analyzed)")
 
 if __name__ == "__main__":
-    analyze_images_with_yolo()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Detect objects in the scraped Telegram images with YOLO.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Images per forward pass.")
+    parser.add_argument("--prefetch-workers", type=int, default=PREFETCH_WORKERS,
+                        help="Threads decoding and resizing upcoming images during inference.")
+    parser.add_argument("--refresh-cache", action="store_true",
+                        help="Ignore cached detections and re-analyze every image (the cache is updated).")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="Inference processes the images are sharded over (1 = in this process).")
+    parser.add_argument("--threads-per-worker", type=int, default=THREADS_PER_WORKER,
+                        help="PyTorch intra-op threads of each worker (0 = CPU cores / workers).")
+    parser.add_argument("--image-timeout", type=float, default=IMAGE_TIMEOUT_SECONDS,
+                        help="Seconds per image after which a worker's batch counts as hung.")
+    parser.add_argument("--sink", choices=SINKS, default=SINK,
+                        help="Write detections as CSV / NDJSON part files in data/processed/yolo_detections/, "
+                             "or COPY them straight into yolo_detections_csv.")
+    parser.add_argument("--rotate-rows", type=int, default=ROTATE_ROWS, help="Rows per part file (csv / ndjson sinks).")
+    parser.add_argument("--new-run", action="store_true",
+                        help="Don't resume an interrupted run of the same sink; start over.")
+    parser.add_argument("--partition", type=lambda value: datetime.strptime(value, '%Y-%m-%d').date(), default=None,
+                        help="Only analyze the images scraped on this date (YYYY-MM-DD).")
+    args = parser.parse_args()
+    analyze_images_with_yolo(batch_size=max(1, args.batch_size), prefetch_workers=max(1, args.prefetch_workers),
+                             refresh_cache=args.refresh_cache, workers=max(1, args.workers),
+                             threads_per_worker=max(0, args.threads_per_worker), image_timeout=args.image_timeout,
+                             sink=args.sink, rotate_rows=max(1, args.rotate_rows), new_run=args.new_run,
+                             partition=args.partition)
\ No newline at end of file
@@ -0,0 +1,56 @@
+# tests/test_compact_lake.py
+import os
+import sys
+import json
+
+# Add project root to sys.path to allow importing src.* and utils.*
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from src.compact_lake import compact_channel_directory
+from utils.lake import read_index, segment_codec, is_message_file
+
+
+def write_messages(channel_path, message_ids):
+    for message_id in message_ids:
+        with open(os.path.join(channel_path, f"{message_id}.json"), 'w', encoding='utf-8') as f:
+            json.dump({"id": message_id, "message": f"message {message_id}"}, f)
+
+
+def message_files(channel_path):
+    return sorted(name for name in os.listdir(channel_path) if is_message_file(name))
+
+
+def segment_files(channel_path):
+    return sorted(name for name in os.listdir(channel_path) if segment_codec(name))
+
+
+def test_rerun_with_keep_originals_writes_one_segment(tmp_path):
+    write_messages(tmp_path, [1, 2, 3])
+
+    assert compact_channel_directory(str(tmp_path), codec='gz', keep_originals=True) == 3
+    assert compact_channel_directory(str(tmp_path), codec='gz', keep_originals=True) == 0
+
+    assert len(segment_files(tmp_path)) == 1
+    assert len(read_index(str(tmp_path))["segments"]) == 1
+    assert message_files(tmp_path) == ['1.json', '2.json', '3.json']
+
+
+def test_only_new_messages_are_compacted(tmp_path):
+    write_messages(tmp_path, [1, 2])
+    compact_channel_directory(str(tmp_path), codec='gz', keep_originals=True)
+    write_messages(tmp_path, [3])
+
+    assert compact_channel_directory(str(tmp_path), codec='gz', keep_originals=True) == 1
+    segments = read_index(str(tmp_path))["segments"]
+    assert [segment["message_ids"] for segment in segments] == [['1', '2'], ['3']]
+
+
+def test_leftover_originals_of_indexed_messages_are_removed(tmp_path):
+    write_messages(tmp_path, [1, 2])
+    compact_channel_directory(str(tmp_path), codec='gz', keep_originals=True)
+
+    assert compact_channel_directory(str(tmp_path), codec='gz') == 0
+    assert len(segment_files(tmp_path)) == 1
+    assert message_files(tmp_path) == []
@@ -0,0 +1,41 @@
+# tests/test_load_telegram_raw_data.py
+import os
+import sys
+from io import StringIO
+
+import pytest
+
+# Add project root to sys.path to allow importing orchestration.*
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from orchestration.scripts.load_telegram_raw_data import iter_json_messages
+
+
+def test_messages_split_across_chunks_are_decoded():
+    text = '[{"id": 1, "message": "first"}, {"id": 2, "message": "second"}]'
+    messages = list(iter_json_messages(StringIO(text), chunk_size=7))
+    assert [message["id"] for message in messages] == [1, 2]
+
+
+def test_ndjson_is_decoded():
+    text = '{"id": 1}\n{"id": 2}\n'
+    assert [message["id"] for message in iter_json_messages(StringIO(text), chunk_size=4)] == [1, 2]
+
+
+def test_malformed_message_stops_at_the_size_cap_with_its_offset():
+    bad = '{"id": 2, "message": "unterminated'
+    f = StringIO('[{"id": 1}, ' + bad + ' ' * 10000 + ']')
+    messages = iter_json_messages(f, chunk_size=16, max_message_size=100)
+
+    assert next(messages) == {"id": 1}
+    with pytest.raises(ValueError, match="character offset 12"):
+        next(messages)
+    # Stopped reading long before the end of the file
+    assert f.tell() < 200
+
+
+def test_malformed_message_at_end_of_file_reports_its_offset():
+    with pytest.raises(ValueError, match="character offset 9"):
+        list(iter_json_messages(StringIO('{"id": 1}{"id": ')))
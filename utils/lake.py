@@ -0,0 +1,125 @@
+import os
+import gzip
+import json
+import logging
+from datetime import datetime
+
+# zstd compresses the NDJSON segments better and much faster than gzip; optional, gzip is the fallback
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compacted segments live next to the loose <message_id>.json files of their partition,
+# as <date>/<channel_name>/part-00000.ndjson.zst (or .gz): one message per line
+SEGMENT_SUFFIXES = {'.ndjson.zst': 'zst', '.ndjson.gz': 'gz'}
+DEFAULT_CODEC = 'zst' if zstandard else 'gz'
+
+# Per-partition index of the segments (message IDs, counts, hashes); names starting with '_'
+# are lake metadata, never message files
+INDEX_FILE_NAME = '_segments.json'
+
+
+def list_channel_directories(base_dir, since=None, partitions=None):
+    """
+    Yields (scraped_date, channel_name, channel_path) for every <date>/<channel_name>/
+    directory of the data lake, oldest date first.
+    since / partitions restrict the scan to dates on or after `since` / to the given dates.
+    """
+    for date_dir in sorted(os.listdir(base_dir)):
+        date_path = os.path.join(base_dir, date_dir)
+        if not os.path.isdir(date_path):
+            continue
+        try:
+            # Date directories are named YYYY-MM-DD
+            scraped_date_obj = datetime.strptime(date_dir, '%Y-%m-%d').date()
+        except ValueError:
+            logging.warning(f"Skipping malformed date directory name: {date_dir}. Expected YYYY-MM-DD format.")
+            continue
+        if since and scraped_date_obj < since:
+            continue
+        if partitions and scraped_date_obj not in partitions:
+            continue
+
+        for channel_subdir in sorted(os.listdir(date_path)):
+            channel_path = os.path.join(date_path, channel_subdir)
+            if os.path.isdir(channel_path):
+                yield scraped_date_obj, channel_subdir, channel_path
+
+
+def is_message_file(file_name):
+    return file_name.endswith('.json') and not file_name.startswith('_')
+
+
+def segment_codec(file_name):
+    """Returns the codec of a segment file name ('zst' / 'gz'), or None if it isn't a segment."""
+    if file_name.startswith('_'):
+        return None
+    for suffix, codec in SEGMENT_SUFFIXES.items():
+        if file_name.endswith(suffix):
+            return codec
+    return None
+
+
+def segment_file_name(part, codec):
+    return f"part-{part:05d}.ndjson.{codec}"
+
+
+def next_segment_part(channel_path):
+    """Part number for a new segment: one past the highest segment file in the directory."""
+    parts = [-1]
+    for file_name in os.listdir(channel_path):
+        if segment_codec(file_name) and file_name.startswith('part-'):
+            try:
+                parts.append(int(file_name[len('part-'):].split('.', 1)[0]))
+            except ValueError:
+                continue
+    return max(parts) + 1
+
+
+def compress(data, codec):
+    if codec == 'zst':
+        if zstandard is None:
+            raise RuntimeError("The zstandard package is required for .ndjson.zst segments.")
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def decompress(data, codec):
+    if codec == 'zst':
+        if zstandard is None:
+            raise RuntimeError("The zstandard package is required for .ndjson.zst segments.")
+        # The frame header carries the content size, which the one-shot decompressor needs
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def _replace_file(path, data):
+    """Writes data to path atomically: readers see the old file or the complete new one."""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def write_segment(path, lines, codec):
+    """Writes NDJSON lines (str, without newlines) as a compressed segment. Returns the compressed bytes."""
+    data = compress(("\n".join(lines) + "\n").encode('utf-8'), codec)
+    _replace_file(path, data)
+    return data
+
+
+def read_index(channel_path):
+    """Returns the partition's segment index ({"segments": [...]}), empty if it has none yet."""
+    try:
+        with open(os.path.join(channel_path, INDEX_FILE_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"segments": []}
+
+
+def write_index(channel_path, index):
+    _replace_file(os.path.join(channel_path, INDEX_FILE_NAME),
+                  json.dumps(index, ensure_ascii=False).encode('utf-8'))
@@ -0,0 +1,225 @@
+import os
+import re
+import sys
+import time
+import queue
+import signal
+import threading
+import subprocess
+from collections import deque, namedtuple
+
+# Longer lines are cut, the rest of the line is dropped
+MAX_LINE_CHARS = 4000
+# Output forwarded to the log per run; past it lines are only counted, and the last TAIL_LINES
+# of them are logged when the process exits
+MAX_LOG_BYTES = 2 * 1024 * 1024
+TAIL_LINES = 200
+# Progress events are logged (and passed to on_progress) at most this often
+PROGRESS_LOG_SECONDS = 30
+# Seconds between SIGTERM and SIGKILL when a process is cancelled
+TERMINATE_GRACE_SECONDS = 10
+
+# Progress lines printed by report_progress: "PROGRESS <done>[/<total>] <unit>[ anything else]"
+_PROGRESS_PATTERN = re.compile(r"^PROGRESS (\d+)(?:/(\d+))? (\S+)")
+
+ProgressEvent = namedtuple('ProgressEvent', ['done', 'total', 'unit', 'rate', 'eta_seconds', 'elapsed_seconds'])
+StreamResult = namedtuple('StreamResult', ['returncode', 'lines', 'suppressed_lines', 'progress', 'elapsed_seconds'])
+
+
+def report_progress(done, total=None, unit='items', detail=''):
+    """
+    Prints a progress line that run_streaming turns into a ProgressEvent (items done, rate, ETA).
+    For the scripts run by the pipeline; the line is readable as is when they run by hand.
+    """
+    count = f"{done}/{total}" if total is not None else f"{done}"
+    print(f"PROGRESS {count} {unit}{' ' + detail if detail else ''}", flush=True)
+
+
+def format_progress(event):
+    count = f"{event.done}/{event.total}" if event.total is not None else f"{event.done}"
+    message = f"Progress: {count} {event.unit} ({event.rate:.1f} {event.unit}/s"
+    if event.eta_seconds is not None:
+        minutes, seconds = divmod(int(event.eta_seconds), 60)
+        message += f", ETA {minutes}m{seconds:02d}s"
+    return message + ")"
+
+
+class PrintLog:
+    """A log for run_streaming that writes to the current process's stdout / stderr (for the wrapper scripts)."""
+
+    def info(self, message):
+        print(message, flush=True)
+
+    def warning(self, message):
+        print(message, file=sys.stderr, flush=True)
+
+    error = warning
+
+
+def _read_lines(pipe, stream_name, lines):
+    """Reader thread: queues (stream_name, line) for every line of the pipe, then (stream_name, None)."""
+    try:
+        while True:
+            raw = pipe.readline(MAX_LINE_CHARS + 1)
+            if not raw:
+                break
+            if not raw.endswith(b"\n") and len(raw) > MAX_LINE_CHARS:
+                # Drop the rest of an overlong line
+                while True:
+                    rest = pipe.readline(1 << 16)
+                    if not rest or rest.endswith(b"\n"):
+                        break
+            line = raw.decode('utf-8', errors='replace').rstrip("\r\n")
+            # Progress bars redraw themselves with \r; keep the last state
+            line = line.rsplit("\r", 1)[-1][:MAX_LINE_CHARS]
+            lines.put((stream_name, line))
+    finally:
+        lines.put((stream_name, None))
+
+
+def _terminate(process, process_group):
+    """SIGTERM to the process (or its whole group), SIGKILL after TERMINATE_GRACE_SECONDS."""
+    def send(sig):
+        try:
+            if process_group and hasattr(os, 'killpg'):
+                # The whole group, so workers started by the process stop too
+                os.killpg(process.pid, sig)
+            elif process.poll() is None:
+                process.send_signal(sig)
+        except ProcessLookupError:
+            pass
+
+    send(signal.SIGTERM)
+    try:
+        process.wait(timeout=TERMINATE_GRACE_SECONDS)
+    except subprocess.TimeoutExpired:
+        pass
+    # Also ends group members that ignored SIGTERM or outlived the process
+    send(getattr(signal, 'SIGKILL', signal.SIGTERM))
+    process.wait()
+
+
+def run_streaming(command, log, cwd=None, env=None, on_progress=None, timeout=None, relay=False,
+                  max_log_bytes=MAX_LOG_BYTES, progress_log_seconds=PROGRESS_LOG_SECONDS):
+    """
+    Runs command and forwards its output to log (a logger or Dagster's context.log) line by
+    line as it is printed: stdout at info, stderr at warning level. Memory stays bounded
+    whatever the process prints: lines are cut at MAX_LINE_CHARS and, past max_log_bytes,
+    only the last TAIL_LINES are kept and logged at exit.
+
+    Lines written by report_progress become ProgressEvents, logged (and passed to
+    on_progress) at most every progress_log_seconds, plus the last one at exit.
+
+    The process runs in its own process group, so a cancelled run (an exception in the
+    caller, e.g. Dagster interrupting the step, or timeout) stops it and everything it
+    started. Wrapper scripts, themselves run by run_streaming, pass relay=True: the process
+    stays in the wrapper's group (which the outer run stops as a whole) and progress lines
+    are passed through unchanged for the outer run to parse.
+
+    Raises subprocess.CalledProcessError (output: the last lines) on a non-zero exit.
+    """
+    env = dict(os.environ if env is None else env)
+    env.setdefault('PYTHONUNBUFFERED', '1') # Python children would otherwise block-buffer their piped output
+    started = time.monotonic()
+    process = subprocess.Popen(command, cwd=cwd, env=env, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, start_new_session=not relay)
+
+    # Bounded, so a process printing faster than the log keeps up is slowed down rather than buffered
+    lines = queue.Queue(maxsize=1000)
+    readers = [threading.Thread(target=_read_lines, args=(pipe, name, lines), daemon=True)
+               for pipe, name in ((process.stdout, 'stdout'), (process.stderr, 'stderr'))]
+    for reader in readers:
+        reader.start()
+
+    tail = deque(maxlen=TAIL_LINES)
+    suppressed_tail = deque(maxlen=TAIL_LINES)
+    line_count = suppressed = logged_bytes = 0
+    progress = first_progress = None
+    progress_logged_at = None
+    progress_pending = False
+
+    def emit_progress():
+        log.info(format_progress(progress))
+        if on_progress is not None:
+            on_progress(progress)
+
+    try:
+        open_streams = len(readers)
+        while open_streams:
+            if timeout is not None and time.monotonic() - started > timeout:
+                raise subprocess.TimeoutExpired(command, timeout)
+            try:
+                stream_name, line = lines.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if line is None:
+                open_streams -= 1
+                continue
+
+            match = _PROGRESS_PATTERN.match(line)
+            if match and relay:
+                log.info(line)
+                continue
+            if match:
+                now = time.monotonic()
+                done, total = int(match.group(1)), int(match.group(2)) if match.group(2) else None
+                if first_progress is None:
+                    first_progress = (now, done)
+                # Rate since the first event, so start-up time (model loading, ...) doesn't skew it
+                first_time, first_done = first_progress
+                if now > first_time and done > first_done:
+                    rate = (done - first_done) / (now - first_time)
+                else:
+                    rate = done / (now - started) if now > started else 0.0
+                eta = (total - done) / rate if total is not None and rate > 0 else None
+                progress = ProgressEvent(done, total, match.group(3), rate, eta, now - started)
+                progress_pending = True
+                if progress_logged_at is None or now - progress_logged_at >= progress_log_seconds:
+                    emit_progress()
+                    progress_logged_at, progress_pending = now, False
+                continue
+
+            line_count += 1
+            tail.append(line)
+            if logged_bytes < max_log_bytes:
+                (log.info if stream_name == 'stdout' else log.warning)(line)
+                logged_bytes += len(line) + 1
+                if logged_bytes >= max_log_bytes:
+                    log.warning(f"Log limit of {max_log_bytes} bytes reached; further output is only counted "
+                                f"(its last {TAIL_LINES} lines are logged at exit).")
+            else:
+                suppressed += 1
+                suppressed_tail.append(line)
+
+        remaining = None if timeout is None else max(0.0, timeout - (time.monotonic() - started))
+        try:
+            returncode = process.wait(timeout=remaining)
+        except subprocess.TimeoutExpired:
+            raise subprocess.TimeoutExpired(command, timeout)
+    except BaseException:
+        if process.poll() is None:
+            log.warning(f"Stopping {command[0]} (pid {process.pid}).")
+        _terminate(process, not relay)
+        raise
+    finally:
+        # Unblock readers stuck on a full queue after a cancellation
+        for reader in readers:
+            while reader.is_alive():
+                try:
+                    while True:
+                        lines.get_nowait()
+                except queue.Empty:
+                    pass
+                reader.join(timeout=0.1)
+        process.stdout.close()
+        process.stderr.close()
+
+    if progress_pending:
+        emit_progress()
+    if suppressed:
+        log.warning(f"{suppressed} lines were not logged; the last {len(suppressed_tail)}:")
+        for line in suppressed_tail:
+            log.warning(line)
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, command, output="\n".join(tail))
+    return StreamResult(returncode, line_count, suppressed, progress, time.monotonic() - started)
@@ -0,0 +1,104 @@
+import os
+import json
+import hashlib
+from collections import deque
+
+# Default location of the product dictionary (canonical keyword -> synonyms/spellings)
+# Override with PRODUCT_DICTIONARY_PATH to point at a different dictionary file
+DEFAULT_DICTIONARY_PATH = os.path.join(os.path.dirname(__file__), 'product_dictionary.json')
+PRODUCT_DICTIONARY_PATH = os.getenv("PRODUCT_DICTIONARY_PATH", DEFAULT_DICTIONARY_PATH)
+
+
+def load_product_dictionary(path=None):
+    """
+    Loads the product dictionary from JSON.
+    The file maps each canonical product keyword to a list of terms (synonyms,
+    brand names, Amharic spellings) that count as a mention of that product.
+    The canonical keyword itself always counts as one of its terms.
+    """
+    path = path or PRODUCT_DICTIONARY_PATH
+    with open(path, 'r', encoding='utf-8') as f:
+        raw_dictionary = json.load(f)
+
+    dictionary = {}
+    for keyword, terms in raw_dictionary.items():
+        all_terms = {keyword.casefold()}
+        all_terms.update(term.casefold() for term in terms if term and term.strip())
+        # Drop terms that contain a shorter term of the same product ("antibiotics" vs "antibiotic"),
+        # otherwise a single word would be counted as two mentions
+        dictionary[keyword] = sorted(
+            term for term in all_terms
+            if not any(other != term and other in term for other in all_terms)
+        )
+    return dictionary
+
+
+def dictionary_fingerprint(dictionary):
+    """Returns a stable hash of the dictionary, used to detect when extraction must be redone."""
+    payload = json.dumps(dictionary, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()
+
+
+class ProductMatcher:
+    """
+    Aho-Corasick automaton over every term of the product dictionary.
+    Scans a message once, regardless of how many terms the dictionary holds,
+    and reports how often each canonical product keyword was mentioned.
+    Matching is case-insensitive substring matching, like the ILIKE '%term%' it replaces.
+    """
+
+    def __init__(self, dictionary):
+        self.dictionary = dictionary
+        # Trie stored as parallel lists indexed by node id; node 0 is the root
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [set()]
+
+        for keyword, terms in dictionary.items():
+            for term in terms:
+                self._add_term(term, keyword)
+        self._build_failure_links()
+
+    def _add_term(self, term, keyword):
+        node = 0
+        for char in term:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(set())
+            node = next_node
+        self._output[node].add(keyword)
+
+    def _build_failure_links(self):
+        # Breadth-first so that a node's failure target is always resolved before its children
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                # Inherit matches that end at the failure target (suffix terms)
+                self._output[child] |= self._output[self._fail[child]]
+
+    def count_mentions(self, text):
+        """Returns {canonical_keyword: number_of_term_occurrences} for a single message."""
+        counts = {}
+        if not text:
+            return counts
+
+        node = 0
+        goto, fail, output = self._goto, self._fail, self._output
+        for char in text.casefold():
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for keyword in output[node]:
+                counts[keyword] = counts.get(keyword, 0) + 1
+        return counts